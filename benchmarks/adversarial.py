@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#   Copyright 2017 Jim Martens
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""benchmarks.adversarial: checks that guarded rendering stays linear on pathological inputs
+
+Every construct generates texts of growing size that make the grammar backtrack heavily, e.g. long runs of unmatched
+*, [ or `, long paragraphs, quotes or lists that end in a line that doesn't match and fenced code blocks that are
+never closed. The texts are rendered in guarded mode and the growth of the render time is fitted to
+size ** exponent. An exponent above the limit fails the run.
+
+Run it from the root of the repository::
+
+   python benchmarks/adversarial.py
+   python benchmarks/adversarial.py --engines scanner --size 64 --steps 5
+"""
+import argparse
+import math
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from twomartens.markdown.renderer import Renderer
+
+CONSTRUCTS = ["stars", "brackets", "backticks", "angles", "emphasis", "paragraph", "quote", "list", "fence", "fuzz"]
+ENGINES = ["grammar", "scanner"]
+ATOMS = ["*", "**", "[", "]", "](", ")", "`", "<", ">", "a", " ", "](x", ' "', "x "]
+
+
+def main():
+    """Renders the constructs at growing sizes, prints the exponents and fails if one exceeds the limit."""
+    parser = argparse.ArgumentParser(description="Checks that guarded rendering stays linear on pathological inputs.")
+    parser.add_argument("-c", "--constructs", nargs="+", default=CONSTRUCTS, choices=CONSTRUCTS,
+                        help="The pathological constructs.")
+    parser.add_argument("-e", "--engines", nargs="+", default=ENGINES, choices=ENGINES,
+                        help="The parser engines.")
+    parser.add_argument("--size", type=int, default=16, help="The size of the smallest text in KiB.")
+    parser.add_argument("--steps", type=int, default=3, help="How often the size is doubled.")
+    parser.add_argument("--repeat", type=int, default=3, help="How often every text is rendered (the best counts).")
+    parser.add_argument("--budget", type=float, default=4.0, help="The grammar steps per character.")
+    parser.add_argument("--limit", type=float, default=1.3, help="The highest exponent that counts as linear.")
+    parser.add_argument("--seed", type=int, default=0, help="The seed for the fuzz construct.")
+    args = parser.parse_args()
+
+    failures = []
+    for engine in args.engines:
+        renderer = Renderer("html", engine, budget=args.budget)
+        for construct in args.constructs:
+            sizes = []
+            seconds = []
+            for step in range(args.steps + 1):
+                text = generate(construct, args.size * 1024 * 2 ** step, args.seed)
+                sizes.append(len(text))
+                seconds.append(measure(renderer, text, args.repeat))
+            exponent = fit_exponent(sizes, seconds)
+            failed = exponent > args.limit
+            print("{:<10} {:<10} {:>8.3f} ms at {:>7} chars {:>9.3f} ms at {:>7} chars exponent {:.2f}{}".format(
+                engine, construct, seconds[0] * 1000, sizes[0], seconds[-1] * 1000, sizes[-1], exponent,
+                "  SUPERLINEAR" if failed else ""))
+            if failed:
+                failures.append((engine, construct, exponent))
+    if failures:
+        sys.exit(1)
+
+
+def generate(construct: str, size: int, seed: int) -> str:
+    """Generates a text of the given construct with about the given size.
+
+    :param str construct: the construct
+    :param int size: the approximate size in characters
+    :param int seed: the seed for the fuzz construct
+    """
+    rng = random.Random(seed)
+    parts = ["# Adversarial\n\n"]
+    length = len(parts[0])
+    while length < size:
+        part = globals().get("_generate_" + construct)(rng)
+        parts.append(part)
+        length += len(part)
+    parts.append(_TAILS.get(construct, ""))
+    return "".join(parts)
+
+
+def measure(renderer: Renderer, text: str, repeat: int) -> float:
+    """Renders the text repeatedly and returns the seconds of the fastest render.
+
+    :param Renderer renderer: the guarded renderer
+    :param str text: the text
+    :param int repeat: how often the text is rendered
+    """
+    best = None
+    for _round in range(repeat):
+        start = time.perf_counter()
+        renderer.render(text)
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return best
+
+
+def fit_exponent(sizes: list, seconds: list) -> float:
+    """Returns the exponent of the least squares fit of seconds = c * size ** exponent.
+
+    :param list sizes: the sizes
+    :param list seconds: the seconds for each size
+    """
+    xs = [math.log(size) for size in sizes]
+    ys = [math.log(max(value, 1e-9)) for value in seconds]
+    mean_x = sum(xs) / len(xs)
+    mean_y = sum(ys) / len(ys)
+    variance = sum((x - mean_x) ** 2 for x in xs)
+    return sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / variance
+
+
+def _generate_stars(rng: random.Random) -> str:
+    """Generates a line with a long run of unmatched *."""
+    return "a " + "*b " * 64 + "\n"
+
+
+def _generate_brackets(rng: random.Random) -> str:
+    """Generates a line with a long run of unmatched [ and unclosed links."""
+    return "a " + "[b](c " * 32 + "[b " * 32 + "\n\n"
+
+
+def _generate_backticks(rng: random.Random) -> str:
+    """Generates a line with a long run of unmatched `."""
+    return "a " + "`b " * 65 + "\n"
+
+
+def _generate_angles(rng: random.Random) -> str:
+    """Generates a line with a long run of < that never close an automatic link."""
+    return "x " + "](<)" * 64 + "\n"
+
+
+def _generate_emphasis(rng: random.Random) -> str:
+    """Generates a paragraph of emphasis with a * left over at its end."""
+    return "a " + "*b* c **d** " * 16 + "*\n\n"
+
+
+def _generate_paragraph(rng: random.Random) -> str:
+    """Generates a line of a long paragraph that ends in a line that doesn't match (see _TAILS)."""
+    return "a **b** c\n"
+
+
+def _generate_quote(rng: random.Random) -> str:
+    """Generates a line of a long quote that ends in a line that doesn't match (see _TAILS)."""
+    return ">a *b* c\n"
+
+
+def _generate_list(rng: random.Random) -> str:
+    """Generates an item of a long list that ends in an item that doesn't match (see _TAILS)."""
+    return "* a `b` c\n"
+
+
+def _generate_fence(rng: random.Random) -> str:
+    """Generates the opening fence of a fenced code block that is never closed and a line of code."""
+    return "```x\na *b\n"
+
+
+def _generate_fuzz(rng: random.Random) -> str:
+    """Generates a random line of delimiters, words and spaces."""
+    return "".join(rng.choice(ATOMS) for _ in range(rng.randint(1, 80))) + rng.choice(["\n", "\n\n"])
+
+
+_TAILS = {"paragraph": "*\n", "quote": ">*\n", "list": "* *\n"}
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#   Copyright 2017 Jim Martens
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+"""benchmarks.batch: provides a benchmark of rendering many small documents
+
+Workloads like comments consist of many documents of one or two lines, whose render takes little more than the setup
+of the parse and the transform. Every mode renders the same generated corpus and reports the documents per second:
+a loop over parser.parse and transform.transform, a loop over Renderer.render and Renderer.render_batch with and
+without deduplication. The results can be saved as JSON and compared with an earlier run like the results of
+benchmark.py.
+
+Run it from the root of the repository::
+
+   python benchmarks/batch.py --output batch.json
+   python benchmarks/batch.py --compare batch.json --threshold 0.1
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmark import sentence
+from twomartens.markdown.parser import parse
+from twomartens.markdown.renderer import Renderer
+from twomartens.markdown.transform import transform
+
+MODES = ["loop", "render", "batch", "deduplicate"]
+ENGINES = ["grammar", "scanner"]
+
+
+def main():
+    """Runs the benchmark, prints the results and compares them with a baseline if one is given."""
+    parser = argparse.ArgumentParser(description="Benchmarks the rendering of many small documents.")
+    parser.add_argument("-m", "--modes", nargs="+", default=MODES, choices=MODES, help="The modes.")
+    parser.add_argument("-e", "--engines", nargs="+", default=ENGINES, choices=ENGINES,
+                        help="The parser engines.")
+    parser.add_argument("--documents", type=int, default=1000, help="The number of documents.")
+    parser.add_argument("--duplicates", type=float, default=0.2,
+                        help="The share of documents that repeat an earlier document.")
+    parser.add_argument("--repeat", type=int, default=3, help="How often the corpus is rendered.")
+    parser.add_argument("--seed", type=int, default=0, help="The seed for the generated corpus.")
+    parser.add_argument("-o", "--output", metavar="path", help="Saves the results as JSON in this file.")
+    parser.add_argument("-c", "--compare", metavar="path", help="Compares the results with this JSON file.")
+    parser.add_argument("-t", "--threshold", type=float, default=0.1,
+                        help="The relative loss of documents per second that counts as regression.")
+    args = parser.parse_args()
+
+    results = {
+        "meta": {"python": platform.python_version(), "platform": platform.platform(), "date": time.time(),
+                 "documents": args.documents, "duplicates": args.duplicates, "repeat": args.repeat,
+                 "seed": args.seed},
+        "results": {},
+    }
+    corpus = generate_corpus(args.documents, args.duplicates, args.seed)
+    for engine in args.engines:
+        for mode in args.modes:
+            result = run(corpus, engine, mode, args.repeat)
+            results["results"][engine + "/" + mode] = result
+            print("{:<20} {:>10.1f} docs/s best {:>10.1f} docs/s".format(engine + "/" + mode, result["docs_per_s"],
+                                                                         result["best_docs_per_s"]))
+
+    if args.output is not None:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2, sort_keys=True)
+    if args.compare is not None:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        if compare(baseline, results, args.threshold):
+            sys.exit(1)
+
+
+def generate_corpus(documents: int, duplicates: float, seed: int) -> list:
+    """Generates documents of one or two lines and returns them.
+
+    :param int documents: the number of documents
+    :param float duplicates: the share of documents that repeat an earlier document
+    :param int seed: the seed for the random generator
+    """
+    rng = random.Random(seed)
+    corpus = []
+    for _index in range(documents):
+        if corpus and rng.random() < duplicates:
+            corpus.append(rng.choice(corpus))
+            continue
+        lines = [sentence(rng, rng.randint(0, 2)) for _ in range(rng.randint(1, 2))]
+        corpus.append("\n".join(lines) + "\n")
+    return corpus
+
+
+def run(corpus: list, engine: str, mode: str, repeat: int) -> map:
+    """Renders the corpus in the given mode and returns the documents per second.
+
+    :param list corpus: the documents
+    :param str engine: the parser engine (grammar or scanner)
+    :param str mode: the mode
+    :param int repeat: how often the corpus is rendered
+    """
+    render = globals().get("_render_" + mode)
+    samples = []
+    for _round in range(repeat):
+        start = time.perf_counter()
+        render(corpus, engine)
+        samples.append(time.perf_counter() - start)
+    return {
+        "docs_per_s": len(corpus) * repeat / sum(samples),
+        "best_docs_per_s": len(corpus) / min(samples),
+    }
+
+
+def compare(baseline: map, results: map, threshold: float) -> list:
+    """Compares the documents per second with the baseline, prints the comparison and returns the regressions.
+
+    :param map baseline: the results of an earlier run
+    :param map results: the results of this run
+    :param float threshold: the relative loss that counts as regression
+    """
+    regressions = []
+    for name, result in sorted(results["results"].items()):
+        if name not in baseline["results"]:
+            continue
+        before = baseline["results"][name]["docs_per_s"]
+        after = result["docs_per_s"]
+        change = after / before - 1
+        regression = change < -threshold
+        print("{:<20} {:>10.1f} docs/s -> {:>10.1f} docs/s {:>+8.1%}{}".format(
+            name, before, after, change, "  REGRESSION" if regression else ""))
+        if regression:
+            regressions.append((name, change))
+    return regressions
+
+
+def _render_loop(corpus: list, engine: str):
+    """Renders every document with parser.parse and transform.transform.
+
+    :param list corpus: the documents
+    :param str engine: the parser engine
+    """
+    for text in corpus:
+        transform(parse(text, engine), "html")
+
+
+def _render_render(corpus: list, engine: str):
+    """Renders every document with one renderer.
+
+    :param list corpus: the documents
+    :param str engine: the parser engine
+    """
+    renderer = Renderer("html", engine)
+    for text in corpus:
+        renderer.render(text)
+
+
+def _render_batch(corpus: list, engine: str):
+    """Renders the documents in one batch.
+
+    :param list corpus: the documents
+    :param str engine: the parser engine
+    """
+    Renderer("html", engine).render_batch(corpus)
+
+
+def _render_deduplicate(corpus: list, engine: str):
+    """Renders the documents in one batch that renders identical documents once.
+
+    :param list corpus: the documents
+    :param str engine: the parser engine
+    """
+    Renderer("html", engine).render_batch(corpus, deduplicate=True)
+
+
+if __name__ == '__main__':
+    main()
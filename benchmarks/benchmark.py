@@ -0,0 +1,305 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#   Copyright 2017 Jim Martens
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""benchmarks.benchmark: provides a benchmark of the parser engines and the transform on generated corpora
+
+Every corpus consists of generated documents of one shape. The parse, the conversion of the grammar result into the
+document tree and the transform are timed separately. The results can be saved as JSON and compared with the results
+of an earlier run, in which case a slowdown beyond the threshold fails the run.
+
+Run it from the root of the repository::
+
+   python benchmarks/benchmark.py --output results.json
+   python benchmarks/benchmark.py --compare results.json --threshold 0.1
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from twomartens.markdown.grammars import MarkdownGrammar
+from twomartens.markdown.nodes import from_grammar
+from twomartens.markdown.scanner import scan
+from twomartens.markdown.transform import load_template, transform
+
+SHAPES = ["headings", "paragraphs", "inline", "code", "quotes", "lists", "mixed"]
+ENGINES = ["grammar", "scanner"]
+STAGES = ["parse", "convert", "transform", "total"]
+WORDS = ["lorem", "ipsum", "dolor", "sit", "amet", "consectetur", "adipiscing", "elit", "sed", "do", "eiusmod",
+         "tempor", "incididunt", "ut", "labore", "et", "dolore", "magna", "aliqua"]
+
+
+def main():
+    """Runs the benchmark, prints the results and compares them with a baseline if one is given."""
+    parser = argparse.ArgumentParser(description="Benchmarks the markdown parser on generated corpora.")
+    parser.add_argument("-s", "--shapes", nargs="+", default=SHAPES, choices=SHAPES,
+                        help="The shapes of the generated corpora.")
+    parser.add_argument("-e", "--engines", nargs="+", default=ENGINES, choices=ENGINES,
+                        help="The parser engines.")
+    parser.add_argument("--size", type=int, default=16, help="The size of every document in KiB.")
+    parser.add_argument("--documents", type=int, default=3, help="The number of documents per corpus.")
+    parser.add_argument("--repeat", type=int, default=3, help="How often every document is rendered.")
+    parser.add_argument("--seed", type=int, default=0, help="The seed for the generated corpora.")
+    parser.add_argument("-o", "--output", metavar="path", help="Saves the results as JSON in this file.")
+    parser.add_argument("-c", "--compare", metavar="path", help="Compares the results with this JSON file.")
+    parser.add_argument("-t", "--threshold", type=float, default=0.1,
+                        help="The relative slowdown of the median latency that counts as regression.")
+    args = parser.parse_args()
+
+    results = {
+        "meta": {"python": platform.python_version(), "platform": platform.platform(), "date": time.time(),
+                 "size": args.size, "documents": args.documents, "repeat": args.repeat, "seed": args.seed},
+        "results": {},
+    }
+    template = load_template("html")
+    for shape in args.shapes:
+        corpus = generate_corpus(shape, args.size * 1024, args.documents, args.seed)
+        for engine in args.engines:
+            result = run(corpus, engine, template, args.repeat)
+            results["results"][engine + "/" + shape] = result
+            print(_format_result(engine + "/" + shape, result))
+
+    if args.output is not None:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2, sort_keys=True)
+    if args.compare is not None:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        regressions = compare(baseline, results, args.threshold)
+        if regressions:
+            sys.exit(1)
+
+
+def generate_corpus(shape: str, size: int, documents: int, seed: int) -> list:
+    """Generates documents of the given shape and returns them.
+
+    :param str shape: the shape of the documents
+    :param int size: the approximate size of every document in characters
+    :param int documents: the number of documents
+    :param int seed: the seed for the random generator
+    """
+    rng = random.Random(seed)
+    corpus = []
+    for index in range(documents):
+        parts = ["# Document " + str(index) + "\n"]
+        length = len(parts[0])
+        while length < size:
+            block = globals().get("_generate_" + (rng.choice(SHAPES[:-1]) if shape == "mixed" else shape))(rng)
+            parts.append(block)
+            length += len(block)
+        corpus.append("".join(parts))
+    return corpus
+
+
+def sentence(rng: random.Random, inline: int = 0) -> str:
+    """Generates a line of words with the given number of inline elements between them.
+
+    Inline elements are always surrounded by words, because the grammar needs text between them.
+
+    :param random.Random rng: the random generator
+    :param int inline: the number of inline elements
+    """
+    parts = [" ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 8)))]
+    for _ in range(inline):
+        word = rng.choice(WORDS)
+        parts.append(rng.choice(["**" + word + "**", "*" + word + "*", "`<" + word + ">`",
+                                 "[" + word + "](https://example.com/" + word + ")",
+                                 "[" + word + '](https://example.com/' + word + ' "' + word + '")',
+                                 "<https://example.com/" + word + ">"]))
+        parts.append(" ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 4))))
+    return " ".join(parts)
+
+
+def run(corpus: list, engine: str, template, repeat: int) -> map:
+    """Renders the corpus with the given engine and returns the statistics of every stage.
+
+    :param list corpus: the documents
+    :param str engine: the parser engine (grammar or scanner)
+    :param Template template: the HTML skeleton
+    :param int repeat: how often every document is rendered
+    """
+    parser = MarkdownGrammar.parser()
+    samples = {stage: [] for stage in STAGES}
+    for _round in range(repeat):
+        for text in corpus:
+            timings = _render(text, engine, parser, template)
+            for stage, seconds in zip(STAGES, timings):
+                samples[stage].append(seconds)
+            samples["total"].append(sum(timings))
+
+    size = sum(len(text.encode("utf-8")) for text in corpus) * repeat
+    result = {stage: _statistics(samples[stage], size) for stage in STAGES}
+
+    # tracemalloc slows the code down, so the memory is measured in a separate run
+    tracemalloc.start()
+    for text in corpus:
+        _render(text, engine, parser, template)
+    result["peak_memory_kib"] = tracemalloc.get_traced_memory()[1] // 1024
+    tracemalloc.stop()
+    return result
+
+
+def compare(baseline: map, results: map, threshold: float) -> list:
+    """Compares the median latencies with the baseline, prints the comparison and returns the regressions.
+
+    Only the total latency of a corpus counts as regression, the stages are printed to find its cause.
+
+    :param map baseline: the results of an earlier run
+    :param map results: the results of this run
+    :param float threshold: the relative slowdown that counts as regression
+    """
+    regressions = []
+    for name, result in sorted(results["results"].items()):
+        if name not in baseline["results"]:
+            continue
+        for stage in STAGES:
+            before = baseline["results"][name][stage]["p50_ms"]
+            after = result[stage]["p50_ms"]
+            if before == 0:
+                continue
+            change = after / before - 1
+            regression = stage == "total" and change > threshold
+            print("{:<20} {:<10} {:>10.3f} ms -> {:>10.3f} ms {:>+8.1%}{}".format(
+                name, stage, before, after, change, "  REGRESSION" if regression else ""))
+            if regression:
+                regressions.append((name, stage, change))
+    return regressions
+
+
+def _render(text: str, engine: str, parser, template) -> tuple:
+    """Renders the text and returns the seconds needed for the parse, the conversion and the transform.
+
+    :param str text: the input text
+    :param str engine: the parser engine (grammar or scanner)
+    :param parser: the grammar parser
+    :param Template template: the HTML skeleton
+    """
+    start = time.perf_counter()
+    if engine == "grammar":
+        result = parser.parse_string(text)
+        parsed = time.perf_counter()
+        document = from_grammar(result)
+        parser.reset()
+    else:
+        document = scan(text)
+        parsed = time.perf_counter()
+    # the scanner builds the document tree directly
+    converted = time.perf_counter() if engine == "grammar" else parsed
+    transform(document, "html", template)
+    transformed = time.perf_counter()
+    return parsed - start, converted - parsed, transformed - converted
+
+
+def _statistics(samples: list, size: int) -> map:
+    """Returns the throughput and the latency percentiles for the given samples.
+
+    :param list samples: the seconds needed for every document
+    :param int size: the number of bytes of all documents
+    """
+    ordered = sorted(samples)
+    seconds = sum(samples)
+    return {
+        "mb_per_s": size / seconds / 1e6 if seconds else 0.0,
+        "docs_per_s": len(samples) / seconds if seconds else 0.0,
+        "p50_ms": _percentile(ordered, 0.5) * 1000,
+        "p99_ms": _percentile(ordered, 0.99) * 1000,
+    }
+
+
+def _percentile(ordered: list, fraction: float) -> float:
+    """Returns the value at the given fraction of the sorted samples (nearest rank).
+
+    :param list ordered: the sorted samples
+    :param float fraction: the fraction between 0 and 1
+    """
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def _format_result(name: str, result: map) -> str:
+    """Formats the result of one corpus as a line of text.
+
+    :param str name: the name of the corpus
+    :param map result: the result
+    """
+    total = result["total"]
+    stages = " ".join("{} {:.3f}".format(stage, result[stage]["p50_ms"]) for stage in STAGES[:-1])
+    return "{:<20} {:>8.3f} MB/s {:>8.1f} docs/s p50 {:>9.3f} ms p99 {:>9.3f} ms ({}) peak {} KiB".format(
+        name, total["mb_per_s"], total["docs_per_s"], total["p50_ms"], total["p99_ms"], stages,
+        result["peak_memory_kib"])
+
+
+def _generate_headings(rng: random.Random) -> str:
+    """Generates a heading followed by a short paragraph.
+
+    :param random.Random rng: the random generator
+    """
+    return "\n" + "#" * rng.randint(1, 6) + " " + sentence(rng) + "\n\n" + sentence(rng, 1) + "\n"
+
+
+def _generate_paragraphs(rng: random.Random) -> str:
+    """Generates a long paragraph with few inline elements.
+
+    :param random.Random rng: the random generator
+    """
+    return "\n" + "".join(sentence(rng, rng.randint(0, 1)) + "\n" for _ in range(rng.randint(10, 30)))
+
+
+def _generate_inline(rng: random.Random) -> str:
+    """Generates a paragraph with many emphasized words, code segments and links.
+
+    :param random.Random rng: the random generator
+    """
+    return "\n" + "".join(sentence(rng, rng.randint(4, 10)) + "\n" for _ in range(rng.randint(3, 8)))
+
+
+def _generate_code(rng: random.Random) -> str:
+    """Generates a big code block.
+
+    :param random.Random rng: the random generator
+    """
+    lines = ("    " * rng.randint(1, 3) + "<" + rng.choice(WORDS) + ">" + sentence(rng) + "\n"
+             for _ in range(rng.randint(20, 60)))
+    return "\n" + "".join(lines) + "\n"
+
+
+def _generate_quotes(rng: random.Random) -> str:
+    """Generates a long quote.
+
+    :param random.Random rng: the random generator
+    """
+    return "\n" + "".join("> " + sentence(rng, rng.randint(0, 2)) + "\n" for _ in range(rng.randint(10, 30)))
+
+
+def _generate_lists(rng: random.Random) -> str:
+    """Generates a long unordered or ordered list.
+
+    :param random.Random rng: the random generator
+    """
+    ordered = rng.random() < 0.5
+    items = ((str(index + 1) + ". " if ordered else rng.choice("*-+") + " ") + sentence(rng, rng.randint(0, 2))
+             for index in range(rng.randint(10, 40)))
+    return "\n" + "".join(item + "\n" for item in items)
+
+
+if __name__ == '__main__':
+    main()
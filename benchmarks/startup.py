@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+#   Copyright 2017 Jim Martens
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""benchmarks.startup: provides a benchmark of the startup of the program
+
+Short invocations (e.g. in a pre-commit hook) spend most of their time starting the program. Every scenario runs the
+program in a new process and takes the median wall time. One more run with -X importtime measures the imports and
+tells whether and in what time the grammar classes were built. Scenarios that don't parse with the grammar (--help,
+errors in the arguments, cache hits and the scanner engine) fail the run if they build the grammar. The results can
+be saved as JSON and compared with an earlier run like the results of benchmark.py.
+
+Run it from the root of the repository::
+
+   python benchmarks/startup.py --output startup.json
+   python benchmarks/startup.py --compare startup.json --threshold 0.2
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RUNNER = os.path.join(ROOT, "markdown-runner.py")
+SCENARIOS = ["help", "error", "cache", "scanner", "grammar"]
+GRAMMARS_MODULE = "twomartens.markdown.grammars"
+TEXT = "# Title\n\nSome **bold** and *italic* text with `code` and a [link](https://example.com).\n"
+
+
+def main():
+    """Runs the scenarios, prints the results and compares them with a baseline if one is given."""
+    parser = argparse.ArgumentParser(description="Benchmarks the startup of the program.")
+    parser.add_argument("-s", "--scenarios", nargs="+", default=SCENARIOS, choices=SCENARIOS,
+                        help="The scenarios.")
+    parser.add_argument("--repeat", type=int, default=10, help="How often every scenario is run.")
+    parser.add_argument("-o", "--output", metavar="path", help="Saves the results as JSON in this file.")
+    parser.add_argument("-c", "--compare", metavar="path", help="Compares the results with this JSON file.")
+    parser.add_argument("-t", "--threshold", type=float, default=0.2,
+                        help="The relative slowdown of the median wall time that counts as regression.")
+    args = parser.parse_args()
+
+    results = {
+        "meta": {"python": platform.python_version(), "platform": platform.platform(), "date": time.time(),
+                 "repeat": args.repeat},
+        "results": {},
+    }
+    directory = tempfile.mkdtemp()
+    failed = False
+    try:
+        source = os.path.join(directory, "input.md")
+        with open(source, "w", encoding="utf-8") as file:
+            file.write(TEXT)
+        for scenario in args.scenarios:
+            arguments = globals().get("_arguments_" + scenario)(source, directory)
+            result = run(arguments, args.repeat)
+            results["results"][scenario] = result
+            unexpected = result["grammars"] and scenario != "grammar"
+            failed = failed or unexpected
+            print("{:<10} p50 {:>9.3f} ms min {:>9.3f} ms imports {:>9.3f} ms grammar {}{}".format(
+                scenario, result["p50_ms"], result["min_ms"], result["imports_ms"],
+                "built in {:.3f} ms".format(result["grammars_ms"]) if result["grammars"] else "not built",
+                "  UNEXPECTED" if unexpected else ""))
+    finally:
+        shutil.rmtree(directory)
+
+    if args.output is not None:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2, sort_keys=True)
+    if args.compare is not None:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        failed = bool(compare(baseline, results, args.threshold)) or failed
+    if failed:
+        sys.exit(1)
+
+
+def run(arguments: list, repeat: int) -> map:
+    """Runs the program with the given arguments and returns the wall times and the import statistics.
+
+    :param list arguments: the arguments of the program
+    :param int repeat: how often the program is run
+    """
+    command = [sys.executable, RUNNER] + arguments
+    samples = []
+    for _round in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        samples.append(time.perf_counter() - start)
+
+    process = subprocess.run([sys.executable, "-X", "importtime"] + command[1:], stdout=subprocess.DEVNULL,
+                             stderr=subprocess.PIPE, universal_newlines=True)
+    imports, grammars = _import_statistics(process.stderr)
+    ordered = sorted(samples)
+    return {
+        "p50_ms": ordered[len(ordered) // 2] * 1000,
+        "min_ms": ordered[0] * 1000,
+        "imports_ms": imports * 1000,
+        "grammars": grammars is not None,
+        "grammars_ms": grammars * 1000 if grammars is not None else 0.0,
+    }
+
+
+def compare(baseline: map, results: map, threshold: float) -> list:
+    """Compares the median wall times with the baseline, prints the comparison and returns the regressions.
+
+    :param map baseline: the results of an earlier run
+    :param map results: the results of this run
+    :param float threshold: the relative slowdown that counts as regression
+    """
+    regressions = []
+    for name, result in sorted(results["results"].items()):
+        if name not in baseline["results"]:
+            continue
+        before = baseline["results"][name]["p50_ms"]
+        after = result["p50_ms"]
+        change = after / before - 1
+        regression = change > threshold
+        print("{:<10} {:>10.3f} ms -> {:>10.3f} ms {:>+8.1%}{}".format(
+            name, before, after, change, "  REGRESSION" if regression else ""))
+        if regression:
+            regressions.append((name, change))
+    return regressions
+
+
+def _import_statistics(report: str) -> tuple:
+    """Returns the seconds of all imports and of the import of the grammars module (None if it wasn't imported).
+
+    :param str report: the output of -X importtime
+    """
+    seconds = 0.0
+    grammars = None
+    for line in report.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _self, cumulative, name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit():
+            # the header of the report
+            continue
+        # only the top-level imports count, the cumulative time contains the nested ones
+        if not name.startswith("  "):
+            seconds += int(cumulative) / 1e6
+        if name.strip() == GRAMMARS_MODULE:
+            grammars = int(cumulative) / 1e6
+    return seconds, grammars
+
+
+def _arguments_help(source: str, directory: str) -> list:
+    """Returns the arguments that print the help.
+
+    :param str source: the path of the input file
+    :param str directory: the temporary directory
+    """
+    return ["--help"]
+
+
+def _arguments_error(source: str, directory: str) -> list:
+    """Returns arguments that are rejected.
+
+    :param str source: the path of the input file
+    :param str directory: the temporary directory
+    """
+    return ["--engine", "unknown", source, "-"]
+
+
+def _arguments_cache(source: str, directory: str) -> list:
+    """Returns the arguments of a cache hit and fills the cache.
+
+    :param str source: the path of the input file
+    :param str directory: the temporary directory
+    """
+    arguments = ["--cache", os.path.join(directory, "cache"), source, os.path.join(directory, "cache.html")]
+    subprocess.run([sys.executable, RUNNER] + arguments, stdout=subprocess.DEVNULL, check=True)
+    return arguments
+
+
+def _arguments_scanner(source: str, directory: str) -> list:
+    """Returns the arguments of a render with the scanner engine.
+
+    :param str source: the path of the input file
+    :param str directory: the temporary directory
+    """
+    return ["--engine", "scanner", source, os.path.join(directory, "scanner.html")]
+
+
+def _arguments_grammar(source: str, directory: str) -> list:
+    """Returns the arguments of a render with the grammar engine.
+
+    :param str source: the path of the input file
+    :param str directory: the temporary directory
+    """
+    return ["--engine", "grammar", source, os.path.join(directory, "grammar.html")]
+
+
+if __name__ == "__main__":
+    main()
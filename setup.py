@@ -38,7 +38,8 @@ setup(
     namespace_packages=["twomartens"],
     packages=["twomartens.markdown"],
     entry_points={
-        "console_scripts": ['tm-parse-markdown = twomartens.markdown.markdown:main']
+        "console_scripts": ['tm-parse-markdown = twomartens.markdown.markdown:main',
+                            'tm-markdown-server = twomartens.markdown.server:main']
     },
     package_data={"twomartens.markdown": ["templates/skeleton.*"]},
     python_requires="~=3.5",
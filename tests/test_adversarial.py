@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+
+#   Copyright 2017 Jim Martens
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""tests.test_adversarial: tests that guarded rendering stays linear on the pathological inputs of the benchmark
+
+The texts grow eightfold, so a linear render takes about 8 times as long and a quadratic one about 64 times. The
+sizes are large enough that the constant costs of a render don't hide the growth.
+"""
+import pytest
+
+import adversarial
+from twomartens.markdown.renderer import Renderer
+
+SIZES = [16 * 1024, 128 * 1024]
+LIMIT = 1.5
+
+
+@pytest.mark.parametrize("engine", adversarial.ENGINES)
+@pytest.mark.parametrize("construct", adversarial.CONSTRUCTS)
+def test_guarded_render_is_linear(engine, construct):
+    renderer = Renderer("html", engine, budget=4.0)
+    sizes = []
+    seconds = []
+    for size in SIZES:
+        text = adversarial.generate(construct, size, 0)
+        sizes.append(len(text))
+        seconds.append(adversarial.measure(renderer, text, 3))
+    assert adversarial.fit_exponent(sizes, seconds) < LIMIT
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+
+#   Copyright 2017 Jim Martens
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+
+"""tests.test_batch: tests the rendering of many files"""
+import io
+import os
+
+from twomartens.markdown import batch
+
+
+def test_inputs_are_read_in_the_given_encoding_and_written_in_utf8(tmp_path):
+    source = tmp_path / "in" / "a.md"
+    source.parent.mkdir()
+    source.write_bytes("# Café\n\nnaïve\n".encode("latin-1"))
+    files = batch.collect([str(source.parent)], str(tmp_path / "out"), "text")
+    out = io.StringIO()
+    assert batch.run(files, "text", "scanner", jobs=1, out=out, encoding="latin-1") == 0
+    assert (tmp_path / "out" / "a.txt").read_bytes().decode("utf-8").startswith("Café")
+
+
+def test_undecodable_input_fails_the_file(tmp_path):
+    source = tmp_path / "in" / "a.md"
+    source.parent.mkdir()
+    source.write_bytes("# Café\n".encode("latin-1"))
+    files = batch.collect([str(source.parent)], str(tmp_path / "out"), "text")
+    out = io.StringIO()
+    assert batch.run(files, "text", "scanner", jobs=1, out=out) == 1
+    assert "UnicodeDecodeError" in out.getvalue()
+
+
+def test_failed_write_leaves_the_old_output(tmp_path, monkeypatch):
+    source = tmp_path / "in" / "a.md"
+    source.parent.mkdir()
+    source.write_text("# New\n")
+    target = tmp_path / "out" / "a.txt"
+    target.parent.mkdir()
+    target.write_text("old")
+    # the source is newer than the old output
+    os.utime(str(target), (0, 0))
+
+    def fail(_source, _target):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(batch.os, "replace", fail)
+    files = batch.collect([str(source.parent)], str(tmp_path / "out"), "text")
+    out = io.StringIO()
+    assert batch.run(files, "text", "scanner", jobs=1, out=out) == 1
+    assert target.read_text() == "old"
+    assert os.listdir(str(target.parent)) == ["a.txt"]
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+
+#   Copyright 2017 Jim Martens
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+
+"""tests.test_cache: tests the render cache with its persistent stores and the block cache"""
+import sqlite3
+
+import pytest
+
+from twomartens.markdown import cache
+from twomartens.markdown.cache import BlockCache, RenderCache, open_store
+from twomartens.markdown.renderer import Renderer
+
+
+def test_keys_contain_the_version(monkeypatch):
+    key = RenderCache.key("text", "html")
+    monkeypatch.setattr(cache, "__version__", "0.0.0")
+    assert RenderCache.key("text", "html") != key
+
+
+@pytest.mark.parametrize("name", ["store", "store.sqlite"])
+def test_store_evicts_the_least_recently_used_entries(tmp_path, name):
+    store = open_store(str(tmp_path / name), max_bytes=1000)
+    keys = [RenderCache.key(str(number), "html") for number in range(10)]
+    for number, key in enumerate(keys):
+        store.put(key, bytes(100))
+        if number < 9:
+            # uses the first entry after every put, so it is never the least recently used one
+            assert store.get(keys[0]) is not None
+    store.put(RenderCache.key("last", "html"), bytes(100))
+    assert store.get(keys[0]) is not None
+    assert store.get(keys[1]) is None
+    assert store.get(RenderCache.key("last", "html")) is not None
+    present = sum(store.get(key) is not None for key in keys)
+    assert 100 * (present + 1) <= 1000
+
+
+@pytest.mark.parametrize("name", ["store", "store.sqlite"])
+def test_store_counts_a_replaced_entry_once(tmp_path, monkeypatch, name):
+    store = open_store(str(tmp_path / name), max_bytes=1000)
+    key = RenderCache.key("text", "html")
+    store.put(key, bytes(100))
+    scans = []
+    evict = store._evict
+    monkeypatch.setattr(store, "_evict", lambda: scans.append(1) or evict())
+    for size in range(101, 151):
+        store.put(key, bytes(size))
+    assert store._bytes == 150
+    assert not scans
+    assert store.get(key) == bytes(150)
+
+
+def test_sqlite_store_opens_a_database_without_the_used_column(tmp_path):
+    path = str(tmp_path / "old.sqlite")
+    connection = sqlite3.connect(path)
+    with connection:
+        connection.execute("CREATE TABLE renders (key TEXT PRIMARY KEY, output BLOB NOT NULL)")
+        connection.execute("INSERT INTO renders VALUES (?, ?)", ("a" * 64, b"old"))
+    connection.close()
+    store = open_store(path, max_bytes=1000)
+    assert store.get("a" * 64) == b"old"
+    store.put("b" * 64, b"new")
+    assert store.get("b" * 64) == b"new"
+    store.close()
+
+
+@pytest.mark.parametrize("anchors", [False, True])
+@pytest.mark.parametrize("engine", ["grammar", "scanner"])
+def test_warm_block_cache_renders_edits_like_a_cold_render(engine, anchors):
+    text = "# Title\n\nfirst *paragraph*\n\n# Title\n\n* item\n* item\n\nlast paragraph\n"
+    renderer = Renderer("html", engine, block_cache=BlockCache(), anchors=anchors)
+    renderer.render(text)
+    for edited in [text.replace("first", "edited"), "# Other\n\n" + text, text.replace("last", "# Title\n\nlast")]:
+        assert renderer.render(edited) == Renderer("html", engine, anchors=anchors).render(edited)
+    assert renderer.block_cache.stats()["hits"] > 0
+
+
+def test_title_is_taken_from_a_cached_heading():
+    renderer = Renderer("html", "scanner", block_cache=BlockCache())
+    renderer.render("# Cached\n\ntext\n")
+    output = renderer.render("# Cached\n\nother text\n")
+    assert "<title>Cached</title>" in output
+    assert renderer.block_cache.stats()["hits"] == 1
+
+
+def test_block_cache_evicts_the_least_recently_used_entries_by_utf8_bytes():
+    cache = BlockCache(max_bytes=10)
+    cache.put("a", "aaaa")
+    cache.put("b", "bb", "é")
+    assert cache.stats()["bytes"] == 8
+    assert cache.get("a") == ("aaaa", None)
+    cache.put("c", "cccc")
+    assert cache.get("b") is None
+    assert cache.get("a") is not None and cache.get("c") is not None
+    stats = cache.stats()
+    assert (stats["evictions"], stats["entries"], stats["bytes"]) == (1, 2, 8)
+
+
+def test_block_cache_counts_the_hit_rate():
+    cache = BlockCache()
+    assert cache.stats()["hit_rate"] == 0.0
+    cache.put("a", "output")
+    cache.get("a")
+    cache.get("a")
+    cache.get("b")
+    cache.get("c")
+    assert cache.stats()["hit_rate"] == 0.5
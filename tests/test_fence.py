@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+
+#   Copyright 2017 Jim Martens
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+
+"""tests.test_fence: tests the fenced code blocks of both parser engines"""
+import modgrammar
+import pytest
+
+from twomartens.markdown import fence
+from twomartens.markdown.renderer import Renderer
+
+
+def test_find_returns_the_blocks_with_their_code():
+    text = "a\n```python\nx = 1\r\n\r\ny\n```  \nb\n```\n```\n"
+    assert list(fence.find(text)) == [(2, 29, "x = 1\n\ny"), (31, 39, "")]
+
+
+def test_find_skips_lines_that_are_no_opening_fence():
+    text = "```a`b\n```\ncode\n```\n"
+    assert list(fence.find(text)) == [(7, 20, "code")]
+
+
+def test_find_stops_at_a_fence_without_closing_fence():
+    assert list(fence.find("```a\nx\n```\n\n```b\ny\n\n```c\n")) == [(0, 11, "x")]
+
+
+def test_match_searches_every_text_on_its_own():
+    assert fence.match("```\n\n```\n") == (9, "")
+    assert fence.match("```\ncode\n") is None
+    assert fence.match("```\ncode\n```\n") == (13, "code")
+
+
+@pytest.mark.parametrize("engine", ["grammar", "scanner"])
+def test_fence_ends_a_list_and_keeps_list_items_as_code(engine):
+    output = Renderer("fragment", engine).render("a\n\n* one\n* two\n```\n* three\n```\n")
+    assert output.count("<li>") == 2
+    assert "<li>two</li>" in output
+    assert "<pre><code>* three</code></pre>" in output
+
+
+@pytest.mark.parametrize("engine", ["grammar", "scanner"])
+def test_unclosed_fence_is_a_parse_error(engine):
+    with pytest.raises(modgrammar.ParseError) as error:
+        Renderer("fragment", engine).render("# Fences\n\n```\ncode\n")
+    assert error.value.line == 2
+
+
+@pytest.mark.parametrize("engine", ["grammar", "scanner"])
+def test_unclosed_fence_is_text_in_guarded_mode(engine):
+    output = Renderer("fragment", engine, budget=4.0).render("```x\ncode\n")
+    assert "<pre>" not in output
+    assert "code" in output
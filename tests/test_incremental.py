@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+#   Copyright 2017 Jim Martens
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+
+"""tests.test_incremental: tests the incremental parsing of edited texts"""
+import random
+
+import modgrammar
+import pytest
+
+from twomartens.markdown.incremental import IncrementalDocument
+from twomartens.markdown.renderer import Renderer
+from twomartens.markdown.transform import transform_block
+
+TEXT = "# A\n\ntext\n\n# A\n\nmore\n"
+
+
+def _apply(document: IncrementalDocument, blocks: list, offset: int, deleted: int, inserted: str) -> list:
+    """Applies an edit to the document and its change to the output of the blocks and returns the change."""
+    change = document.edit(offset, deleted, inserted)
+    blocks[change.start:change.start + change.removed] = change.blocks
+    return change
+
+
+def test_render_matches_renderer_with_anchors():
+    renderer = Renderer("fragment", "scanner", anchors=True)
+    document = IncrementalDocument(TEXT, renderer)
+    assert document.render() == renderer.render(TEXT)
+    assert 'id="a-1"' in document.render()
+
+
+def test_edit_before_heading_changes_anchors_after_it():
+    renderer = Renderer("fragment", "scanner", anchors=True)
+    document = IncrementalDocument(TEXT, renderer)
+    blocks = [transform_block(block, "fragment") for block in document.document.blocks]
+    _apply(document, blocks, 0, 0, "# A\n\n")
+    assert document.render() == renderer.render(document.text)
+    assert blocks == [transform_block(block, "fragment") for block in document.document.blocks]
+    assert 'id="a-2"' in blocks[-2]
+
+
+@pytest.mark.parametrize("engine", ["grammar", "scanner"])
+def test_error_of_reused_chunk_moves_with_the_edit(engine):
+    renderer = Renderer("fragment", engine)
+    document = IncrementalDocument("# A\n\ntext\n\nbad *\n", renderer)
+    document.edit(0, 0, "# B\n\n# C\n\n")
+    with pytest.raises(modgrammar.ParseError) as expected:
+        renderer.render(document.text)
+    with pytest.raises(modgrammar.ParseError) as error:
+        document.render()
+    assert (error.value.line, error.value.char) == (expected.value.line, expected.value.char)
+    assert error.value.line == 8
+    # the error that is kept for the chunk isn't moved
+    with pytest.raises(modgrammar.ParseError) as error:
+        document.render()
+    assert (error.value.line, error.value.char) == (expected.value.line, expected.value.char)
+
+
+def test_random_edits_keep_the_anchors_of_a_full_render():
+    rng = random.Random(0)
+    lines = ["# A\n\n", "# B\n\n", "## A\n\n", "text\n\n", "# A-1\n\n", "more text\n\n"]
+    renderer = Renderer("fragment", "scanner", anchors=True)
+    document = IncrementalDocument("".join(rng.choice(lines) for _ in range(20)), renderer)
+    blocks = [transform_block(block, "fragment") for block in document.document.blocks]
+    for _edit in range(200):
+        text = document.text
+        offsets = [0] + [index + 2 for index in range(len(text) - 1) if text[index:index + 2] == "\n\n"]
+        start = rng.choice(offsets)
+        end = rng.choice([offset for offset in offsets if offset >= start])
+        _apply(document, blocks, start, end - start, "".join(rng.choice(lines) for _ in range(rng.randint(0, 3))))
+        assert document.render() == renderer.render(document.text)
+        assert blocks == [transform_block(block, "fragment") for block in document.document.blocks]
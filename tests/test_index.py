@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+
+#   Copyright 2017 Jim Martens
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+
+"""tests.test_index: tests the index and the table of contents against the results of a parse"""
+import glob
+import os
+
+import pytest
+
+from twomartens.markdown.index import add_anchors, index
+from twomartens.markdown.inline import find_links
+from twomartens.markdown.nodes import Heading, Link, List
+from twomartens.markdown.renderer import Renderer
+
+GOLDEN = sorted(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), "golden", "*.md")))
+
+
+def _links(document) -> list:
+    """Returns the links of the document in the order of the text."""
+    links = []
+    for block in document.blocks:
+        parts = [item.children for item in block.items] if type(block) is List else [getattr(block, "children", [])]
+        links.extend(node for children in parts for node in children if type(node) is Link)
+    return links
+
+
+@pytest.mark.parametrize("path", GOLDEN, ids=lambda path: os.path.basename(path))
+def test_index_matches_the_parse(path):
+    with open(path, encoding="utf-8") as file:
+        text = file.read()
+    document = Renderer("html", "scanner").parse(text)
+    add_anchors(document)
+    text_index = index(text)
+    assert text_index.headings == [block for block in document.blocks if type(block) is Heading]
+    assert text_index.links == _links(document)
+
+
+def test_duplicate_headings_get_numbered_anchors():
+    text_index = index("# A\n\n# A\n\n## a!\n\n# A-1\n\n# ?\n")
+    assert [heading.anchor for heading in text_index.headings] == ["a", "a-1", "a-2", "a-1-1", "section"]
+    assert [heading.level for heading in text_index.headings] == [1, 1, 2, 1, 1]
+    assert text_index.title == "A"
+
+
+def test_toc_nests_the_headings_by_level():
+    toc = index("## Intro\n\n# A\n\n## B\n\n### C\n\n## D\n\n# E\n").toc()
+    assert [(entry.level, entry.text) for entry in toc] == [(2, "Intro"), (1, "A"), (1, "E")]
+    assert [entry.text for entry in toc[1].children] == ["B", "D"]
+    assert [entry.text for entry in toc[1].children[0].children] == ["C"]
+    assert toc[1].children[0].children[0].anchor == "c"
+
+
+def test_links_are_found_in_paragraphs_quotes_and_lists_but_not_in_code():
+    text = ("[a](http://a) and <http://b>\n\n>[c](http://c \"C\")\n\n* [d](http://d)\n\n```\n[e](http://e)\n```\n\n"
+            "    [f](http://f)\n")
+    assert index(text).links == [Link("a", "http://a"), Link("http://b", "http://b"), Link("c", "http://c", "C"),
+                                  Link("d", "http://d")]
+
+
+def test_find_links_returns_nothing_for_a_line_that_does_not_match():
+    assert find_links("[a](http://a) [b") == []
+    assert find_links("[a](http://a)\tb") == []
+    assert find_links("[a](http://a) b") == [Link("a", "http://a")]
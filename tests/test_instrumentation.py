@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+
+#   Copyright 2017 Jim Martens
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+
+"""tests.test_instrumentation: tests the stages and node counts a profile records and its report"""
+from twomartens.markdown.cache import RenderCache
+from twomartens.markdown.instrumentation import Profile
+from twomartens.markdown.renderer import Renderer
+
+TEXT = "# Title\n\nSome *text* with `code`.\n"
+DOCUMENT_NODES = {"Document": 1, "Heading": 1, "Paragraph": 1, "Text": 3, "Emphasis": 1, "Code": 1}
+
+
+def test_grammar_stages_and_nodes():
+    profile = Profile()
+    Renderer(instrumentation=profile).render(TEXT)
+    assert list(profile.stages) == ["parse", "convert", "transform"]
+    assert all(calls == 1 for calls, _wall, _cpu in profile.stages.values())
+    assert dict(profile.counts["document"]) == DOCUMENT_NODES
+    grammar = profile.counts["grammar"]
+    assert grammar["MarkdownGrammar"] == 1
+    assert (grammar["Heading"], grammar["Paragraph"], grammar["Italic"], grammar["InlineCode"]) == (1, 1, 1, 1)
+    assert (profile.input_size, profile.output_size) == (len(TEXT), len(Renderer().render(TEXT)))
+    assert profile.largest is not None and profile.largest.nodes > 0
+
+
+def test_scanner_stages_and_nodes():
+    profile = Profile()
+    Renderer(engine="scanner", instrumentation=profile).render(TEXT)
+    assert list(profile.stages) == ["parse", "transform"]
+    assert dict(profile.counts["document"]) == DOCUMENT_NODES
+    assert not profile.counts["grammar"]
+
+
+def test_cache_stage():
+    profile = Profile()
+    renderer = Renderer(instrumentation=profile, cache=RenderCache())
+    renderer.render(TEXT)
+    renderer.render(TEXT)
+    assert profile.stages["cache"][0] == 2
+    assert profile.stages["parse"][0] == 1
+    assert profile.input_size == 2 * len(TEXT)
+
+
+def test_report():
+    profile = Profile()
+    Renderer(instrumentation=profile).render(TEXT)
+    lines = profile.report().splitlines()
+    stages = lines[1:4]
+    assert [line.split()[0] for line in stages] == ["parse", "convert", "transform"]
+    assert len({len(line) for line in [lines[0]] + stages}) == 1
+    assert "input {} characters".format(len(TEXT)) in lines[4]
+    # the node counts end in the same column, although the names of the anonymous grammars are long
+    counts = [line for line in lines if line.startswith("    ")]
+    assert len(counts) == len(profile.counts["grammar"]) + len(profile.counts["document"])
+    assert any(len(name) > 24 for name in profile.counts["grammar"])
+    assert len({len(line) for line in counts}) == 1
+    assert lines.index("grammar nodes: {}".format(sum(profile.counts["grammar"].values()))) < \
+        lines.index("document nodes: 8")
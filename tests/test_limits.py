@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+
+#   Copyright 2017 Jim Martens
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+
+"""tests.test_limits: tests the memory accounting and the limits of a render"""
+import glob
+import os
+
+import pytest
+
+from twomartens.markdown.grammars import MarkdownGrammar
+from twomartens.markdown.limits import LimitExceeded, Limits, TreeCounter, Usage
+from twomartens.markdown.renderer import Renderer
+
+GOLDEN = os.path.join(os.path.dirname(os.path.abspath(__file__)), "golden")
+TEXT = "Some *text* with `code`.\n\n" * 500
+
+
+@pytest.mark.parametrize("limits", [Limits(nodes=100), Limits(depth=3)])
+def test_grammar_parse_stops_at_the_limit(limits):
+    with pytest.raises(LimitExceeded) as info:
+        Renderer("html", "grammar", limits=limits).render(TEXT)
+    # the parse stopped before the grammar result was complete and could be added to the usage
+    assert info.value.usage.grammar_bytes == 0
+    assert info.value.usage.nodes < 200
+
+
+def _parse(text: str, limits: Limits):
+    """Parses the text with the MarkdownGrammar and a tree counter with the given limits."""
+    return MarkdownGrammar.parser().parse_string(text, {"counter": TreeCounter(Usage(), limits)})
+
+
+@pytest.mark.parametrize("path", sorted(glob.glob(os.path.join(GOLDEN, "*.md"))), ids=os.path.basename)
+def test_counter_stops_at_the_limits_of_add_grammar(path):
+    with open(path, encoding="utf-8") as file:
+        text = file.read()
+    expected = Usage()
+    expected.add_grammar(MarkdownGrammar.parser().parse_string(text))
+    _parse(text, Limits(nodes=expected.nodes, depth=expected.depth))
+    with pytest.raises(LimitExceeded) as info:
+        _parse(text, Limits(nodes=expected.nodes - 1))
+    assert info.value.usage.nodes == expected.nodes
+    with pytest.raises(LimitExceeded) as info:
+        _parse(text, Limits(depth=expected.depth - 1))
+    assert info.value.limit == "depth"
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+
+#   Copyright 2017 Jim Martens
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+
+"""tests.test_markdown: tests that the command line leaves stdout open and the output file unchanged on errors"""
+import io
+import os
+import sys
+
+import modgrammar
+import pytest
+
+from twomartens.markdown.markdown import main
+from twomartens.markdown.renderer import Renderer
+
+TEXT = "# Title\n\nsome *text*\n"
+
+
+def _main(monkeypatch, *args):
+    """Runs the command line with the arguments."""
+    monkeypatch.setattr(sys, "argv", ["markdown"] + list(args))
+    main()
+
+
+@pytest.mark.parametrize("options", [[], ["--profile"]])
+def test_stdout_stays_open(tmpdir, monkeypatch, capsys, options):
+    source = tmpdir.join("a.md")
+    source.write(TEXT)
+    _main(monkeypatch, *(options + [str(source), "-"]))
+    assert not sys.stdout.closed
+    print("after")
+    out, err = capsys.readouterr()
+    assert out == Renderer().render(TEXT) + "after\n"
+    assert ("parse" in err) == bool(options)
+
+
+def test_stdin_stays_open(tmpdir, monkeypatch):
+    stdin = io.TextIOWrapper(io.BytesIO(TEXT.encode("utf-8")))
+    monkeypatch.setattr(sys, "stdin", stdin)
+    target = tmpdir.join("a.html")
+    _main(monkeypatch, "-", str(target))
+    assert not stdin.buffer.closed
+    assert target.read() == Renderer().render(TEXT)
+
+
+@pytest.mark.parametrize("options", [[], ["--profile"]])
+def test_parse_error_keeps_output(tmpdir, monkeypatch, options):
+    source = tmpdir.join("a.md")
+    source.write("a\n\n```\nb\n")
+    target = tmpdir.join("a.html")
+    target.write("old")
+    with pytest.raises(modgrammar.ParseError):
+        _main(monkeypatch, *(options + [str(source), str(target)]))
+    assert target.read() == "old"
+    assert sorted(os.listdir(str(tmpdir))) == ["a.html", "a.md"]
+
+
+def test_missing_output_directory(tmpdir, monkeypatch, capsys):
+    source = tmpdir.join("a.md")
+    source.write(TEXT)
+    target = os.path.join(str(tmpdir), "missing", "a.html")
+    with pytest.raises(SystemExit):
+        _main(monkeypatch, str(source), target)
+    assert "can't open '{}'".format(target) in capsys.readouterr()[1]
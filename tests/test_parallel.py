@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+
+#   Copyright 2017 Jim Martens
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+
+"""tests.test_parallel: tests that parsing in a process pool gives the result of a serial parse"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import modgrammar
+import pytest
+
+from twomartens.markdown import parallel
+from twomartens.markdown.renderer import Renderer
+
+MIXED = os.path.join(os.path.dirname(os.path.abspath(__file__)), "golden", "mixed.md")
+
+
+def _text() -> str:
+    """Returns the largest golden document."""
+    with open(MIXED, encoding="utf-8") as file:
+        return file.read()
+
+
+@pytest.fixture(scope="module")
+def executor():
+    with ProcessPoolExecutor(max_workers=2) as pool:
+        yield pool
+
+
+@pytest.mark.parametrize("engine", ["grammar", "scanner"])
+def test_parallel_parse_equals_serial_parse(engine, executor):
+    text = _text()
+    document = parallel.parse(text, engine, chunk_size=1024, executor=executor)
+    assert document == Renderer("html", engine).parse(text)
+    assert len(parallel._pieces(text, 1024)) > 2
+
+
+@pytest.mark.parametrize("engine", ["grammar", "scanner"])
+def test_error_of_a_worker_chunk_has_the_position_in_the_whole_text(engine, executor):
+    # the grammar engine backtracks through all blocks before an error, so the text before the error is short
+    part = "# Part\n\nsome text with a [link](http://x) and **bold**\r\n\n* item\n* item\n\n"
+    text = part * 3 + "bad *\n\n" + part * 3
+    with pytest.raises(modgrammar.ParseError) as expected:
+        Renderer("html", engine).parse(text)
+    with pytest.raises(modgrammar.ParseError) as error:
+        parallel.parse(text, engine, chunk_size=100, executor=executor)
+    # the error is in a piece that a worker parses
+    assert sum(len(chunk) for _line, _char, chunk in parallel._pieces(text, 100)[0]) <= text.index("bad")
+    assert (error.value.line, error.value.col, error.value.char) == (expected.value.line, expected.value.col,
+                                                                     expected.value.char)
+    assert str(error.value) == str(expected.value)
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+
+#   Copyright 2017 Jim Martens
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""tests.test_renderer: tests the caches and the batch rendering of the renderer"""
+import modgrammar
+import pytest
+
+from twomartens.markdown.cache import RenderCache
+from twomartens.markdown.limits import LimitExceeded, Limits
+from twomartens.markdown.renderer import Renderer
+
+INVALID = "# Title\n\nbad *x\n"
+
+
+@pytest.mark.parametrize("engine", ["grammar", "scanner"])
+def test_guarded_output_is_not_served_to_unguarded_renderer(engine):
+    cache = RenderCache()
+    guarded = Renderer("html", engine, cache=cache, budget=4.0)
+    assert "bad" in guarded.render(INVALID)
+    with pytest.raises(modgrammar.ParseError):
+        Renderer("html", engine, cache=cache).render(INVALID)
+
+
+def test_cache_is_shared_between_equal_renderers():
+    cache = RenderCache()
+    Renderer("html", "scanner", cache=cache).render("# Title\n")
+    Renderer("html", "scanner", cache=cache).render("# Title\n")
+    assert cache.hits == 1
+
+
+def test_cache_separates_engines_and_time_budgets():
+    cache = RenderCache()
+    Renderer("html", "grammar", cache=cache).render("# Title\n")
+    Renderer("html", "scanner", cache=cache).render("# Title\n")
+    Renderer("html", "scanner", cache=cache, time_budget=1.0).render("# Title\n")
+    assert cache.hits == 0
+
+
+@pytest.mark.parametrize("engine", ["grammar", "scanner"])
+def test_render_batch_returns_the_results_in_order(engine):
+    renderer = Renderer("fragment", engine)
+    texts = ["# First\n", "second *text*\n", "", "third\n"]
+    assert renderer.render_batch(texts) == [(renderer.render(text), None) for text in texts]
+
+
+@pytest.mark.parametrize("engine", ["grammar", "scanner"])
+def test_render_batch_keeps_errors_per_text(engine):
+    results = Renderer("fragment", engine).render_batch(["# A\n", INVALID, "b\n"])
+    assert results[0][1] is None and results[2][1] is None
+    assert results[1][0] is None
+    assert isinstance(results[1][1], modgrammar.ParseError)
+    assert results[1][1].line == 2
+
+
+def test_render_batch_keeps_limit_errors_per_text():
+    renderer = Renderer("fragment", "scanner", limits=Limits(input_bytes=200))
+    results = renderer.render_batch(["short\n", "long " * 100 + "\n", "short again\n"])
+    assert [error is None for _output, error in results] == [True, False, True]
+    assert isinstance(results[1][1], LimitExceeded)
+
+
+def test_render_batch_renders_identical_texts_once_if_deduplicated():
+    calls = []
+    renderer = Renderer("fragment", "scanner")
+    parse = renderer.parse
+
+    def counting_parse(text):
+        calls.append(text)
+        return parse(text)
+
+    renderer.parse = counting_parse
+    results = renderer.render_batch(["a\n", "b\n", "a\n", INVALID, INVALID], deduplicate=True)
+    assert calls == ["a\n", "b\n", INVALID]
+    assert results[0] is results[2] and results[3] is results[4]
+    assert results[0] == (Renderer("fragment", "scanner").render("a\n"), None)
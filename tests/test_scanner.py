@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+
+#   Copyright 2017 Jim Martens
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+
+"""tests.test_scanner: checks the scanner engine against the grammar engine on generated documents
+
+Both engines must produce the same output for valid documents and report a parse error on the same line for invalid
+ones, with every kind of line break.
+"""
+import random
+
+import modgrammar
+import pytest
+
+from twomartens.markdown.renderer import Renderer
+
+DOCUMENTS = 300
+INLINE = ["foo", "bar baz", "**b**", "*i*", "`c<d>`", "[l](http://x)", '[l](http://x "t")', "<http://a>", " x",
+          "   x", "<a>#y", "  y", "#", ">", "*", "\t", "    y", "]", "<", "  "]
+
+
+def _inline(rng: random.Random) -> str:
+    """Generates the inline content of a line."""
+    return "".join(rng.choice(INLINE) for _ in range(rng.randint(1, 3)))
+
+
+def _line(rng: random.Random) -> str:
+    """Generates a line of any block, an empty line or a line that matches no block."""
+    kind = rng.randint(0, 12)
+    if kind == 0:
+        return ""
+    if kind == 1:
+        return rng.choice([" ", "    ", "\t", "  "])
+    if kind == 2:
+        return "#" * rng.randint(1, 7) + rng.choice([" ", "", "  "]) + _inline(rng)
+    if kind == 3:
+        return ">" + _inline(rng)
+    if kind == 4:
+        return rng.choice("*-+") + " " + _inline(rng)
+    if kind == 5:
+        return str(rng.randint(0, 20)) + ". " + _inline(rng)
+    if kind == 6:
+        return rng.choice(["    ", "\t"]) + _inline(rng)
+    if kind == 7:
+        return "```"
+    return _inline(rng)
+
+
+def _document(rng: random.Random) -> str:
+    """Generates a document with one kind of line break."""
+    eol = rng.choice(["\n", "\r\n", "\r"])
+    text = eol.join(_line(rng) for _ in range(rng.randint(1, 5)))
+    return text + eol if rng.random() < 0.9 else text
+
+
+def _render(engine: str, text: str) -> tuple:
+    """Returns the output of the engine for the text or the line of its parse error."""
+    try:
+        return Renderer("json", engine).render(text), None
+    except modgrammar.ParseError as pe:
+        return None, pe.line
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_engines_agree(seed):
+    rng = random.Random(seed)
+    for _index in range(DOCUMENTS):
+        text = _document(rng)
+        assert _render("scanner", text) == _render("grammar", text), repr(text)
+
+
+@pytest.mark.parametrize("eol", ["\n", "\r\n", "\r"])
+def test_error_line_is_counted_with_every_line_break(eol):
+    text = eol.join(["# T", "", "bad", "", "x *", ""])
+    assert _render("scanner", text) == _render("grammar", text) == (None, 4)
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+
+#   Copyright 2017 Jim Martens
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+
+"""tests.test_service: tests the render service and the requests of the server"""
+import asyncio
+import io
+import json
+
+import adversarial
+import pytest
+
+from twomartens.markdown import server
+from twomartens.markdown.service import RenderService
+
+# a paragraph that ends in a line that doesn't match makes the grammar backtrack for much longer than the timeout
+RUNAWAY = adversarial.generate("paragraph", 200, 0)
+
+
+def _run(coroutine):
+    """Runs the coroutine in a new event loop and returns its result."""
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def test_timeout_replaces_the_worker():
+    async def render():
+        service = RenderService("fragment", "grammar", workers=1, timeout=1.0)
+        try:
+            with pytest.raises(asyncio.TimeoutError):
+                await service.render(RUNAWAY)
+            return await asyncio.wait_for(service.render("# Title\n"), 30.0)
+        finally:
+            service.close()
+
+    assert _run(render()) == "    <h1>Title</h1>\n"
+
+
+@pytest.mark.parametrize("line", ['{"id": 1, "text": 5}', '{"id": 1}', "[1]", "no json"])
+def test_malformed_request_gets_400(line, monkeypatch):
+    stdout = io.StringIO()
+    monkeypatch.setattr(server.sys, "stdout", stdout)
+    service = RenderService("fragment", "scanner", workers=1, processes=False)
+    _run(server._handle_line(service, line))
+    service.close()
+    response = json.loads(stdout.getvalue())
+    assert response["status"] == 400
+    assert response["id"] == (1 if line.startswith("{") else None)
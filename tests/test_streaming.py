@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+#   Copyright 2017 Jim Martens
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+
+"""tests.test_streaming: tests that rendering block by block gives the output and the errors of render"""
+import io
+import mmap
+import os
+
+import modgrammar
+import pytest
+
+from twomartens.markdown.renderer import Renderer
+from twomartens.markdown.source import read_lines
+
+MIXED = os.path.join(os.path.dirname(os.path.abspath(__file__)), "golden", "mixed.md")
+SMALL = "# Title\n\nsome *text*\nwith [a link](http://a)\n\n> quote\n\n* item\n* item\n\n    code\n\n```\nfenced\n```\n"
+
+
+def _text() -> str:
+    """Returns the largest golden document."""
+    with open(MIXED, encoding="utf-8", newline="") as file:
+        return file.read()
+
+
+@pytest.mark.parametrize("output_format", ["html", "json", "text"])
+@pytest.mark.parametrize("engine", ["grammar", "scanner"])
+def test_render_iter_of_a_string_equals_render(engine, output_format):
+    renderer = Renderer(output_format, engine)
+    assert "".join(renderer.render_iter(_text())) == renderer.render(_text())
+
+
+@pytest.mark.parametrize("engine", ["grammar", "scanner"])
+def test_render_to_from_files_equals_render(engine, tmp_path):
+    renderer = Renderer("html", engine)
+    path = tmp_path / "mixed.md"
+    path.write_bytes(_text().encode("utf-8"))
+    expected = renderer.render(_text())
+    with open(str(path), encoding="utf-8", newline="") as file:
+        output = io.StringIO()
+        renderer.render_to(file, output)
+    assert output.getvalue() == expected
+    output = io.StringIO()
+    renderer.render_to(read_lines(str(path)), output)
+    assert output.getvalue() == expected
+    with open(str(path), "rb") as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+        assert "".join(renderer.render_iter(buffer)) == expected
+
+
+@pytest.mark.parametrize("eol", ["\r\n", "\r"])
+@pytest.mark.parametrize("engine", ["grammar", "scanner"])
+def test_render_iter_with_other_line_breaks_equals_render(engine, eol):
+    renderer = Renderer("html", engine)
+    text = SMALL.replace("\n", eol)
+    assert "".join(renderer.render_iter(text)) == renderer.render(text)
+    assert "".join(renderer.render_iter(text.encode("utf-8"))) == renderer.render(text)
+    assert "".join(renderer.render_iter(io.StringIO(text, newline=""))) == renderer.render(text)
+
+
+@pytest.mark.parametrize("eol", ["\n", "\r\n"])
+@pytest.mark.parametrize("engine", ["grammar", "scanner"])
+def test_error_of_a_later_block_has_the_position_of_render(engine, eol):
+    renderer = Renderer("html", engine)
+    # the grammar engine backtracks through all blocks before an error, so the text before the error is short
+    text = ("# Title\n\nsome *text*\n\nbad *\n\n" + SMALL).replace("\n", eol)
+    with pytest.raises(modgrammar.ParseError) as expected:
+        renderer.render(text)
+    with pytest.raises(modgrammar.ParseError) as error:
+        "".join(renderer.render_iter(text))
+    assert (error.value.line, error.value.col, error.value.char) == (expected.value.line, expected.value.col,
+                                                                     expected.value.char)
+    assert error.value.line == 4
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+
+#   Copyright 2017 Jim Martens
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+
+"""tests.test_transform: compares the output of every backend with checked-in golden output
+
+The inputs are examples/simple.md and the documents in tests/golden, which were generated with the shapes of
+benchmarks/benchmark.py (mixed.md is the largest) except for fences.md, which covers fenced code blocks. The HTML
+output was checked against the string concatenation the HTML backend used before it emitted fragments into a list.
+"""
+import glob
+import os
+
+import pytest
+
+from twomartens.markdown.renderer import Renderer
+from twomartens.markdown.transform import BACKENDS
+
+GOLDEN = os.path.join(os.path.dirname(os.path.abspath(__file__)), "golden")
+INPUTS = [os.path.join(os.path.dirname(GOLDEN), os.pardir, "examples", "simple.md")]
+INPUTS += sorted(glob.glob(os.path.join(GOLDEN, "*.md")))
+
+
+def _read(path: str) -> str:
+    """Returns the content of the file at the given path with its line breaks kept.
+
+    :param str path: the path of the file
+    """
+    with open(path, encoding="utf-8", newline="") as file:
+        return file.read()
+
+
+@pytest.mark.parametrize("engine", ["grammar", "scanner"])
+@pytest.mark.parametrize("output_format", sorted(BACKENDS))
+@pytest.mark.parametrize("path", INPUTS, ids=lambda path: os.path.basename(path))
+def test_output_matches_golden(path, output_format, engine):
+    name = os.path.splitext(os.path.basename(path))[0]
+    expected = _read(os.path.join(GOLDEN, name + "." + output_format))
+    assert Renderer(output_format, engine).render(_read(path)) == expected
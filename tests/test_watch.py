@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+
+#   Copyright 2017 Jim Martens
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+
+"""tests.test_watch: tests the rendering of changed files in watch mode"""
+import io
+import os
+
+from twomartens.markdown.renderer import Renderer
+from twomartens.markdown.watch import Watcher
+
+
+def _watcher(tmp_path) -> tuple:
+    """Returns a batch watcher for the directory in with the outputs in out and the stream of its messages."""
+    out = io.StringIO()
+    return Watcher([str(tmp_path / "in")], str(tmp_path / "out"), Renderer("text", "scanner"), batch=True,
+                   out=out), out
+
+
+def _write(tmp_path, name: str, text: str):
+    """Writes the text to the file with the given name in the directory in."""
+    path = tmp_path / "in" / name
+    path.parent.mkdir(exist_ok=True)
+    path.write_text(text)
+    return path
+
+
+def test_first_poll_renders_only_stale_outputs(tmp_path):
+    source = _write(tmp_path, "a.md", "# A\n")
+    _write(tmp_path, "b.md", "# B\n")
+    target = tmp_path / "out" / "a.txt"
+    target.parent.mkdir()
+    target.write_text("kept")
+    os.utime(str(source), (0, 0))
+    watcher, out = _watcher(tmp_path)
+    assert watcher.poll() == 1
+    assert target.read_text() == "kept"
+    assert (tmp_path / "out" / "b.txt").read_text().startswith("B")
+    assert "Rendered" in out.getvalue() and "b.md" in out.getvalue()
+
+
+def test_unchanged_files_are_skipped(tmp_path):
+    _write(tmp_path, "a.md", "# A\n")
+    watcher, _out = _watcher(tmp_path)
+    assert watcher.poll() == 1
+    assert watcher.poll() == 0
+
+
+def test_changed_and_replaced_files_are_rendered_again(tmp_path):
+    source = _write(tmp_path, "a.md", "# A\n")
+    other = _write(tmp_path, "b.md", "# B\n")
+    watcher, _out = _watcher(tmp_path)
+    assert watcher.poll() == 2
+    source.write_text("# Changed\n")
+    os.utime(str(source), ns=(0, 1))
+    assert watcher.poll() == 1
+    assert (tmp_path / "out" / "a.txt").read_text().startswith("Changed")
+    # an editor that saves by renaming a new file keeps the size and may keep the modification time
+    status = os.stat(str(other))
+    replacement = _write(tmp_path, "b.new", "# C\n")
+    os.utime(str(replacement), ns=(status.st_atime_ns, status.st_mtime_ns))
+    os.replace(str(replacement), str(other))
+    assert watcher.poll() == 1
+    assert (tmp_path / "out" / "b.txt").read_text().startswith("C")
+
+
+def test_errors_are_reported_and_the_poll_goes_on(tmp_path):
+    _write(tmp_path, "a.md", "bad *\n")
+    _write(tmp_path, "b.md", "# B\n")
+    _write(tmp_path, "c.md", "# C\n")
+    # the output of c.md can't be written
+    (tmp_path / "out" / "c.txt").mkdir(parents=True)
+    os.utime(str(tmp_path / "out" / "c.txt"), (0, 0))
+    watcher, out = _watcher(tmp_path)
+    assert watcher.poll() == 3
+    messages = out.getvalue()
+    assert "a.md: [line 1" in messages
+    assert "c.md: IsADirectoryError" in messages
+    assert (tmp_path / "out" / "b.txt").read_text().startswith("B")
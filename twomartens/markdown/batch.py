@@ -0,0 +1,224 @@
+# coding=utf-8
+
+#   Copyright 2017 Jim Martens
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""markdown.batch: provides rendering of many files with a process pool"""
+import glob
+import os
+import stat
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+import modgrammar
+
+from .cache import RenderCache, open_store
+from .renderer import Renderer
+from .source import read_lines
+from .transform import get_backend
+
+MARKDOWN_EXTENSIONS = (".md", ".markdown")
+
+_renderer = None
+
+
+def collect(inputs: list, output_dir: str, output_format: str) -> list:
+    """Collects the markdown files for the given inputs and returns a list of (source, target) tuples.
+
+    Directories are searched recursively for markdown files, globs are expanded and files are taken as they are.
+    The target mirrors the path of the source relative to the directory or to the part of the glob without
+    wildcards.
+
+    :param list inputs: the files, directories and globs
+    :param str output_dir: the directory for the output files
+    :param str output_format: the output format, whose file extension is used for the targets
+    """
+    extension = get_backend(output_format).extension
+    files = []
+    for path in inputs:
+        if os.path.isdir(path):
+            base = path
+            sources = []
+            for directory, _dirs, names in os.walk(path):
+                sources.extend(os.path.join(directory, name) for name in names
+                               if os.path.splitext(name)[1] in MARKDOWN_EXTENSIONS)
+        elif _has_wildcards(path):
+            base = _glob_base(path)
+            sources = [source for source in glob.glob(path, recursive=True) if os.path.isfile(source)]
+        else:
+            base = os.path.dirname(path)
+            sources = [path]
+        for source in sorted(sources):
+            relative = os.path.splitext(os.path.relpath(source, base))[0] + "." + extension
+            files.append((source, os.path.join(output_dir, relative)))
+    return files
+
+
+def run(files: list, output_format: str = "html", engine: str = "grammar", jobs: int = None, cache: str = None,
+        out=sys.stdout, budget: float = None, anchors: bool = False, encoding: str = "utf-8",
+        cache_size: int = None) -> int:
+    """Renders the given files and prints failures and a summary. Returns the number of failed files.
+
+    Files whose output is newer than the input are skipped.
+
+    :param list files: the list of (source, target) tuples
+    :param str output_format: the output format
+    :param str engine: the parser engine (grammar or scanner)
+    :param int jobs: the number of worker processes, defaults to the number of CPUs
+    :param str cache: the path of an optional persistent cache
+    :param out: the stream for the messages
+    :param float budget: the grammar steps per character for guarded mode or None
+    :param bool anchors: True if the headings get id attributes
+    :param str encoding: the encoding of the inputs (the outputs are always written in UTF-8)
+    :param int cache_size: the maximum number of bytes of the persistent cache or None
+    """
+    start = time.perf_counter()
+    pending = [(source, target) for source, target in files if not is_up_to_date(source, target)]
+    skipped = len(files) - len(pending)
+    arguments = [(source, target, output_format, engine, cache, budget, anchors, encoding, cache_size)
+                 for source, target in pending]
+
+    workers = jobs or os.cpu_count() or 1
+    if workers == 1 or len(arguments) <= 1:
+        results = [_render_file(argument) for argument in arguments]
+    else:
+        chunksize = max(1, len(arguments) // (8 * workers))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(_render_file, arguments, chunksize=chunksize))
+
+    failed = 0
+    render_time = 0.0
+    for source, seconds, error in results:
+        render_time += seconds
+        if error is not None:
+            failed += 1
+            print("{}: {}".format(source, error), file=out)
+
+    print("Rendered {} files, skipped {} up-to-date, {} failed in {:.3f}s (render time {:.3f}s).".format(
+        len(results) - failed, skipped, failed, time.perf_counter() - start, render_time), file=out)
+    return failed
+
+
+def _render_file(arguments: tuple) -> tuple:
+    """Renders one file and returns a tuple (source, seconds, error).
+
+    The error is None on success. Every worker process keeps one renderer for all of its files.
+
+    :param tuple arguments: the source, target, output format, engine, cache path, budget, anchors, encoding and
+        cache size
+    """
+    global _renderer
+    source, target, output_format, engine, cache, budget, anchors, encoding, cache_size = arguments
+    start = time.perf_counter()
+    if _renderer is None or (_renderer.output_format, _renderer.engine, _renderer.budget,
+                             _renderer.anchors) != (output_format, engine, budget, anchors):
+        render_cache = RenderCache(store=open_store(cache, cache_size)) if cache is not None else None
+        _renderer = Renderer(output_format, engine, render_cache, budget=budget, anchors=anchors)
+    try:
+        markdown = "".join(read_lines(source, encoding))
+        output = _renderer.render(markdown)
+        # a render or write that fails leaves no truncated output that would be taken for up to date
+        write_atomically(target, output)
+    except modgrammar.ParseError as pe:
+        return source, time.perf_counter() - start, str(pe)
+    except (OSError, UnicodeError) as error:
+        return source, time.perf_counter() - start, "{}: {}".format(type(error).__name__, error)
+    return source, time.perf_counter() - start, None
+
+
+def write_atomically(path: str, text: str):
+    """Writes the text in UTF-8 to a temporary file next to the path and renames it to the path.
+
+    The file keeps the permissions of the file it replaces.
+
+    :param str path: the path of the file
+    :param str text: the text
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open_atomically(path) as file:
+        file.write(text)
+
+
+@contextmanager
+def open_atomically(path: str):
+    """Opens a temporary file next to the path for writing in UTF-8 and renames it to the path once the enclosed code
+    is done. If the enclosed code raises an exception the temporary file is removed and the path is left unchanged.
+
+    The file keeps the permissions of the file it replaces.
+
+    :param str path: the path of the file
+    """
+    directory = os.path.dirname(path) or "."
+    try:
+        mode = stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        mode = 0o666 & ~_umask()
+    try:
+        descriptor, temporary = tempfile.mkstemp(prefix="." + os.path.basename(path) + ".", suffix=".tmp",
+                                                 dir=directory)
+    except OSError as error:
+        # report the path instead of the random name of the temporary file
+        error.filename = path
+        raise
+    try:
+        with open(descriptor, "w", encoding="utf-8") as file:
+            yield file
+        os.chmod(temporary, mode)
+        os.replace(temporary, path)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+
+
+def is_up_to_date(source: str, target: str) -> bool:
+    """Returns True if the target exists and is newer than the source.
+
+    :param str source: the path of the source
+    :param str target: the path of the target
+    """
+    try:
+        return os.path.getmtime(target) >= os.path.getmtime(source)
+    except OSError:
+        return False
+
+
+def _glob_base(pattern: str) -> str:
+    """Returns the leading part of the glob pattern that contains no wildcards.
+
+    :param str pattern: the glob pattern
+    """
+    parts = []
+    for part in pattern.split(os.sep):
+        if _has_wildcards(part):
+            break
+        parts.append(part)
+    return os.sep.join(parts)
+
+
+def _has_wildcards(path: str) -> bool:
+    """Returns True if the path contains glob wildcards.
+
+    :param str path: the path
+    """
+    return any(char in path for char in "*?[")
+
+
+def _umask() -> int:
+    """Returns the umask of the process, which can only be read by setting it."""
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
@@ -0,0 +1,54 @@
+# coding=utf-8
+
+#   Copyright 2017 Jim Martens
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""markdown.budget: provides a work budget that stops the grammar parse of pathological texts"""
+import time
+
+
+class BudgetExceeded(Exception):
+    """Raised if a grammar parse exceeds its budget."""
+    pass
+
+
+class Budget:
+    """Counts the steps of a grammar parse and stops it if it takes too many steps or too long.
+
+    A step is an attempt to match a line or inline element at some position. Texts with unmatched delimiters can
+    make the grammar backtrack through exponentially many steps, which the budget cuts off.
+    """
+    __slots__ = ("steps", "deadline", "used")
+
+    def __init__(self, steps: int = None, seconds: float = None):
+        """Initializes the budget. The time starts to run now.
+
+        :param int steps: the maximum number of steps or None
+        :param float seconds: the maximum number of seconds or None
+        """
+        self.steps = steps
+        self.deadline = time.perf_counter() + seconds if seconds is not None else None
+        self.used = 0
+
+    def charge(self):
+        """Counts one step.
+
+        :raises BudgetExceeded: if the budget is used up
+        """
+        self.used += 1
+        if self.steps is not None and self.used > self.steps:
+            raise BudgetExceeded("the parse took more than {} steps".format(self.steps))
+        # looking at the clock is expensive compared to a step
+        if self.deadline is not None and not self.used % 1024 and time.perf_counter() > self.deadline:
+            raise BudgetExceeded("the parse took longer than the time budget")
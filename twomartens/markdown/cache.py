@@ -0,0 +1,393 @@
+# coding=utf-8
+
+#   Copyright 2017 Jim Martens
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""markdown.cache: provides a content-addressed cache for rendered output"""
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from .markdown import __version__
+
+
+class RenderCache:
+    """Caches rendered output by a hash of the input text, the output format and the options.
+
+    The entries are kept in memory up to a budget of bytes and the least recently used entries are evicted first.
+    If a store is given, every entry is written to it as well and entries missing in memory are looked up there. The
+    keys contain the version of the package, so a store doesn't serve the output of an older release.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, store=None):
+        """Initializes the cache.
+
+        :param int max_bytes: the maximum number of bytes of output held in memory
+        :param store: an optional persistent store (DirectoryStore or SqliteStore)
+        """
+        self.max_bytes = max_bytes
+        self.store = store
+        self.hits = 0
+        self.store_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(text: str, output_format: str, **options) -> str:
+        """Returns the cache key for the given input.
+
+        :param str text: the input text
+        :param str output_format: the output format
+        :param options: the options that influence the output
+        """
+        digest = hashlib.sha256()
+        digest.update((__version__ + "\0" + output_format).encode("utf-8"))
+        for name in sorted(options):
+            digest.update(("\0" + name + "=" + repr(options[name])).encode("utf-8"))
+        digest.update(b"\0\0")
+        digest.update(text.encode("utf-8", "surrogatepass"))
+        return digest.hexdigest()
+
+    def get(self, key: str):
+        """Returns the cached output for the given key or None if it isn't cached.
+
+        :param str key: the cache key
+        """
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return data.decode("utf-8")
+        data = self.store.get(key) if self.store is not None else None
+        with self._lock:
+            if data is None:
+                self.misses += 1
+                return None
+            self.store_hits += 1
+            self._remember(key, data)
+        return data.decode("utf-8")
+
+    def put(self, key: str, output: str):
+        """Caches the output under the given key.
+
+        :param str key: the cache key
+        :param str output: the rendered output
+        """
+        data = output.encode("utf-8")
+        if self.store is not None:
+            self.store.put(key, data)
+        with self._lock:
+            self._remember(key, data)
+
+    def stats(self) -> map:
+        """Returns the counters of the cache."""
+        with self._lock:
+            return {"hits": self.hits, "store_hits": self.store_hits, "misses": self.misses,
+                    "evictions": self.evictions, "entries": len(self._entries), "bytes": self.bytes}
+
+    def _remember(self, key: str, data: bytes):
+        """Keeps the data in memory and evicts the least recently used entries if the budget is exceeded.
+
+        The caller must hold the lock.
+
+        :param str key: the cache key
+        :param bytes data: the encoded output
+        """
+        if len(data) > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.bytes -= len(old)
+        self._entries[key] = data
+        self.bytes += len(data)
+        while self.bytes > self.max_bytes:
+            _key, evicted = self._entries.popitem(last=False)
+            self.bytes -= len(evicted)
+            self.evictions += 1
+
+
+class BlockCache:
+    """Caches the output of the chunks of texts (see scanner.split) by a hash of the chunk, the output format and the
+    options.
+
+    A chunk is parsed the same on its own as within its text, so its output doesn't depend on the rest of the text.
+    Texts that change in a few blocks between renders only need the changed chunks to be parsed again. Every entry
+    holds the output of the blocks of a chunk and the text of its first heading, which may become the title. The
+    entries are kept up to a budget of bytes, counted in UTF-8 like in RenderCache, and the least recently used entries
+    are evicted first.
+    """
+
+    key = staticmethod(RenderCache.key)
+
+    def __init__(self, max_bytes: int = 16 * 1024 * 1024):
+        """Initializes the cache.
+
+        :param int max_bytes: the maximum number of bytes held by the entries
+        """
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        """Returns a tuple (output, heading) for the given key or None if it isn't cached.
+
+        :param str key: the cache key
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[:2]
+
+    def put(self, key: str, output: str, heading: str = None):
+        """Caches the output of a chunk under the given key.
+
+        :param str key: the cache key
+        :param str output: the output of the blocks of the chunk
+        :param str heading: the text of the first heading of the chunk or None
+        """
+        # the size is counted in UTF-8 bytes like in RenderCache
+        size = len(output.encode("utf-8", "surrogatepass"))
+        if heading is not None:
+            size += len(heading.encode("utf-8", "surrogatepass"))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.bytes -= old[2]
+            self._entries[key] = (output, heading, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _key, evicted = self._entries.popitem(last=False)
+                self.bytes -= evicted[2]
+                self.evictions += 1
+
+    def stats(self) -> map:
+        """Returns the counters of the cache and the share of hits among all lookups."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / lookups if lookups else 0.0,
+                    "evictions": self.evictions, "entries": len(self._entries), "bytes": self.bytes}
+
+
+class DirectoryStore:
+    """Stores cache entries as files in a directory.
+
+    Without a maximum the store grows without limit. With a maximum the least recently used entries are deleted as
+    soon as the entries take more bytes, until they take three quarters of the maximum. The modification time of a
+    file tells when its entry was used last.
+    """
+
+    def __init__(self, path: str, max_bytes: int = None):
+        """Initializes the store and creates the directory if necessary.
+
+        :param str path: the path of the directory
+        :param int max_bytes: the maximum number of bytes of the entries or None
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        os.makedirs(path, exist_ok=True)
+        # the bytes of the entries as far as this store knows, other processes may add entries as well
+        self._bytes = None
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        """Returns the data for the given key or None if there is none.
+
+        :param str key: the cache key
+        """
+        path = os.path.join(self.path, key[:2], key)
+        try:
+            with open(path, "rb") as file:
+                data = file.read()
+        except FileNotFoundError:
+            return None
+        if self.max_bytes is not None:
+            try:
+                os.utime(path)
+            except OSError:
+                # the entry was evicted in the meantime
+                pass
+        return data
+
+    def put(self, key: str, data: bytes):
+        """Stores the data under the given key and evicts the least recently used entries if there are too many.
+
+        The data is written to a temporary file first, so readers never see a partially written entry.
+
+        :param str key: the cache key
+        :param bytes data: the data
+        """
+        directory = os.path.join(self.path, key[:2])
+        path = os.path.join(directory, key)
+        os.makedirs(directory, exist_ok=True)
+        handle, temp_path = tempfile.mkstemp(dir=directory)
+        replaced = 0
+        try:
+            with os.fdopen(handle, "wb") as file:
+                file.write(data)
+            if self.max_bytes is not None:
+                # the bytes of an entry that is replaced don't count any longer
+                try:
+                    replaced = os.stat(path).st_size
+                except FileNotFoundError:
+                    pass
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+        if self.max_bytes is not None:
+            with self._lock:
+                if self._bytes is not None:
+                    self._bytes += len(data) - replaced
+                if self._bytes is None or self._bytes > self.max_bytes:
+                    self._bytes = self._evict()
+
+    def _evict(self) -> int:
+        """Deletes the least recently used entries if the entries take more than the maximum and returns the bytes of
+        the remaining entries."""
+        entries = []
+        for directory in os.scandir(self.path):
+            if not directory.is_dir():
+                continue
+            for entry in os.scandir(directory.path):
+                # the temporary files of puts in progress aren't entries
+                if len(entry.name) == 64:
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _mtime, size, _path in entries)
+        if total <= self.max_bytes:
+            return total
+        entries.sort()
+        for _mtime, size, path in entries:
+            if total <= self.max_bytes * 3 // 4:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        return total
+
+
+class SqliteStore:
+    """Stores cache entries in a sqlite database file.
+
+    Without a maximum the store grows without limit. With a maximum the least recently used entries are deleted as
+    soon as the entries take more bytes, until they take three quarters of the maximum.
+    """
+
+    def __init__(self, path: str, max_bytes: int = None):
+        """Initializes the store and creates the database if necessary.
+
+        :param str path: the path of the database file
+        :param int max_bytes: the maximum number of bytes of the entries or None
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self._bytes = None
+        self._lock = threading.Lock()
+        # sqlite3 is only imported if it is used, which keeps the startup of the program short
+        import sqlite3
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute("CREATE TABLE IF NOT EXISTS renders (key TEXT PRIMARY KEY, output BLOB NOT NULL, "
+                                     "used REAL NOT NULL DEFAULT 0)")
+            columns = [row[1] for row in self._connection.execute("PRAGMA table_info(renders)")]
+            if "used" not in columns:
+                # a database of an earlier version doesn't know when its entries were used
+                self._connection.execute("ALTER TABLE renders ADD COLUMN used REAL NOT NULL DEFAULT 0")
+
+    def get(self, key: str):
+        """Returns the data for the given key or None if there is none.
+
+        :param str key: the cache key
+        """
+        with self._lock:
+            row = self._connection.execute("SELECT output FROM renders WHERE key = ?", (key,)).fetchone()
+            if row is not None and self.max_bytes is not None:
+                with self._connection:
+                    self._connection.execute("UPDATE renders SET used = ? WHERE key = ?", (time.time(), key))
+        return row[0] if row is not None else None
+
+    def put(self, key: str, data: bytes):
+        """Stores the data under the given key and evicts the least recently used entries if there are too many.
+
+        :param str key: the cache key
+        :param bytes data: the data
+        """
+        with self._lock, self._connection:
+            replaced = 0
+            if self.max_bytes is not None:
+                # the bytes of an entry that is replaced don't count any longer
+                row = self._connection.execute("SELECT LENGTH(output) FROM renders WHERE key = ?", (key,)).fetchone()
+                replaced = row[0] if row is not None else 0
+            self._connection.execute("INSERT OR REPLACE INTO renders (key, output, used) VALUES (?, ?, ?)",
+                                     (key, data, time.time()))
+            if self.max_bytes is not None:
+                if self._bytes is not None:
+                    self._bytes += len(data) - replaced
+                if self._bytes is None or self._bytes > self.max_bytes:
+                    self._bytes = self._evict()
+
+    def close(self):
+        """Closes the database connection."""
+        with self._lock:
+            self._connection.close()
+
+    def _evict(self) -> int:
+        """Deletes the least recently used entries if the entries take more than the maximum and returns the bytes of
+        the remaining entries."""
+        total = self._connection.execute("SELECT COALESCE(SUM(LENGTH(output)), 0) FROM renders").fetchone()[0]
+        if total <= self.max_bytes:
+            return total
+        evicted = []
+        for key, size in self._connection.execute("SELECT key, LENGTH(output) FROM renders ORDER BY used"):
+            if total <= self.max_bytes * 3 // 4:
+                break
+            evicted.append((key,))
+            total -= size
+        self._connection.executemany("DELETE FROM renders WHERE key = ?", evicted)
+        return total
+
+
+def open_store(path: str, max_bytes: int = None):
+    """Opens the persistent store at the given path and returns it.
+
+    Paths ending in .sqlite, .sqlite3 or .db are opened as sqlite database, all other paths as directory.
+
+    :param str path: the path of the store
+    :param int max_bytes: the maximum number of bytes of the entries or None if the store grows without limit
+    """
+    if os.path.splitext(path)[1] in (".sqlite", ".sqlite3", ".db"):
+        return SqliteStore(path, max_bytes)
+    return DirectoryStore(path, max_bytes)
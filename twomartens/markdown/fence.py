@@ -0,0 +1,122 @@
+# coding=utf-8
+
+#   Copyright 2017 Jim Martens
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""markdown.fence: provides the matching of fenced code blocks, which both parser engines share
+
+A fenced code block starts with a line that begins with ``` (optionally followed by an info string, which is
+ignored) and ends with the next line that consists of ``` and optional spaces or tabs. The closing fence is found with
+a single search instead of matching the code line by line, so long code listings take linear time and no node per
+line.
+"""
+import re
+
+import modgrammar
+
+_EOL = modgrammar.util.EOL_CHARS
+_OPENING = re.compile("```[^`" + _EOL + "]*(?:\r\n|\n\r|\n|\r)")
+# the lookbehind follows the backticks, so that they are searched for first
+_CLOSING = re.compile("```(?<=[\n\r]```)[ \t]*(?:\r\n|\n\r|\n|\r)")
+_START = re.compile("```(?<![^\n\r]```)")
+_LINE_BREAK = re.compile("\r\n|\n\r|\r")
+# the last search for a closing fence as a tuple (text, pos, closing): the closing fence that follows any position
+# between pos and the start of closing (the end of the text if it is None) is the same, so that many fences without
+# a closing fence don't search the rest of the text again and again
+_last_search = (None, 0, None)
+
+
+def match(text: str, pos: int = 0) -> tuple:
+    """Matches a fenced code block at the given position and returns a tuple (end, code) or None if there is none.
+
+    The code consists of the lines between the fences, separated by \\n like the code of an indented code block.
+
+    :param str text: the text
+    :param int pos: the position, which must be the start of a line
+    """
+    opening = _OPENING.match(text, pos)
+    if opening is None:
+        return None
+    closing = _search_closing(text, opening.end())
+    if closing is None:
+        return None
+    return closing.end(), _code(text, opening.end(), closing.start())
+
+
+def find(text: str, pos: int = 0):
+    """Yields a tuple (start, end, code) for every fenced code block of the text from the given position on.
+
+    A line that begins with ``` but has no closing fence is no fenced code block and is skipped. Since no later line
+    can have a closing fence either, the search stops there.
+
+    :param str text: the text
+    :param int pos: the position, which must be the start of a line
+    """
+    while True:
+        start = _START.search(text, pos)
+        if start is None:
+            return
+        result = match(text, start.start())
+        if result is None:
+            if _OPENING.match(text, start.start()) is not None:
+                return
+            pos = start.end()
+            continue
+        end, code = result
+        yield start.start(), end, code
+        pos = end
+
+
+def is_opening(line: str) -> bool:
+    """Returns True if the line (with its line break) is the opening line of a fenced code block.
+
+    :param str line: the line
+    """
+    return _OPENING.fullmatch(line) is not None
+
+
+def is_closing(line: str) -> bool:
+    """Returns True if the line (with its line break) is the closing line of a fenced code block.
+
+    :param str line: the line
+    """
+    return _CLOSING.fullmatch("\n" + line, 1) is not None
+
+
+def _search_closing(text: str, pos: int):
+    """Returns the match of the first closing fence from the given position on or None if there is none.
+
+    :param str text: the text
+    :param int pos: the position
+    """
+    global _last_search
+    last_text, last_pos, closing = _last_search
+    if last_text is text and last_pos <= pos and (closing is None or pos <= closing.start()):
+        return closing
+    closing = _CLOSING.search(text, pos)
+    _last_search = (text, pos, closing)
+    return closing
+
+
+def _code(text: str, start: int, end: int) -> str:
+    """Returns the code between the fences with its line breaks replaced by \\n and without the last line break.
+
+    :param str text: the text
+    :param int start: the start of the first line of code
+    :param int end: the start of the closing fence
+    """
+    code = text[start:end]
+    if "\r" in code:
+        code = _LINE_BREAK.sub("\n", code)
+    return code[:-1]
@@ -15,106 +15,149 @@
 #   limitations under the License.
 
 """markdown.grammars: Contains the grammars for markdown."""
-import html
 import re
+import sys
 
 import modgrammar
 
+from . import fence
+
 grammar_whitespace_mode = "explicit"
 grammar_whitespace = modgrammar.WS_NOEOL
 
 
+def _defining_module(stack=None):
+    """Returns the module that defines the grammar that is being built.
+
+    modgrammar looks up the module of every anonymous grammar (e.g. REPEAT(...)) to read its whitespace settings.
+    The lookup extracts the stack of the caller including the source lines of every frame, which takes most of the
+    time needed to build the grammars. While the grammars below are built, this function replaces the lookup: it
+    recognizes the grammars of this module by the frame of their caller and leaves all other lookups to modgrammar,
+    so the lookup stays right even if a grammar can't be built and modgrammar doesn't get its own lookup back.
+
+    :param stack: the stack as modgrammar's lookup takes it or None
+    """
+    frame = sys._getframe(1)
+    while frame is not None and frame.f_code.co_filename in _MODGRAMMAR_FILES:
+        frame = frame.f_back
+    if stack is None and frame is not None and frame.f_globals is globals():
+        return sys.modules[__name__]
+    return _get_calling_module(stack)
+
+
+def _replace_module_lookup(lookup):
+    """Replaces modgrammar's lookup of the module that defines a grammar and returns the replaced lookup.
+
+    :param lookup: the new lookup
+    """
+    replaced = modgrammar.util.get_calling_module
+    modgrammar.util.get_calling_module = lookup
+    return replaced
+
+
+_MODGRAMMAR_FILES = (modgrammar.__file__, modgrammar.util.__file__)
+_get_calling_module = _replace_module_lookup(_defining_module)
+
+
+class BudgetedGrammar(modgrammar.Grammar):
+    """Charges a step to the budget in the session data (if there is one) for every attempt to match the grammar."""
+
+    @classmethod
+    def grammar_parse(cls, text, index, session):
+        """Charges a step and tries to match the grammar."""
+        budget = session.data.get("budget") if session.data else None
+        if budget is not None:
+            budget.charge()
+        return super().grammar_parse(text, index, session)
+
+
+class CountedGrammar(modgrammar.Grammar):
+    """Adds every match of a block to the tree counter in the session data (if there is one), which stops the parse
+    as soon as the grammar result exceeds the limits (see limits.TreeCounter)."""
+
+    @classmethod
+    def grammar_parse(cls, text, index, session):
+        """Tries to match the grammar and counts the nodes of every match."""
+        counter = session.data.get("counter") if session.data else None
+        if counter is None or counter.active:
+            # a block within another block is counted with the outer block
+            return super().grammar_parse(text, index, session)
+        return _count_matches(super().grammar_parse(text, index, session), index, counter)
+
+
+def _count_matches(results, index: int, counter):
+    """Passes the results of a grammar parse on and adds every match to the counter.
+
+    :param results: the generator of the grammar parse
+    :param int index: the start of the block
+    :param TreeCounter counter: the tree counter
+    """
+    sent = None
+    while True:
+        counter.active += 1
+        try:
+            count, result = results.send(sent)
+        except StopIteration:
+            return
+        finally:
+            counter.active -= 1
+        if count is not None and count is not False:
+            counter.add(index, result)
+        sent = yield count, result
+
+
 class SingleWhitespace(modgrammar.SPACE):
     """Defines the grammar for a single whitespace character"""
     grammar_max = 1
     regexp = re.compile('[^\S' + modgrammar.util.EOL_CHARS + '\t]')
 
 
-class SimpleText(modgrammar.Grammar):
+class SimpleText(BudgetedGrammar):
     """Defines the grammar for simple text."""
     grammar = (modgrammar.REPEAT(SingleWhitespace, min=0, max=3, collapse=True),
                modgrammar.WORD(startchars="^\s#>*[`", restchars="^*[<`" + modgrammar.util.EOL_CHARS, escapes=True,
                                fullmatch=True))
 
-    def grammar_elem_init(self, sessiondata):
-        """Saves the text for later use."""
-        spaces = ""
-        for elem in self.find_all(SingleWhitespace):
-            spaces += elem.string
-        self.text = spaces + self[1].string
-        self.tag = "text"
-
 
-class EmptyLine(modgrammar.Grammar):
+class EmptyLine(CountedGrammar, BudgetedGrammar):
     """Defines the grammar for an empty line."""
     grammar = (modgrammar.BOL, modgrammar.OPTIONAL(modgrammar.SPACE), modgrammar.EOL)
 
 
-class Heading(modgrammar.Grammar):
+class Heading(CountedGrammar):
     """Defines the grammar for a heading."""
     grammar = (modgrammar.BOL, modgrammar.REPEAT(modgrammar.L("#"), min=1, max=6),
                modgrammar.L(" "), modgrammar.REST_OF_LINE, modgrammar.EOL)
 
-    def grammar_elem_init(self, sessiondata):
-        """Saves the headline for later use."""
-        self.text = self[3].string
-        hashtags = self[1].string
-        self.tag = "h" + str(len(hashtags))
 
-
-class Bold(modgrammar.Grammar):
+class Bold(BudgetedGrammar):
     """Defines the grammar for bold text."""
     grammar = (modgrammar.L("**"), modgrammar.WORD("^*" + modgrammar.util.EOL_CHARS, fullmatch=True),
                modgrammar.L("**"))
 
-    def grammar_elem_init(self, sessiondata):
-        """Saves the text for later use."""
-        self.text = self[1].string
-        self.tag = "b"
-
 
-class Italic(modgrammar.Grammar):
+class Italic(BudgetedGrammar):
     """Defines the grammar for italic text."""
     grammar = (modgrammar.L("*"), modgrammar.WORD("^*" + modgrammar.util.EOL_CHARS, fullmatch=True), modgrammar.L("*"))
 
-    def grammar_elem_init(self, sessiondata):
-        """Saves the text for later use."""
-        self.text = self[1].string
-        self.tag = "i"
-
 
-class InlineCode(modgrammar.Grammar):
+class InlineCode(BudgetedGrammar):
     """Defines the grammar for inline code segments."""
     grammar = (modgrammar.L("`"), modgrammar.WORD("^`" + modgrammar.util.EOL_CHARS, fullmatch=True), modgrammar.L("`"))
 
-    def grammar_elem_init(self, sessiondata):
-        """Saves the text for later use."""
-        self.text = html.escape(self[1].string)
-        self.tag = "code"
-
 
 class LinkTitle(modgrammar.Grammar):
     """Defines the grammar for a link title."""
     grammar = (modgrammar.WORD(startchars='^")' + modgrammar.util.EOL_CHARS, escapes=True, fullmatch=True))
 
-    def grammar_elem_init(self, sessiondata):
-        """Saves the text for later use."""
-        self.text = self[0].string
-
 
-class AutomaticLink(modgrammar.Grammar):
+class AutomaticLink(BudgetedGrammar):
     """Defines the grammar for an automatic link."""
     grammar = (modgrammar.L("<"), modgrammar.WORD(startchars="^[>\s`*", escapes=True, fullmatch=True),
                modgrammar.L(">"))
 
-    def grammar_elem_init(self, sessiondata):
-        """Saves the text for later use."""
-        self.text = self[1].string
-        self.attributes = {"href": self[1].string}
-        self.tag = "a"
 
-
-class Link(modgrammar.Grammar):
+class Link(BudgetedGrammar):
     """Defines the grammar for a link."""
     grammar = (modgrammar.L("["), modgrammar.WORD(startchars="^]`*" + modgrammar.util.EOL_CHARS, fullmatch=True),
                modgrammar.L("]("), modgrammar.WORD(startchars="^\s)", escapes=True, fullmatch=True),
@@ -123,15 +166,6 @@ class Link(modgrammar.Grammar):
                                    modgrammar.L('"')),
                modgrammar.L(")"))
 
-    def grammar_elem_init(self, sessiondata):
-        """Saves the text for later use."""
-        self.text = self[1].string
-        self.attributes = {"href": self[3].string}
-        link_title = self.find(LinkTitle)
-        if link_title is not None:
-            self.attributes["title"] = link_title.text
-        self.tag = "a"
-
 
 class QuoteLine(modgrammar.Grammar):
     """Defines the grammar for a single line quote."""
@@ -143,33 +177,10 @@ class QuoteLine(modgrammar.Grammar):
     grammar_collapse = False
 
 
-class Quote(modgrammar.Grammar):
+class Quote(CountedGrammar):
     """Defines the grammar for a quote."""
     grammar = (modgrammar.REPEAT(QuoteLine, min=1, collapse=True))
 
-    def grammar_elem_init(self, sessiondata):
-        """Saves the text for later use and appends a space to each SimpleText that is followed by an EOL character."""
-        self.tag = "quote"
-        self.options = {"onlyOuterLinebreaks": True}
-        highest_index = len(self.elements) - 1
-        current_index = -1
-        add_space_at_start = False
-        for elem in self.elements:
-            current_index += 1
-            _length = len(elem.elements)
-            _eol_index = _length - 1
-            _first_content_index = 2
-            _last_content_index = _eol_index - 1
-            if add_space_at_start and elem[_first_content_index].grammar_name == "SimpleText":
-                elem[_first_content_index].text = " " + elem[_first_content_index].text
-                add_space_at_start = False
-            if current_index < highest_index:
-                if elem[_last_content_index].grammar_name == "SimpleText":
-                    text = elem[_last_content_index].text.rstrip()
-                    elem[_last_content_index].text = text + " "
-                else:
-                    add_space_at_start = True
-
 
 class UnorderedListItem(modgrammar.Grammar):
     """Defines the grammar for an unordered list item."""
@@ -177,19 +188,11 @@ class UnorderedListItem(modgrammar.Grammar):
                modgrammar.REPEAT(modgrammar.OR(Bold, Italic, InlineCode, Link, AutomaticLink, SimpleText),
                                  collapse=True))
 
-    def grammar_elem_init(self, sessiondata):
-        """Saves the text for later use."""
-        self.tag = "li"
 
-
-class UnorderedList(modgrammar.Grammar):
+class UnorderedList(CountedGrammar):
     """Defines the grammar for an unordered list."""
     grammar = (EmptyLine, modgrammar.LIST_OF(UnorderedListItem, sep=modgrammar.EOL, collapse=True), modgrammar.EOL)
 
-    def grammar_elem_init(self, sessiondata):
-        """Saves the text for later use."""
-        self.tag = "unordered_list"
-
 
 class OrderedListItem(modgrammar.Grammar):
     """Defines the grammar for an unordered list item."""
@@ -197,19 +200,11 @@ class OrderedListItem(modgrammar.Grammar):
                modgrammar.L(". "), modgrammar.REPEAT(modgrammar.OR(Bold, Italic, InlineCode, Link, AutomaticLink,
                                                                    SimpleText), collapse=True))
 
-    def grammar_elem_init(self, sessiondata):
-        """Saves the text for later use."""
-        self.tag = "li"
 
-
-class OrderedList(modgrammar.Grammar):
+class OrderedList(CountedGrammar):
     """Defines the grammar for an unordered list."""
     grammar = (EmptyLine, modgrammar.LIST_OF(OrderedListItem, sep=modgrammar.EOL, collapse=True), modgrammar.EOL)
 
-    def grammar_elem_init(self, sessiondata):
-        """Saves the text for later use."""
-        self.tag = "ordered_list"
-
 
 class CodeBlock(modgrammar.Grammar):
     """Defines the grammar for a code block."""
@@ -217,26 +212,39 @@ class CodeBlock(modgrammar.Grammar):
                                  modgrammar.REST_OF_LINE,
                                  modgrammar.EOL, collapse=True))
 
-    def grammar_elem_init(self, sessiondata):
-        """Saves the text for later use."""
-        self.tag = "code"
-        text = ""
-        for elem in self.find_all(modgrammar.REST_OF_LINE):
-            if text != "":
-                text += "\n"
-            text += html.escape(elem.string)
-        self.text = text
-        self.options = {"indentation": False}
-
 
-class PreBlock(modgrammar.Grammar):
+class PreBlock(CountedGrammar):
     """Defines the grammar for a pre block."""
     grammar = (modgrammar.OPTIONAL(EmptyLine), CodeBlock, modgrammar.OPTIONAL(EmptyLine))
 
-    def grammar_elem_init(self, sessiondata):
-        """Saves the text for later use."""
-        self.tag = "pre"
-        self.options = {"indentation": False}
+
+class FencedCode(modgrammar.Terminal):
+    """Defines the grammar for the fences and the code of a fenced code block, which fence.match finds at once."""
+    grammar_whitespace_mode = "explicit"
+    grammar_whitespace = None
+    grammar = ()
+    grammar_desc = "fenced code block"
+
+    @classmethod
+    def grammar_parse(cls, text, index, session):
+        """Matches the fenced code block and keeps its code, so that the lines aren't matched one by one."""
+        while True:
+            result = fence.match(text.string, index)
+            if result is not None or text.eof:
+                break
+            # the closing fence may be in the text that is still to come
+            text = yield (None, None)
+        if result is not None:
+            end, code = result
+            elem = cls(text.string, index, end)
+            elem.code = code
+            yield (end - index, elem)
+        yield modgrammar.util.error_result(index, cls)
+
+
+class FencedBlock(CountedGrammar, BudgetedGrammar):
+    """Defines the grammar for a fenced code block."""
+    grammar = (modgrammar.BOL, FencedCode)
 
 
 class Text(modgrammar.Grammar):
@@ -246,43 +254,16 @@ class Text(modgrammar.Grammar):
         modgrammar.REPEAT(modgrammar.OR(Bold, Italic, InlineCode, Link, AutomaticLink, SimpleText), collapse=True),
         modgrammar.EOL, collapse=True))
 
-    def grammar_elem_init(self, sessiondata):
-        """Appends a space to each SimpleText that is followed by an EOL character."""
-        highest_index = len(self.elements) - 1
-        current_index = -1
-        add_space_at_start = False
-        for elem in self.elements:
-            current_index += 1
-            _length = len(elem.elements)
-            _eol_index = _length - 1
-            _first_content_index = 1
-            _last_content_index = _eol_index - 1
-            if add_space_at_start and elem[_first_content_index].grammar_name == "SimpleText":
-                elem[_first_content_index].text = " " + elem[_first_content_index].text
-                add_space_at_start = False
-            if current_index < highest_index:
-                if elem[_last_content_index].grammar_name == "SimpleText":
-                    text = elem[_last_content_index].text.rstrip()
-                    elem[_last_content_index].text = text + " "
-                else:
-                    add_space_at_start = True
-
-
-class Paragraph(modgrammar.Grammar):
+
+class Paragraph(CountedGrammar):
     """Defines the grammar for a paragraph."""
     grammar = (modgrammar.OPTIONAL(EmptyLine), Text, modgrammar.OPTIONAL(EmptyLine))
 
-    def grammar_elem_init(self, sessiondata):
-        """Saves the text for later use."""
-        self.tag = "p"
-        self.options = {"onlyOuterLinebreaks": True}
-
 
 class MarkdownGrammar(modgrammar.Grammar):
     """Provides the grammar for Markdown."""
     grammar = (modgrammar.REPEAT(modgrammar.OR(Heading, UnorderedList, OrderedList, Quote, Paragraph,
-                                               EmptyLine, PreBlock), collapse=True))
+                                               EmptyLine, PreBlock, FencedBlock), collapse=True))
+
 
-    def grammar_elem_init(self, sessiondata):
-        """Saves the text for later use."""
-        self.content = self[0].string
+_replace_module_lookup(_get_calling_module)
@@ -0,0 +1,273 @@
+# coding=utf-8
+
+#   Copyright 2017 Jim Martens
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""markdown.incremental: provides incremental parsing of edited texts"""
+import bisect
+import copy
+
+import modgrammar
+
+from .index import Anchors, slug
+from .nodes import Document, Heading
+from .renderer import Renderer
+from .scanner import split
+from .transform import transform_block
+
+
+class Change:
+    """Describes how the blocks of the output change after an edit.
+
+    The removed blocks starting at the index start are replaced by the new blocks. The title is the text of the first
+    heading after the edit and the error is the first parse error in the re-parsed part of the text, if any.
+    """
+    __slots__ = ("start", "removed", "blocks", "title", "error")
+
+    def __init__(self, start: int, removed: int, blocks: list, title: str, error: modgrammar.ParseError):
+        """Initializes the change.
+
+        :param int start: the index of the first changed block
+        :param int removed: the number of old blocks that are replaced
+        :param list blocks: the output of the new blocks
+        :param str title: the title of the document or None if it has no heading
+        :param modgrammar.ParseError error: the first parse error in the re-parsed part or None
+        """
+        self.start = start
+        self.removed = removed
+        self.blocks = blocks
+        self.title = title
+        self.error = error
+
+
+class IncrementalDocument:
+    """Keeps a parsed text and re-parses only the part of the text around an edit.
+
+    The text is split into chunks at block boundaries that every match of the grammar passes through (see
+    scanner.split). Every chunk is parsed on its own. An edit re-splits the text from the chunk before the edit until
+    a boundary of the old chunks after the edit is met again, so only these chunks are parsed again and the rest is
+    reused. A chunk that fails to parse is kept without blocks until it is edited again. Its error is kept relative to
+    the chunk and moved to the position of the chunk when it is raised.
+
+    If the renderer adds anchors, the headings get the anchors they would get in the whole text. An edit can change
+    the anchors of the headings after it, whose blocks are then part of the change. Every chunk keeps the slugs and
+    anchors of its headings, so the anchors before an edit are taken again without computing the slugs.
+    """
+
+    def __init__(self, text: str = "", renderer: Renderer = None):
+        """Initializes the document and parses the text.
+
+        :param str text: the input text
+        :param Renderer renderer: the renderer that parses the chunks and defines the output format
+        """
+        self.renderer = renderer if renderer is not None else Renderer()
+        self.text = ""
+        # the offset, the tuple (document, error), the number of blocks, the number of lines and the tuples
+        # (slug, anchor) of the headings of every chunk
+        self._starts = []
+        self._chunks = []
+        self._counts = []
+        self._lines = []
+        self._anchors = []
+        self.edit(0, 0, text)
+
+    @property
+    def document(self) -> Document:
+        """The document of the whole text. Chunks that failed to parse have no blocks."""
+        return Document(_blocks(self._chunks))
+
+    def render(self) -> str:
+        """Returns the output for the whole text like Renderer.render.
+
+        :raises modgrammar.ParseError: if a part of the text is no valid markdown
+        """
+        for index, (_document, error) in enumerate(self._chunks):
+            if error is not None:
+                raise _rebase(error, self._starts[index], sum(self._lines[:index]))
+        return self.renderer.transform(self.document)
+
+    def edit(self, offset: int, deleted: int, inserted: str) -> Change:
+        """Applies an edit to the text, parses the affected chunks again and returns the change of the blocks.
+
+        :param int offset: the offset of the edit in the text
+        :param int deleted: the number of deleted characters at the offset
+        :param str inserted: the inserted text
+        """
+        if offset < 0 or deleted < 0 or offset + deleted > len(self.text):
+            raise ValueError("the edit is outside of the text")
+        text = self.text[:offset] + inserted + self.text[offset + deleted:]
+        delta = len(inserted) - deleted
+
+        # the chunk before the edit is kept as it is but its end may move
+        first = max(bisect.bisect_right(self._starts, offset) - 2, 0)
+        last = len(self._starts)
+        pos = self._starts[first] if last else 0
+        line = sum(self._lines[:first])
+        starts = []
+        chunks = []
+        lines = []
+        error = None
+        for _line, chunk in split(text, pos):
+            end = pos + len(chunk)
+            index = first + len(chunks)
+            if end <= offset and index < last and self._starts[index] == pos and self._end(index) == end:
+                chunks.append(self._chunks[index])
+                lines.append(self._lines[index])
+            else:
+                chunks.append(self._parse(chunk))
+                lines.append(len(modgrammar.util.EOL_RE.findall(chunk)))
+                if error is None and chunks[-1][1] is not None:
+                    error = _rebase(chunks[-1][1], pos, line)
+            starts.append(pos)
+            pos = end
+            line += lines[-1]
+            if end - delta >= offset + deleted:
+                # the old chunks after the edit are reused from the first one that starts at a new boundary
+                reused = bisect.bisect_left(self._starts, end - delta)
+                if reused < last and self._starts[reused] == end - delta:
+                    break
+        else:
+            reused = last
+
+        counts = [len(document.blocks) if document is not None else 0 for document, _error in chunks]
+        old_blocks = _blocks(self._chunks[first:reused])
+        new_blocks = _blocks(chunks)
+        if self.renderer.anchors:
+            anchors, tail = self._add_anchors(first, chunks, reused)
+        else:
+            anchors, tail = [()] * len(chunks), []
+        # the blocks that are equal at both ends of the re-parsed part are not reported as changed
+        same = 0
+        while same < min(len(old_blocks), len(new_blocks)) and old_blocks[same] == new_blocks[same]:
+            same += 1
+        same_end = 0
+        while (same_end < min(len(old_blocks), len(new_blocks)) - same
+               and old_blocks[-1 - same_end] == new_blocks[-1 - same_end]):
+            same_end += 1
+        if tail:
+            # the change reaches up to the last heading after the re-parsed part whose anchor changed
+            old_blocks += tail
+            new_blocks += tail
+            same_end = 0
+        start = sum(self._counts[:first]) + same
+        removed = len(old_blocks) - same - same_end
+        blocks = [transform_block(block, self.renderer.output_format)
+                  for block in new_blocks[same:len(new_blocks) - same_end]]
+
+        self.text = text
+        self._starts[first:] = starts + [chunk_start + delta for chunk_start in self._starts[reused:]]
+        self._chunks[first:reused] = chunks
+        self._counts[first:reused] = counts
+        self._lines[first:reused] = lines
+        self._anchors[first:reused] = anchors
+        return Change(start, removed, blocks, self._title(), error)
+
+    def _add_anchors(self, first: int, chunks: list, reused: int) -> tuple:
+        """Sets the anchors of the headings in the new chunks and after them and returns a tuple (anchors, tail).
+
+        The anchors are the tuples (slug, anchor) of the headings of every new chunk and the tail are the blocks
+        after the new chunks up to the last heading whose anchor changed.
+
+        :param int first: the index of the first replaced chunk
+        :param list chunks: the tuples (document, error) of the new chunks
+        :param int reused: the index of the first old chunk after the new chunks
+        """
+        # the anchors of the chunks before the edit stay the same
+        anchors = Anchors()
+        for headings in self._anchors[:first]:
+            for base, anchor in headings:
+                anchors.restore(base, anchor)
+        new_anchors = []
+        for document, _error in chunks:
+            headings = []
+            if document is not None:
+                for block in document.blocks:
+                    if type(block) is Heading:
+                        base = slug(block.text)
+                        block.anchor = anchors.take(base)
+                        headings.append((base, block.anchor))
+            new_anchors.append(tuple(headings))
+        if new_anchors == self._anchors[first:reused]:
+            # the new chunks took the same anchors as the old ones, so the headings after them keep theirs
+            return new_anchors, []
+        # the index of the chunk and the number of its blocks up to the last heading whose anchor changed
+        changed = (reused, 0)
+        for index in range(reused, len(self._chunks)):
+            if not self._anchors[index]:
+                continue
+            headings = iter(self._anchors[index])
+            updated = []
+            for number, block in enumerate(self._chunks[index][0].blocks):
+                if type(block) is Heading:
+                    base = next(headings)[0]
+                    anchor = anchors.take(base)
+                    if anchor != block.anchor:
+                        block.anchor = anchor
+                        changed = (index, number + 1)
+                    updated.append((base, anchor))
+            self._anchors[index] = tuple(updated)
+        index, number = changed
+        tail = _blocks(self._chunks[reused:index])
+        if number:
+            tail += self._chunks[index][0].blocks[:number]
+        return new_anchors, tail
+
+    def _end(self, index: int) -> int:
+        """Returns the offset after the chunk with the given index in the current text.
+
+        :param int index: the index of the chunk
+        """
+        return self._starts[index + 1] if index + 1 < len(self._starts) else len(self.text)
+
+    def _parse(self, chunk: str) -> tuple:
+        """Parses a chunk and returns a tuple (document, error) of which one is None.
+
+        The position of the error is relative to the chunk.
+
+        :param str chunk: the text of the chunk
+        """
+        try:
+            return self.renderer.parse(chunk), None
+        except modgrammar.ParseError as pe:
+            return None, pe
+
+    def _title(self) -> str:
+        """Returns the text of the first heading or None if there is none."""
+        for document, _error in self._chunks:
+            if document is not None:
+                heading = document.find(Heading)
+                if heading is not None:
+                    return heading.text
+        return None
+
+
+def _blocks(chunks: list) -> list:
+    """Returns the blocks of all chunks that could be parsed.
+
+    :param list chunks: the tuples (document, error) of the chunks
+    """
+    return [block for document, _error in chunks if document is not None for block in document.blocks]
+
+
+def _rebase(error: modgrammar.ParseError, pos: int, line: int) -> modgrammar.ParseError:
+    """Returns a copy of the parse error of a chunk with its position moved to the position of the chunk in the text.
+
+    :param modgrammar.ParseError error: the parse error with a position relative to the chunk
+    :param int pos: the offset of the chunk in the text
+    :param int line: the index of the first line of the chunk in the text
+    """
+    error = copy.copy(error)
+    error.line = error.line + line if error.line is not None else None
+    error.char += pos
+    return error
@@ -0,0 +1,178 @@
+# coding=utf-8
+
+#   Copyright 2017 Jim Martens
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""markdown.inline: provides a tokenizer for the inline content of a line
+
+The tokenizer looks up the alternatives for the character at the current position in a delimiter table and tries
+them in the order of OR(Bold, Italic, InlineCode, Link, AutomaticLink, SimpleText). A position from which the rest
+of the line can't be matched is remembered, so every position is tried at most once.
+"""
+import bisect
+import re
+
+import modgrammar
+
+from .nodes import Code, Emphasis, Link, Strong, Text
+
+_EOL = modgrammar.util.EOL_CHARS
+_BOLD = re.compile("\\*\\*([^*" + _EOL + "]+)\\*\\*")
+_ITALIC = re.compile("\\*([^*" + _EOL + "]+)\\*")
+_INLINE_CODE = re.compile("`([^`" + _EOL + "]+)`")
+_LINK = re.compile("\\[([^\\]`*" + _EOL + "]+)\\]\\(([^\\s)]+)(?: \"([^\")" + _EOL + "]+)\")?\\)")
+_AUTOMATIC_LINK_STOP = re.compile("[\\[>\\s`*]")
+_SIMPLE_TEXT = re.compile("([^\\S\t" + _EOL + "]{0,3})([^\\s#>*\\[`][^*\\[<`" + _EOL + "]*)")
+
+
+def _bold(text: str, pos: int):
+    """Matches bold text at the given position."""
+    match = _BOLD.match(text, pos)
+    if match is None:
+        return None
+    return Strong(match.group(1)), match.end()
+
+
+def _italic(text: str, pos: int):
+    """Matches italic text at the given position."""
+    match = _ITALIC.match(text, pos)
+    if match is None:
+        return None
+    return Emphasis(match.group(1)), match.end()
+
+
+def _inline_code(text: str, pos: int):
+    """Matches an inline code segment at the given position."""
+    match = _INLINE_CODE.match(text, pos)
+    if match is None:
+        return None
+    return Code(match.group(1)), match.end()
+
+
+def _link(text: str, pos: int):
+    """Matches a link at the given position."""
+    match = _LINK.match(text, pos)
+    if match is None:
+        return None
+    return Link(match.group(1), match.group(2), match.group(3)), match.end()
+
+
+class _AutomaticLinks:
+    """Matches automatic links in one text.
+
+    The address of an automatic link runs up to the next character it can't contain, which is the same for every <
+    before it. These stops are searched once per text, so that a long run of < doesn't scan the rest of the line
+    again for every <.
+    """
+    __slots__ = ("_stops",)
+
+    def __init__(self, text: str):
+        """Searches the stops in the given text.
+
+        :param str text: the text
+        """
+        self._stops = [match.start() for match in _AUTOMATIC_LINK_STOP.finditer(text)]
+
+    def __call__(self, text: str, pos: int):
+        """Matches an automatic link at the given position."""
+        index = bisect.bisect_right(self._stops, pos)
+        if index == len(self._stops):
+            return None
+        stop = self._stops[index]
+        if stop == pos + 1 or text[stop] != ">":
+            return None
+        return Link(text[pos + 1:stop], text[pos + 1:stop]), stop + 1
+
+
+def _simple_text(text: str, pos: int):
+    """Matches simple text at the given position."""
+    match = _SIMPLE_TEXT.match(text, pos)
+    if match is None:
+        return None
+    spaces = match.group(1)
+    # SimpleText takes its text from its second element, which is the second whitespace if there are two or three
+    word = match.group(2) if len(spaces) < 2 else spaces[1]
+    return Text(spaces + word), match.end()
+
+
+_SIMPLE = (_simple_text,)
+_DELIMITERS = {
+    "*": (_bold, _italic),
+    "`": (_inline_code,),
+    "[": (_link,),
+}
+
+
+def tokenize(text: str):
+    """Tokenizes the inline content of a line and returns the list of inline nodes or None if it doesn't match.
+
+    :param str text: the inline content without the line break
+    """
+    end = len(text)
+    if end == 0:
+        return None
+
+    delimiters = _DELIMITERS
+    if "<" in text:
+        delimiters = dict(_DELIMITERS)
+        delimiters["<"] = (_AutomaticLinks(text), _simple_text)
+    failed = set()
+    tokens = []
+    pos = 0
+    alternative = 0
+    while pos < end:
+        matchers = delimiters.get(text[pos], _SIMPLE)
+        result = None
+        if pos not in failed:
+            while result is None and alternative < len(matchers):
+                result = matchers[alternative](text, pos)
+                alternative += 1
+        if result is not None:
+            node, next_pos = result
+            tokens.append((pos, alternative, node))
+            pos = next_pos
+            alternative = 0
+            continue
+
+        # no alternative left at this position, go back to the previous token
+        failed.add(pos)
+        if not tokens:
+            return None
+        pos, alternative, node = tokens.pop()
+
+    return [node for pos, alternative, node in tokens]
+
+
+def find_links(text: str) -> list:
+    """Returns the links of the inline content of a line as tokenize finds them (an empty list if it doesn't match).
+
+    Without emphasis, code and automatic links every [ of a matching line starts a link and the text between the
+    links is simple text, so the line is matched without backtracking and without the nodes of the text. Other lines
+    are tokenized.
+
+    :param str text: the inline content without the line break
+    """
+    if "*" in text or "`" in text or "<" in text:
+        return [node for node in tokenize(text) or () if type(node) is Link]
+    links = []
+    pos = 0
+    end = len(text)
+    while pos < end:
+        match = (_LINK if text[pos] == "[" else _SIMPLE_TEXT).match(text, pos)
+        if match is None:
+            return []
+        if text[pos] == "[":
+            links.append(Link(*match.groups()))
+        pos = match.end()
+    return links
@@ -0,0 +1,209 @@
+# coding=utf-8
+
+#   Copyright 2017 Jim Martens
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""markdown.instrumentation: provides measurements of the render pipeline
+
+A renderer with an instrumentation reports the wall and CPU time of every stage (cache, parse, convert, transform and
+fallback), the number of nodes of the grammar result and the document tree, the sizes of input and output and the
+approximate memory of every render (see limits.Usage). The nodes are counted once the parse is done, so counting them
+isn't part of the parse stage. With node or depth limits the grammar result is also counted while it is parsed (see
+limits.TreeCounter), which is part of the parse stage. Without an instrumentation the renderer doesn't measure
+anything.
+"""
+import cProfile
+import io
+import time
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+
+import modgrammar
+
+from .limits import Usage
+from .nodes import Document
+
+
+class Instrumentation:
+    """Receives the measurements of a renderer. All methods do nothing.
+
+    Subclasses override the methods they need, for example to send the measurements to a metrics system.
+    """
+
+    def stage(self, name: str, wall: float, cpu: float):
+        """Receives the time of one stage of the pipeline.
+
+        :param str name: the name of the stage (cache, parse, convert, transform or fallback)
+        :param float wall: the wall time in seconds
+        :param float cpu: the CPU time of the process in seconds
+        """
+        pass
+
+    def nodes(self, tree: str, counts: map):
+        """Receives the number of nodes per class of a parsed tree.
+
+        :param str tree: the kind of tree (grammar for the grammar result, document for the document tree)
+        :param map counts: the number of nodes per class name
+        """
+        pass
+
+    def sizes(self, input_size: int, output_size: int):
+        """Receives the sizes of a rendered text.
+
+        :param int input_size: the number of characters of the input
+        :param int output_size: the number of characters of the output
+        """
+        pass
+
+    def memory(self, usage: Usage):
+        """Receives the approximate memory of a rendered text.
+
+        :param Usage usage: the usage of the render
+        """
+        pass
+
+    def profiler(self):
+        """Returns a cProfile.Profile that is enabled while a text is rendered or None."""
+        return None
+
+
+class Profile(Instrumentation):
+    """Collects the measurements of all rendered texts and formats a breakdown of them."""
+
+    def __init__(self, functions: int = 0):
+        """Initializes the profile.
+
+        :param int functions: the number of functions listed from cProfile, cProfile isn't used if this is 0
+        """
+        self.functions = functions
+        self.stages = OrderedDict()
+        self.counts = {"grammar": Counter(), "document": Counter()}
+        self.input_size = 0
+        self.output_size = 0
+        self.largest = None
+        self._profiler = cProfile.Profile() if functions else None
+
+    def stage(self, name: str, wall: float, cpu: float):
+        """Adds the time to the stage.
+
+        :param str name: the name of the stage
+        :param float wall: the wall time in seconds
+        :param float cpu: the CPU time of the process in seconds
+        """
+        calls, total_wall, total_cpu = self.stages.get(name, (0, 0.0, 0.0))
+        self.stages[name] = (calls + 1, total_wall + wall, total_cpu + cpu)
+
+    def nodes(self, tree: str, counts: map):
+        """Adds the node counts of the tree.
+
+        :param str tree: the kind of tree
+        :param map counts: the number of nodes per class name
+        """
+        self.counts[tree].update(counts)
+
+    def sizes(self, input_size: int, output_size: int):
+        """Adds the sizes.
+
+        :param int input_size: the number of characters of the input
+        :param int output_size: the number of characters of the output
+        """
+        self.input_size += input_size
+        self.output_size += output_size
+
+    def memory(self, usage: Usage):
+        """Keeps the usage if it is the largest so far.
+
+        :param Usage usage: the usage of the render
+        """
+        if self.largest is None or usage.total_bytes > self.largest.total_bytes:
+            self.largest = usage
+
+    def profiler(self):
+        """Returns the cProfile.Profile if functions are listed."""
+        return self._profiler
+
+    def report(self) -> str:
+        """Returns the breakdown as text."""
+        # the names are padded to the longest one, so that the columns line up
+        width = max([len("stage")] + [len(name) for name in self.stages])
+        lines = ["{:<{}} {:>8} {:>12} {:>12} {:>7}".format("stage", width, "calls", "wall ms", "cpu ms", "share")]
+        total = sum(wall for _calls, wall, _cpu in self.stages.values()) or 1.0
+        for name, (calls, wall, cpu) in self.stages.items():
+            lines.append("{:<{}} {:>8} {:>12.3f} {:>12.3f} {:>7.1%}".format(name, width, calls, wall * 1000,
+                                                                            cpu * 1000, wall / total))
+        lines.append("input {} characters, output {} characters".format(self.input_size, self.output_size))
+        if self.largest is not None:
+            largest = self.largest
+            lines.append("largest render {} bytes: input {}, grammar result {}, document {}, output {} bytes, "
+                         "{} nodes, depth {}".format(largest.total_bytes, largest.input_bytes, largest.grammar_bytes,
+                                                     largest.document_bytes, largest.output_bytes, largest.nodes,
+                                                     largest.depth))
+        counted = [tree for tree in ("grammar", "document") if self.counts[tree]]
+        width = max([len(name) for tree in counted for name in self.counts[tree]] or [0])
+        for tree in counted:
+            lines.append("{} nodes: {}".format(tree, sum(self.counts[tree].values())))
+            lines.extend("    {:<{}} {:>10}".format(name, width, count)
+                         for name, count in self.counts[tree].most_common())
+        if self._profiler is not None:
+            # pstats takes long to import and is only needed here
+            import pstats
+            stream = io.StringIO()
+            stats = pstats.Stats(self._profiler, stream=stream)
+            stats.sort_stats("cumulative").print_stats(self.functions)
+            lines.append(stream.getvalue().rstrip())
+        return "\n".join(lines)
+
+
+@contextmanager
+def measure(instrumentation: Instrumentation, name: str):
+    """Measures the wall and CPU time of the enclosed code and reports it as stage.
+
+    :param Instrumentation instrumentation: the instrumentation
+    :param str name: the name of the stage
+    """
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    try:
+        yield
+    finally:
+        instrumentation.stage(name, time.perf_counter() - wall, time.process_time() - cpu)
+
+
+def count_grammar_nodes(result: modgrammar.Grammar) -> Counter:
+    """Returns the number of nodes per grammar class of a grammar result.
+
+    :param modgrammar.Grammar result: the grammar result
+    """
+    counts = Counter()
+    pending = [result] if result is not None else []
+    while pending:
+        elem = pending.pop()
+        counts[elem.grammar_name] += 1
+        pending.extend(child for child in elem.elements if child is not None)
+    return counts
+
+
+def count_nodes(document: Document) -> Counter:
+    """Returns the number of nodes per node class of a document tree.
+
+    :param Document document: the document
+    """
+    counts = Counter()
+    pending = [document]
+    while pending:
+        node = pending.pop()
+        counts[type(node).__name__] += 1
+        for name in ("blocks", "items", "children"):
+            pending.extend(getattr(node, name, ()))
+    return counts
@@ -0,0 +1,287 @@
+# coding=utf-8
+
+#   Copyright 2017 Jim Martens
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""markdown.limits: provides the memory accounting and the limits of a render
+
+A render holds the input text, the grammar result (only with the grammar engine), the document tree and the output.
+Usage sums the approximate bytes of each of them with sys.getsizeof. Limits stop a render as soon as one of these
+sizes is known to be too large: the input before the parse, the grammar result while it is parsed, the document
+tree before it is transformed and the output before its pieces are joined.
+"""
+import bisect
+import sys
+
+import modgrammar
+
+_EMPTY_STRING = sys.getsizeof("")
+# the trees and the output are stopped as soon as they exceed their limit, so only the input has its full size
+_MESSAGES = {
+    "input_bytes": "the input takes {value} bytes, at most {maximum} are allowed",
+    "nodes": "the parse trees have more than {maximum} nodes",
+    "depth": "the parse trees are more than {maximum} levels deep",
+    "output_bytes": "the output takes more than {maximum} bytes",
+}
+
+
+class LimitExceeded(Exception):
+    """Raised if a render exceeds one of its limits."""
+
+    def __init__(self, message: str, limit: str = None, usage=None):
+        """Initializes the error.
+
+        :param str message: the message
+        :param str limit: the name of the limit (input_bytes, nodes, depth or output_bytes)
+        :param Usage usage: the usage of the render up to the point at which it was stopped
+        """
+        super().__init__(message)
+        self.limit = limit
+        self.usage = usage
+
+
+class Limits:
+    """The maximum sizes of a render. A size that is None isn't limited.
+
+    The nodes are those of the grammar result and of the document tree together, since both are held while the
+    result is converted. The depth is the one of the deeper tree.
+    """
+    __slots__ = ("input_bytes", "nodes", "depth", "output_bytes")
+
+    def __init__(self, input_bytes: int = None, nodes: int = None, depth: int = None, output_bytes: int = None):
+        """Initializes the limits.
+
+        :param int input_bytes: the maximum bytes of the input text
+        :param int nodes: the maximum number of nodes of the parse trees
+        :param int depth: the maximum depth of the parse trees
+        :param int output_bytes: the maximum bytes of the output
+        """
+        self.input_bytes = input_bytes
+        self.nodes = nodes
+        self.depth = depth
+        self.output_bytes = output_bytes
+
+    def __eq__(self, other):
+        return type(self) is type(other) and all(getattr(self, name) == getattr(other, name)
+                                                 for name in self.__slots__)
+
+    def check(self, limit: str, value: int, usage):
+        """Checks the given value against the limit of the given name.
+
+        :param str limit: the name of the limit
+        :param int value: the value
+        :param Usage usage: the usage of the render
+        :raises LimitExceeded: if the value exceeds the limit
+        """
+        maximum = getattr(self, limit)
+        if maximum is not None and value > maximum:
+            raise LimitExceeded(_MESSAGES[limit].format(value=value, maximum=maximum), limit, usage)
+
+
+class Usage:
+    """The approximate bytes held by one render and the size of its parse trees.
+
+    The bytes of a tree are those of its node objects with their attributes, tuples, lists and strings. A string that
+    several nodes refer to is counted for each of them, so the bytes are rather too high than too low. A text that is
+    parsed in chunks sums the sizes of all chunks, although only one chunk is held at a time.
+    """
+    __slots__ = ("input_bytes", "grammar_bytes", "document_bytes", "output_bytes", "nodes", "depth")
+
+    def __init__(self):
+        """Initializes the usage of a render that hasn't started."""
+        self.input_bytes = 0
+        self.grammar_bytes = 0
+        self.document_bytes = 0
+        self.output_bytes = 0
+        self.nodes = 0
+        self.depth = 0
+
+    @property
+    def total_bytes(self) -> int:
+        """Returns the bytes of the input, both trees and the output together."""
+        return self.input_bytes + self.grammar_bytes + self.document_bytes + self.output_bytes
+
+    def as_dict(self) -> map:
+        """Returns the sizes as map, for example for a metrics system or a log."""
+        sizes = {name: getattr(self, name) for name in self.__slots__}
+        sizes["total_bytes"] = self.total_bytes
+        return sizes
+
+    def add_input(self, text: str, limits: Limits = None):
+        """Adds the input text or a chunk of it.
+
+        :param str text: the text
+        :param Limits limits: the limits or None
+        :raises LimitExceeded: if the input exceeds the limit
+        """
+        self.input_bytes += sys.getsizeof(text)
+        if limits is not None:
+            limits.check("input_bytes", self.input_bytes, self)
+
+    def add_grammar(self, result, limits: Limits = None):
+        """Adds the result of the MarkdownGrammar. The walk stops as soon as the nodes or the depth exceed the limit.
+
+        Every modgrammar node keeps its attributes in a dict and the matched string in its own copy.
+
+        :param modgrammar.Grammar result: the grammar result or None for an empty text
+        :param Limits limits: the limits or None
+        :raises LimitExceeded: if the parse trees exceed a limit
+        """
+        size = 0
+        pending = [(result, 1)] if result is not None else []
+        max_nodes, max_depth = _tree_limits(limits)
+        while pending:
+            elem, depth = pending.pop()
+            attributes = elem.__dict__
+            size += sys.getsizeof(elem) + sys.getsizeof(attributes) + sys.getsizeof(elem.elements)
+            size += sum(sys.getsizeof(value) for value in attributes.values() if type(value) is str)
+            self.nodes += 1
+            if depth > self.depth:
+                self.depth = depth
+            if self.nodes > max_nodes or depth > max_depth:
+                self.grammar_bytes += size
+                limits.check("nodes", self.nodes, self)
+                limits.check("depth", depth, self)
+            pending.extend((child, depth + 1) for child in elem.elements if child is not None)
+        self.grammar_bytes += size
+
+    def add_document(self, document, limits: Limits = None):
+        """Adds the document tree. The walk stops as soon as the nodes or the depth exceed the limit.
+
+        :param Document document: the document
+        :param Limits limits: the limits or None
+        :raises LimitExceeded: if the parse trees exceed a limit
+        """
+        size = 0
+        pending = [(document, 1)]
+        max_nodes, max_depth = _tree_limits(limits)
+        while pending:
+            node, depth = pending.pop()
+            size += sys.getsizeof(node)
+            for name in type(node).__slots__:
+                value = getattr(node, name)
+                if type(value) is list:
+                    size += sys.getsizeof(value)
+                    pending.extend((child, depth + 1) for child in value)
+                elif type(value) is str:
+                    size += sys.getsizeof(value)
+            self.nodes += 1
+            if depth > self.depth:
+                self.depth = depth
+            if self.nodes > max_nodes or depth > max_depth:
+                self.document_bytes += size
+                limits.check("nodes", self.nodes, self)
+                limits.check("depth", depth, self)
+        self.document_bytes += size
+
+    def add_output(self, output: str, limits: Limits = None):
+        """Adds the output or a piece of it.
+
+        The pieces of one output are joined, so only their characters are counted.
+
+        :param str output: the output or a piece of it
+        :param Limits limits: the limits or None
+        :raises LimitExceeded: if the output exceeds the limit
+        """
+        # the first piece brings the size of an empty string
+        self.output_bytes += sys.getsizeof(output) - (_EMPTY_STRING if self.output_bytes else 0)
+        if limits is not None:
+            limits.check("output_bytes", self.output_bytes, self)
+
+
+class TreeCounter:
+    """Counts the nodes and the depth of the grammar result while the MarkdownGrammar parses a text.
+
+    The grammar adds every block it matches (see grammars.CountedGrammar). A block that is matched at the start of an
+    earlier block replaces it and the blocks after it, which the grammar gave up when it backtracked. The nodes and
+    the depth are those of the result after modgrammar collapsed it, so the parse stops at the same limits as
+    Usage.add_grammar, only before the whole result is built.
+    """
+    __slots__ = ("usage", "limits", "active", "_starts", "_nodes", "_depths")
+
+    def __init__(self, usage: Usage, limits: Limits):
+        """Initializes the counter for a parse without any block.
+
+        :param Usage usage: the usage of the render, which holds the nodes of the earlier parse trees
+        :param Limits limits: the limits
+        """
+        self.usage = usage
+        self.limits = limits
+        # the number of blocks whose match is in progress, a block within another one isn't added on its own
+        self.active = 0
+        # the start of every block with the nodes and the maximum depth of the blocks up to it
+        self._starts = []
+        self._nodes = []
+        self._depths = []
+
+    def add(self, start: int, result):
+        """Adds the match of a block that starts at the given offset.
+
+        :param int start: the offset of the block in the text
+        :param modgrammar.Grammar result: the match of the block, which isn't post-processed yet
+        :raises LimitExceeded: if the parse trees exceed a limit
+        """
+        kept = bisect.bisect_left(self._starts, start)
+        del self._starts[kept:], self._nodes[kept:], self._depths[kept:]
+        nodes, depth = _match_size(result)
+        # the result of the MarkdownGrammar is the root of the blocks
+        nodes += self._nodes[-1] if self._nodes else 1
+        depth = max(depth + 1, self._depths[-1] if self._depths else 1)
+        self._starts.append(start)
+        self._nodes.append(nodes)
+        self._depths.append(depth)
+        max_nodes, max_depth = _tree_limits(self.limits)
+        if self.usage.nodes + nodes > max_nodes or depth > max_depth:
+            self.usage.nodes += nodes
+            self.usage.depth = max(self.usage.depth, depth)
+            self.limits.check("nodes", self.usage.nodes, self.usage)
+            self.limits.check("depth", depth, self.usage)
+
+
+def _match_size(result) -> tuple:
+    """Returns the nodes and the depth that the given match has after modgrammar collapsed it.
+
+    Collapsed grammars are replaced by their elements and the repetitions of LIST_OF are flattened, as
+    grammar_postprocess does.
+
+    :param modgrammar.Grammar result: the match, which isn't post-processed yet
+    """
+    nodes = 0
+    max_depth = 0
+    pending = [(result, 1)]
+    while pending:
+        elem, depth = pending.pop()
+        elements = elem.elements
+        if isinstance(elem, modgrammar.ListRepetition) and elements:
+            elements = [elements[0]] + [child for repetition in elements[1:] for child in repetition.elements]
+        if elem.grammar_collapse:
+            kept = [child for child in elements if not getattr(child, "grammar_collapse_skip", False)]
+            pending.extend((child, depth) for child in kept or elements if child is not None)
+            continue
+        nodes += 1
+        if depth > max_depth:
+            max_depth = depth
+        pending.extend((child, depth + 1) for child in elements if child is not None)
+    return nodes, max_depth
+
+
+def _tree_limits(limits: Limits) -> tuple:
+    """Returns the maximum nodes and depth of the given limits, which are infinite if they aren't limited.
+
+    :param Limits limits: the limits or None
+    """
+    if limits is None:
+        return float("inf"), float("inf")
+    return (limits.nodes if limits.nodes is not None else float("inf"),
+            limits.depth if limits.depth is not None else float("inf"))
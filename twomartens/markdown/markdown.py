@@ -18,11 +18,9 @@
 
 
 import argparse
-
-import modgrammar
-
-from .parser import parse as markdown_parse
-from .transform import transform
+import codecs
+import sys
+from contextlib import contextmanager
 
 __version__ = "1.0.0.a1"
 
@@ -30,28 +28,167 @@ __version__ = "1.0.0.a1"
 def main():
     """The entry point of the application. Glues the various parts of the application together."""
     parser = argparse.ArgumentParser(description="Parses markdown and produces an HTML representation.")
-    parser.add_argument("-f", "--format", dest="format", default="html", choices=["html"],
-                        help="This describes the output format.")
-    parser.add_argument("input", metavar="input", type=argparse.FileType('r'), help="The input file in markdown")
-    parser.add_argument("output", metavar="output", type=argparse.FileType('w'), help="The output file")
+    parser.add_argument("-f", "--format", dest="format", default="html",
+                        help="This describes the output format: html, fragment (html without the page around it), "
+                             "text or json (the document tree).")
+    parser.add_argument("-e", "--engine", dest="engine", default="grammar", choices=["grammar", "scanner"],
+                        help="This describes the parser engine.")
+    parser.add_argument("--budget", dest="budget", type=float, default=None, metavar="steps",
+                        help="Parses in guarded mode with this many grammar steps per character (see README).")
+    parser.add_argument("-a", "--anchors", dest="anchors", action="store_true",
+                        help="Gives every heading an id attribute made from its text, e.g. for links to sections.")
+    parser.add_argument("-c", "--cache", dest="cache", default=None, metavar="path",
+                        help="Caches the output in this directory or sqlite file (*.sqlite, *.sqlite3, *.db).")
+    parser.add_argument("--cache-size", dest="cache_size", type=int, default=None, metavar="bytes",
+                        help="Evicts the least recently used entries of the cache above this size (default: no limit).")
+    parser.add_argument("-b", "--batch", dest="batch", action="store_true",
+                        help="Renders all inputs into the output directory, mirroring their directory tree.")
+    parser.add_argument("-j", "--jobs", dest="jobs", type=int, default=None,
+                        help="The number of worker processes for the files in batch mode (defaults to the number of "
+                             "CPUs) or for the blocks of a single file (not with --cache or --profile).")
+    parser.add_argument("-w", "--watch", dest="watch", action="store_true",
+                        help="Keeps running and renders the inputs again whenever they change.")
+    parser.add_argument("--interval", dest="interval", type=float, default=0.2, metavar="seconds",
+                        help="The seconds between two checks for changes in watch mode.")
+    parser.add_argument("-p", "--profile", dest="profile", action="store_true",
+                        help="Prints the time of every stage, the node counts and the sizes to stderr.")
+    parser.add_argument("--cprofile", dest="cprofile", type=int, default=0, metavar="n",
+                        help="Prints the n functions with the highest cumulative time as well (implies --profile).")
+    parser.add_argument("--encoding", dest="encoding", default="utf-8", metavar="name",
+                        help="The encoding of the input (the output is always written in UTF-8).")
+    parser.add_argument("input", metavar="input", nargs="+",
+                        help="The input file in markdown (files, directories or globs in batch mode)")
+    parser.add_argument("output", metavar="output", help="The output file (directory in batch mode)")
     
     args = parser.parse_args()
 
-    # load file content
-    markdown = args.input.read()
+    # the pipeline is imported after the arguments were parsed, so that --help and errors in the arguments are fast
+    import modgrammar
 
-    try:
-        # parse markdown
-        structure = markdown_parse(markdown)
+    from . import source
+    from .cache import RenderCache, open_store
+    from .instrumentation import Profile
+    from .renderer import Renderer
+    from .transform import BACKENDS
 
-        # compile output
-        output = transform(structure, args.format)
+    if args.format not in BACKENDS:
+        parser.error("unknown output format: {} (known are {})".format(args.format, ", ".join(sorted(BACKENDS))))
 
-        # write output
-        args.output.write(output)
+    profile = Profile(args.cprofile) if args.profile or args.cprofile else None
+    if args.watch:
+        _watch(parser, args, profile)
+        return
+    if args.batch:
+        if profile is not None:
+            parser.error("--profile can't be combined with --batch")
+        try:
+            codecs.lookup(args.encoding)
+        except LookupError:
+            parser.error("unknown encoding: {}".format(args.encoding))
+        from . import batch
+        files = batch.collect(args.input, args.output, args.format)
+        failed = batch.run(files, args.format, args.engine, args.jobs, args.cache, budget=args.budget,
+                           anchors=args.anchors, encoding=args.encoding, cache_size=args.cache_size)
+        if failed:
+            sys.exit(1)
+        return
+    if len(args.input) != 1:
+        parser.error("exactly one input is required without --batch")
+    if args.jobs is not None and args.jobs != 1 and (args.cache is not None or profile is not None):
+        # the cache and the profile need the whole text, which a process pool doesn't parse at once
+        parser.error("--jobs can't be combined with --cache or --profile without --batch")
+
+    try:
+        codecs.lookup(args.encoding)
+        cache = RenderCache(store=open_store(args.cache, args.cache_size)) if args.cache is not None else None
+        renderer = Renderer(args.format, args.engine, cache, profile, args.budget, anchors=args.anchors)
+        with _open_file(args.input[0], "rb") as input_file, _open_file(args.output, "w") as output_file:
+            # the file is memory-mapped and decoded block by block
+            lines = source.file_lines(input_file, args.encoding)
+            if args.jobs is not None and args.jobs != 1:
+                # parse the blocks of the file in a process pool
+                from . import parallel
+                document = parallel.parse("".join(lines), args.engine, args.jobs, args.budget)
+                if args.anchors:
+                    from .index import add_anchors
+                    add_anchors(document)
+                output_file.write(renderer.transform(document))
+            elif cache is not None or profile is not None:
+                # the cache needs the whole text for the key and the stages are measured for the whole text
+                output_file.write(renderer.render("".join(lines)))
+            else:
+                # parse and write the output block by block
+                renderer.render_to(lines, output_file)
 
         # give feedback to console
-        print("The output file has been written.")
+        if args.output != "-":
+            print("The output file has been written.")
+        if profile is not None:
+            print(profile.report(), file=sys.stderr)
     except modgrammar.ParseError as pe:
         # the input is no valid markdown as per our grammar definition
         raise pe
+    except OSError as error:
+        if error.filename is None:
+            raise
+        parser.error("can't open '{}': {}".format(error.filename, error.strerror))
+    except LookupError:
+        parser.error("unknown encoding: {}".format(args.encoding))
+    except UnicodeDecodeError as error:
+        parser.error("the input is no valid {}: {}".format(args.encoding, error))
+
+
+def _watch(parser: argparse.ArgumentParser, args: argparse.Namespace, profile):
+    """Renders the inputs whenever they change until the program is interrupted.
+
+    :param argparse.ArgumentParser parser: the parser of the arguments, which reports errors
+    :param argparse.Namespace args: the parsed arguments
+    :param Profile profile: the profile if one was requested or None
+    """
+    from .cache import BlockCache, RenderCache, open_store
+    from .renderer import Renderer
+    from .watch import Watcher
+
+    if profile is not None or args.jobs is not None:
+        parser.error("--profile and --jobs can't be combined with --watch")
+    if "-" in args.input or args.output == "-":
+        parser.error("--watch needs files, not stdin or stdout")
+    if not args.batch and len(args.input) != 1:
+        parser.error("exactly one input is required without --batch")
+    try:
+        codecs.lookup(args.encoding)
+    except LookupError:
+        parser.error("unknown encoding: {}".format(args.encoding))
+
+    cache = RenderCache(store=open_store(args.cache, args.cache_size)) if args.cache is not None else None
+    # the block cache keeps the output of the unchanged blocks of a file for its next render
+    renderer = Renderer(args.format, args.engine, cache, budget=args.budget, block_cache=BlockCache(),
+                        anchors=args.anchors)
+    Watcher(args.input, args.output, renderer, args.batch, args.encoding).run(args.interval)
+
+
+def _open_file(path: str, mode: str):
+    """Opens the input file in binary mode or the output file in UTF-8. The path - stands for stdin or stdout, which
+    stay open when the file is closed.
+
+    The output is written to a temporary file, which replaces the output file only once the whole output is written,
+    so that an error leaves the output file unchanged.
+
+    :param str path: the path of the file or -
+    :param str mode: rb for the input or w for the output
+    """
+    if path == "-":
+        return _unclosed(sys.stdin.buffer if mode == "rb" else sys.stdout)
+    if mode == "w":
+        from .batch import open_atomically
+        return open_atomically(path)
+    return open(path, mode)
+
+
+@contextmanager
+def _unclosed(file):
+    """Returns the file when the enclosed code starts and leaves it open when the code is done.
+
+    :param file: the file, e.g. stdin or stdout
+    """
+    yield file
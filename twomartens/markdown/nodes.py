@@ -0,0 +1,305 @@
+# coding=utf-8
+
+#   Copyright 2017 Jim Martens
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""markdown.nodes: provides the document tree that the parser returns and the transforms consume
+
+Every node class has __slots__, so a parsed document takes little more memory than its text. The text of the nodes
+is the text of the source, the transforms escape it where the output format needs it.
+"""
+import modgrammar
+
+
+class Node:
+    """Base class of all nodes. Nodes are equal if they are of the same class and have equal attributes."""
+    __slots__ = ()
+
+    def __eq__(self, other):
+        return type(self) is type(other) and all(getattr(self, name) == getattr(other, name)
+                                                 for name in self.__slots__)
+
+    def __repr__(self):
+        attributes = ", ".join(name + "=" + repr(getattr(self, name)) for name in self.__slots__)
+        return type(self).__name__ + "(" + attributes + ")"
+
+
+class Document(Node):
+    """The root node, which holds the blocks of a text."""
+    __slots__ = ("blocks",)
+
+    def __init__(self, blocks: list):
+        """Initializes the document.
+
+        :param list blocks: the block nodes
+        """
+        self.blocks = blocks
+
+    def find(self, node_type: type):
+        """Returns the first block of the given type or None if there is none.
+
+        :param type node_type: the node class to look for
+        """
+        for block in self.blocks:
+            if type(block) is node_type:
+                return block
+        return None
+
+
+class Heading(Node):
+    """A heading of level 1 to 6. The anchor is only set on request (see index.add_anchors)."""
+    __slots__ = ("level", "text", "anchor")
+
+    def __init__(self, level: int, text: str, anchor: str = None):
+        """Initializes the heading.
+
+        :param int level: the level of the heading
+        :param str text: the text of the heading
+        :param str anchor: the anchor of the heading or None
+        """
+        self.level = level
+        self.text = text
+        self.anchor = anchor
+
+
+class Paragraph(Node):
+    """A paragraph of inline nodes."""
+    __slots__ = ("children",)
+
+    def __init__(self, children: list):
+        """Initializes the paragraph.
+
+        :param list children: the inline nodes
+        """
+        self.children = children
+
+
+class List(Node):
+    """An unordered or ordered list."""
+    __slots__ = ("ordered", "items")
+
+    def __init__(self, ordered: bool, items: list):
+        """Initializes the list.
+
+        :param bool ordered: True if the list is ordered
+        :param list items: the list items
+        """
+        self.ordered = ordered
+        self.items = items
+
+
+class ListItem(Node):
+    """A list item of inline nodes."""
+    __slots__ = ("children",)
+
+    def __init__(self, children: list):
+        """Initializes the list item.
+
+        :param list children: the inline nodes
+        """
+        self.children = children
+
+
+class Quote(Node):
+    """A block quote of inline nodes."""
+    __slots__ = ("children",)
+
+    def __init__(self, children: list):
+        """Initializes the quote.
+
+        :param list children: the inline nodes
+        """
+        self.children = children
+
+
+class CodeBlock(Node):
+    """A code block. The lines of the text are separated by \\n and don't contain the indentation."""
+    __slots__ = ("text",)
+
+    def __init__(self, text: str):
+        """Initializes the code block.
+
+        :param str text: the code
+        """
+        self.text = text
+
+
+class Text(Node):
+    """Plain text."""
+    __slots__ = ("text",)
+
+    def __init__(self, text: str):
+        """Initializes the text.
+
+        :param str text: the text
+        """
+        self.text = text
+
+
+class Emphasis(Node):
+    """Emphasized (italic) text."""
+    __slots__ = ("text",)
+
+    def __init__(self, text: str):
+        """Initializes the emphasis.
+
+        :param str text: the text
+        """
+        self.text = text
+
+
+class Strong(Node):
+    """Strong (bold) text."""
+    __slots__ = ("text",)
+
+    def __init__(self, text: str):
+        """Initializes the strong text.
+
+        :param str text: the text
+        """
+        self.text = text
+
+
+class Code(Node):
+    """An inline code segment."""
+    __slots__ = ("text",)
+
+    def __init__(self, text: str):
+        """Initializes the code segment.
+
+        :param str text: the code
+        """
+        self.text = text
+
+
+class Link(Node):
+    """A link. The text of an automatic link is its target."""
+    __slots__ = ("text", "href", "title")
+
+    def __init__(self, text: str, href: str, title: str = None):
+        """Initializes the link.
+
+        :param str text: the text of the link
+        :param str href: the target of the link
+        :param str title: the title of the link if available
+        """
+        self.text = text
+        self.href = href
+        self.title = title
+
+
+_NODE_TYPES = {node_type.__name__.lower(): node_type
+               for node_type in (Document, Heading, Paragraph, List, ListItem, Quote, CodeBlock, Text, Emphasis, Strong,
+                                 Code, Link)}
+
+
+def from_json(data: map) -> Node:
+    """Converts an object of the JSON output format (see transform.JsonBackend) back into a node.
+
+    :param map data: the object as returned by json.loads
+    """
+    node_type = _NODE_TYPES[data["type"]]
+    values = []
+    for name in node_type.__slots__:
+        value = data.get(name)
+        values.append([from_json(child) for child in value] if isinstance(value, list) else value)
+    return node_type(*values)
+
+
+def join_lines(lines: list) -> list:
+    """Appends a space to each text that is followed by a line break and returns all inline nodes of the lines.
+
+    The lines of paragraphs and quotes are joined like this by both engines.
+
+    :param list lines: the inline nodes of each line
+    """
+    nodes = []
+    highest_index = len(lines) - 1
+    add_space_at_start = False
+    for current_index, line in enumerate(lines):
+        if add_space_at_start and type(line[0]) is Text:
+            line[0].text = " " + line[0].text
+            add_space_at_start = False
+        if current_index < highest_index:
+            if type(line[-1]) is Text:
+                line[-1].text = line[-1].text.rstrip() + " "
+            else:
+                add_space_at_start = True
+        nodes.extend(line)
+    return nodes
+
+
+def from_grammar(result: modgrammar.Grammar) -> Document:
+    """Converts the result of the MarkdownGrammar into a document.
+
+    This is the only pass over the grammar result after the match: the texts are taken from the matched strings and
+    the lines of paragraphs, quotes and code blocks are joined here.
+
+    :param modgrammar.Grammar result: the result of the MarkdownGrammar or None for an empty text
+    """
+    if result is None:
+        return Document([])
+    # the grammars module is imported on the first grammar parse (see renderer), which has happened at this point
+    from . import grammars
+    blocks = []
+    for elem in result.elements:
+        if isinstance(elem, grammars.Heading):
+            blocks.append(Heading(len(elem[1].string), elem[3].string))
+        elif isinstance(elem, (grammars.UnorderedList, grammars.OrderedList)):
+            items = [ListItem(_inline_nodes(item)) for item in elem.elements
+                     if isinstance(item, (grammars.UnorderedListItem, grammars.OrderedListItem))]
+            blocks.append(List(isinstance(elem, grammars.OrderedList), items))
+        elif isinstance(elem, grammars.Quote):
+            blocks.append(Quote(join_lines([_inline_nodes(line) for line in elem.elements])))
+        elif isinstance(elem, grammars.Paragraph):
+            text = elem.find(grammars.Text)
+            blocks.append(Paragraph(join_lines([_inline_nodes(line) for line in text.elements])))
+        elif isinstance(elem, grammars.PreBlock):
+            code = elem.find(grammars.CodeBlock)
+            blocks.append(CodeBlock("\n".join(line.string for line in code.find_all(modgrammar.REST_OF_LINE))))
+        elif isinstance(elem, grammars.FencedBlock):
+            blocks.append(CodeBlock(elem.find(grammars.FencedCode).code))
+    return Document(blocks)
+
+
+def _inline_nodes(elem: modgrammar.Grammar) -> list:
+    """Returns the inline nodes for all inline grammar results below the given result.
+
+    :param modgrammar.Grammar elem: the grammar result
+    """
+    from . import grammars
+    nodes = []
+    for child in elem.elements:
+        if child is None:
+            continue
+        if isinstance(child, grammars.SimpleText):
+            # the elements are the leading spaces and the word, after two or more spaces the second space takes the
+            # place of the word (see inline._simple_text)
+            elements = child.elements
+            text = child.string if len(elements) <= 2 else child.string[:len(elements) - 1] + elements[1].string
+            nodes.append(Text(text))
+        elif isinstance(child, grammars.Bold):
+            nodes.append(Strong(child[1].string))
+        elif isinstance(child, grammars.Italic):
+            nodes.append(Emphasis(child[1].string))
+        elif isinstance(child, grammars.InlineCode):
+            nodes.append(Code(child[1].string))
+        elif isinstance(child, grammars.Link):
+            link_title = child.find(grammars.LinkTitle)
+            nodes.append(Link(child[1].string, child[3].string, link_title.string if link_title is not None else None))
+        elif isinstance(child, grammars.AutomaticLink):
+            nodes.append(Link(child[1].string, child[1].string))
+        else:
+            nodes.extend(_inline_nodes(child))
+    return nodes
@@ -0,0 +1,107 @@
+# coding=utf-8
+
+#   Copyright 2017 Jim Martens
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""markdown.parallel: provides parsing of one large text with a process pool"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import modgrammar
+
+from .nodes import Document
+from .renderer import Renderer
+from .scanner import split
+
+CHUNK_SIZE = 64 * 1024
+
+_renderer = None
+
+
+def parse(text: str, engine: str = "grammar", jobs: int = None, budget: float = None, chunk_size: int = CHUNK_SIZE,
+          executor: ProcessPoolExecutor = None) -> Document:
+    """Parses the given text in a process pool and returns the document.
+
+    The text is cut at block boundaries (see scanner.split) into chunks, which are handed to the worker processes in
+    pieces of about chunk_size characters. Every chunk is parsed on its own and the blocks are joined in order, which
+    gives the same document as a serial parse. A text that fits into one piece is parsed in this process.
+
+    :param str text: the input text
+    :param str engine: the parser engine (grammar or scanner)
+    :param int jobs: the number of worker processes, defaults to the number of CPUs
+    :param float budget: the grammar steps per character for guarded mode or None
+    :param int chunk_size: the minimum number of characters of a piece
+    :param ProcessPoolExecutor executor: an optional pool to use instead of a new one
+    :raises modgrammar.ParseError: if a chunk is no valid markdown, with the line and position in the whole text
+    """
+    arguments = [(piece, engine, budget) for piece in _pieces(text, chunk_size)]
+    workers = jobs or os.cpu_count() or 1
+    if len(arguments) <= 1 or (executor is None and workers == 1):
+        results = [_parse_piece(argument) for argument in arguments]
+    elif executor is not None:
+        results = executor.map(_parse_piece, arguments)
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(arguments))) as pool:
+            results = list(pool.map(_parse_piece, arguments))
+
+    blocks = []
+    for piece_blocks, error in results:
+        if error is not None:
+            pos, line, col, message = error
+            from .grammars import MarkdownGrammar
+            raise modgrammar.ParseError(MarkdownGrammar, text, pos, pos, line=line, col=col, message=message)
+        blocks.extend(piece_blocks)
+    return Document(blocks)
+
+
+def _pieces(text: str, chunk_size: int) -> list:
+    """Cuts the text at block boundaries into chunks and returns them in pieces of about chunk_size characters.
+
+    Every piece is a list of (line, char, chunk) tuples with the line and offset at which the chunk starts.
+
+    :param str text: the input text
+    :param int chunk_size: the minimum number of characters of a piece
+    """
+    pieces = [[]]
+    size = 0
+    char = 0
+    for line, chunk in split(text):
+        if size >= chunk_size:
+            pieces.append([])
+            size = 0
+        pieces[-1].append((line, char, chunk))
+        size += len(chunk)
+        char += len(chunk)
+    return pieces
+
+
+def _parse_piece(arguments: tuple) -> tuple:
+    """Parses the chunks of one piece and returns a tuple (blocks, error) of which one is None.
+
+    A parse error can't be pickled, so its position in the whole text, its line, column and message are returned
+    instead. Every worker process keeps one renderer for all of its pieces.
+
+    :param tuple arguments: the piece, the engine and the budget
+    """
+    global _renderer
+    piece, engine, budget = arguments
+    if _renderer is None or (_renderer.engine, _renderer.budget) != (engine, budget):
+        _renderer = Renderer("html", engine, budget=budget)
+    blocks = []
+    for line, char, chunk in piece:
+        try:
+            blocks.extend(_renderer.parse(chunk).blocks)
+        except modgrammar.ParseError as pe:
+            return None, (char + pe.char, line + pe.line if pe.line is not None else None, pe.col, pe.message)
+    return blocks, None
@@ -15,15 +15,35 @@
 #   limitations under the License.
 
 """markdown.parser: provides parsing capability"""
-import modgrammar
-
 from .grammars import MarkdownGrammar
+from .nodes import Document, from_grammar
+from .scanner import scan
+
+
+def parse(text: str, engine: str = "grammar") -> Document:
+    """Parses the given text and returns the document.
+    
+    Both engines return the same document. The grammar engine matches the whole text against the MarkdownGrammar,
+    the scanner engine classifies the lines first and only matches the inline content.
+    
+    :param str text: the input text
+    :param str engine: the parser engine (grammar or scanner)
+    """
+    return globals().get("_" + engine + "_parse")(text)
 
 
-def parse(text: str) -> modgrammar.Grammar:
-    """Parses the given text and returns a result object.
+def _grammar_parse(text: str) -> Document:
+    """Parses the given text with the MarkdownGrammar.
     
     :param str text: the input text
     """
     parser = MarkdownGrammar.parser()
-    return parser.parse_string(text)
+    return from_grammar(parser.parse_string(text))
+
+
+def _scanner_parse(text: str) -> Document:
+    """Parses the given text with the line-oriented block scanner.
+    
+    :param str text: the input text
+    """
+    return scan(text)
@@ -0,0 +1,564 @@
+# coding=utf-8
+
+#   Copyright 2017 Jim Martens
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""markdown.renderer: provides a reusable renderer for library use"""
+import mmap
+import threading
+import time
+
+import modgrammar
+
+from .budget import Budget, BudgetExceeded
+from .cache import BlockCache, RenderCache
+from .index import Anchors, add_anchors, heading_text
+from .instrumentation import Instrumentation, count_grammar_nodes, count_nodes, measure
+from .limits import LimitExceeded, Limits, TreeCounter, Usage
+from .nodes import Document, Heading, from_grammar
+from .scanner import scan, split
+from .source import buffer_lines
+from .transform import get_backend, load_template, render_many, transform, transform_body, transform_iter
+
+MINIMUM_STEPS = 1000
+GUARDED_CHUNK_LIMIT = 16 * 1024
+SKELETON_LIMIT = 256
+
+
+class Renderer:
+    """Renders markdown texts into an output format.
+
+    The template is loaded once and every thread gets its own grammar parser, which is reused for all documents
+    rendered by that thread. Therefore one renderer can be shared across threads. If a cache is given, texts that
+    were rendered before are taken from the cache. If an instrumentation is given, the stages of every render are
+    measured and reported to it.
+
+    If a block cache is given, the text is split into chunks (see scanner.split) and the output of every chunk is
+    cached on its own. A text that was changed in a few blocks since it was last rendered only needs the changed
+    chunks to be parsed again. The output is the same as without the block cache.
+
+    If anchors is True, every heading gets an anchor (see index.Anchors), which the HTML backends emit as id
+    attribute.
+
+    If a budget is given, texts are parsed in guarded mode, which is meant for untrusted texts. The grammar engine
+    parses the text chunk by chunk (see scanner.split). A chunk whose parse exceeds the budget, fails or is longer
+    than GUARDED_CHUNK_LIMIT is scanned in lenient mode instead, which takes linear time and takes the blocks that
+    don't match as literal text. Therefore no ParseError is raised.
+
+    If limits are given, the memory of every render is accounted (see limits.Usage) and a render that exceeds one of
+    the limits stops with LimitExceeded as soon as the size is known. An instrumentation receives the usage of every
+    render, with or without limits. The output of a text found in the cache isn't rendered again, so only its input
+    and output are checked.
+    """
+
+    def __init__(self, output_format: str = "html", engine: str = "grammar", cache: RenderCache = None,
+                 instrumentation: Instrumentation = None, budget: float = None, time_budget: float = None,
+                 block_cache: BlockCache = None, anchors: bool = False, limits: Limits = None):
+        """Initializes the renderer.
+
+        :param str output_format: the output format
+        :param str engine: the parser engine (grammar or scanner)
+        :param RenderCache cache: an optional cache for the rendered output
+        :param Instrumentation instrumentation: an optional receiver of measurements
+        :param float budget: the maximum number of grammar steps per character of a text for guarded mode
+        :param float time_budget: the maximum number of seconds of a grammar parse for guarded mode
+        :param BlockCache block_cache: an optional cache for the output of the chunks of texts
+        :param bool anchors: True if the headings get anchors
+        :param Limits limits: the optional limits of a render
+        """
+        self.output_format = output_format
+        self.engine = engine
+        self.cache = cache
+        self.instrumentation = instrumentation
+        self.budget = budget
+        self.time_budget = time_budget
+        self.block_cache = block_cache
+        self.anchors = anchors
+        self.limits = limits
+        self._template = load_template(output_format)
+        self._templates = {output_format: self._template}
+        self._local = threading.local()
+
+    def parse(self, text: str) -> Document:
+        """Parses the given text and returns the document.
+
+        :param str text: the input text
+        """
+        if self.budget is None and self.time_budget is None:
+            return self._parse(text)
+        if self.engine == "scanner":
+            return self._scan_leniently(text)
+
+        # the time of a grammar step grows with the length of the text, so the chunks are parsed on their own
+        deadline = time.perf_counter() + self.time_budget if self.time_budget is not None else None
+        blocks = []
+        for _line, chunk in split(text):
+            seconds = deadline - time.perf_counter() if deadline is not None else None
+            if len(chunk) <= GUARDED_CHUNK_LIMIT and (seconds is None or seconds > 0):
+                steps = int(self.budget * len(chunk)) + MINIMUM_STEPS if self.budget is not None else None
+                try:
+                    blocks.extend(self._parse(chunk, Budget(steps, seconds)).blocks)
+                    continue
+                except (BudgetExceeded, modgrammar.ParseError):
+                    pass
+            blocks.extend(self._scan_leniently(chunk).blocks)
+        return Document(blocks)
+
+    def render(self, text: str) -> str:
+        """Parses the given text and returns it in the output format of the renderer.
+
+        :param str text: the input text
+        """
+        if self.instrumentation is not None:
+            return self._render_instrumented(text)
+        if self.limits is not None:
+            return self._render_limited(text)
+        if self.cache is None:
+            return self._render(text)
+
+        key = self._cache_key(text)
+        output = self.cache.get(key)
+        if output is None:
+            output = self._render(text)
+            self.cache.put(key, output)
+        return output
+
+    def transform(self, document: Document) -> str:
+        """Transforms a parsed document into the output format of the renderer.
+
+        :param Document document: the document
+        """
+        return transform(document, self.output_format, self._template)
+
+    def render_many(self, text: str, output_formats: list) -> map:
+        """Parses the given text once and returns a map of each of the given output formats to the output.
+
+        The document is walked once for all formats (see transform.render_many). The cache is not used.
+
+        :param str text: the input text
+        :param list output_formats: the output formats
+        """
+        for output_format in output_formats:
+            if output_format not in self._templates:
+                self._templates[output_format] = load_template(output_format)
+        if self.limits is None:
+            return render_many(self._parse_document(text), output_formats, self._templates)
+
+        usage = self._start_usage(text)
+        try:
+            outputs = render_many(self._parse_document(text), output_formats, self._templates)
+        finally:
+            self._local.usage = None
+        for output in outputs.values():
+            usage.add_output(output, self.limits)
+        return outputs
+
+    def render_batch(self, texts, deduplicate: bool = False) -> list:
+        """Renders many texts in one call and returns a list of (output, error) tuples in the order of the texts.
+
+        One of output and error is None. A text that is no valid markdown gets its ParseError as error instead of
+        stopping the batch, likewise a text that exceeds the limits gets its LimitExceeded. The setup is shared by all
+        texts of the batch: the backend is looked up once, one list of output fragments is reused and the skeleton is
+        built once per title. This matters for many small texts like comments, whose render takes little more than
+        the setup. If deduplicate is True, identical texts are rendered once and share their result. Other exceptions
+        than these two, e.g. for a text that is no string, stop the batch like they would stop render.
+
+        :param texts: an iterable of input texts
+        :param bool deduplicate: True if identical texts of the batch are rendered once
+        """
+        if (self.cache is not None or self.block_cache is not None or self.instrumentation is not None
+                or self.limits is not None):
+            render = self.render
+        else:
+            render = self._batch_renderer()
+        results = []
+        seen = {} if deduplicate else None
+        for text in texts:
+            result = seen.get(text) if seen is not None else None
+            if result is None:
+                try:
+                    result = (render(text), None)
+                except (modgrammar.ParseError, LimitExceeded) as error:
+                    result = (None, error)
+                if seen is not None:
+                    seen[text] = result
+            results.append(result)
+        return results
+
+    def render_iter(self, source, encoding: str = "utf-8"):
+        """Reads the source block by block and yields the output piece by piece.
+
+        The source is split at block boundaries and every chunk is parsed and transformed as soon as it is read.
+        Therefore the memory needed depends on the largest block and not on the whole text. The output is the same
+        as the output of render. The cache is not used.
+
+        A bytes-like source (e.g. a memory map) is decoded block by block, so it is never decoded as a whole. Large
+        files are best read with source.read_lines, which memory-maps them.
+
+        :param source: the input text, a file object or iterable of lines or bytes, a memoryview or a memory map
+        :param str encoding: the encoding of a bytes-like source
+        :raises modgrammar.ParseError: if a chunk is no valid markdown, with the line and position in the whole text
+        :raises LimitExceeded: if the text read so far exceeds the limits
+        """
+        if isinstance(source, (bytes, bytearray, memoryview, mmap.mmap)):
+            source = buffer_lines(source, encoding)
+        if self.limits is None:
+            return transform_iter(self._parse_chunks(source), self.output_format, self._template)
+        return self._render_iter_limited(source)
+
+    def render_to(self, source, file, encoding: str = "utf-8"):
+        """Reads the source block by block and writes the output to the given file as soon as it is ready.
+
+        :param source: the input text, a file object or iterable of lines or bytes, a memoryview or a memory map
+        :param file: the file object for the output
+        :param str encoding: the encoding of a bytes-like source
+        """
+        for piece in self.render_iter(source, encoding):
+            file.write(piece)
+
+    def _render(self, text: str) -> str:
+        """Parses the given text and returns it in the output format of the renderer without the cache.
+
+        :param str text: the input text
+        """
+        usage = getattr(self._local, "usage", None)
+        if self.block_cache is None:
+            document = self._parse_document(text)
+            if usage is None:
+                return self.transform(document)
+            return self._transform_accounted(document, usage)
+
+        backend = get_backend(self.output_format)
+        anchors = Anchors() if self.anchors else None
+        title = None
+        bodies = []
+        char = 0
+        for line, chunk in split(text):
+            # a chunk is parsed the same on its own as within the text, so only its own text goes into the key. Only
+            # the first line of a chunk can be a heading, whose anchor depends on the headings before it.
+            options = {}
+            if anchors is not None:
+                chunk_heading = heading_text(chunk)
+                options["anchor"] = anchors.peek(chunk_heading) if chunk_heading is not None else None
+            key = self.block_cache.key(chunk, self.output_format, engine=self.engine, budget=self.budget,
+                                       time_budget=self.time_budget, **options)
+            entry = self.block_cache.get(key)
+            if entry is None:
+                try:
+                    document = self.parse(chunk)
+                except modgrammar.ParseError as pe:
+                    _shift_error(pe, line, char)
+                    raise
+                if anchors is not None:
+                    add_anchors(document, anchors)
+                heading = document.find(Heading)
+                # a chunk of empty lines has no blocks and therefore no body and no separator
+                body = transform_body(document, self.output_format) if document.blocks else None
+                entry = (body, heading.text if heading is not None else None)
+                self.block_cache.put(key, *entry)
+            elif anchors is not None and entry[1] is not None:
+                anchors(entry[1])
+            body, heading = entry
+            if title is None:
+                title = heading
+            if body is not None:
+                if usage is not None:
+                    usage.add_output(body, self.limits)
+                bodies.append(body)
+            char += len(chunk)
+        head, tail = backend.wrap(title or "" if backend.titled else "", self._template)
+        if usage is not None:
+            usage.add_output(head + tail, self.limits)
+        return head + backend.separator.join(bodies) + tail
+
+    def _batch_renderer(self):
+        """Returns a function that renders a text like render and shares its setup across calls."""
+        backend = get_backend(self.output_format)
+        separator = backend.separator
+        build = backend.build
+        parse = self._parse_document
+        template = self._template
+        fragments = []
+        skeletons = {}
+
+        def render(text: str) -> str:
+            document = parse(text)
+            del fragments[:]
+            for index, block in enumerate(document.blocks):
+                if index:
+                    fragments.append(separator)
+                build(fragments, block)
+            title = ""
+            if backend.titled:
+                heading = document.find(Heading)
+                title = heading.text if heading is not None else ""
+            skeleton = skeletons.get(title)
+            if skeleton is None:
+                if len(skeletons) >= SKELETON_LIMIT:
+                    skeletons.clear()
+                skeleton = skeletons[title] = backend.wrap(title, template)
+            return skeleton[0] + "".join(fragments) + skeleton[1]
+
+        return render
+
+    def _parse_document(self, text: str) -> Document:
+        """Parses the given text like parse and sets the anchors of the headings if the renderer adds them.
+
+        :param str text: the input text
+        """
+        document = self.parse(text)
+        if self.anchors:
+            add_anchors(document)
+        return document
+
+    def _cache_key(self, text: str) -> str:
+        """Returns the key of the given text in the cache.
+
+        :param str text: the input text
+        """
+        # the engine and the budgets decide whether invalid text raises a ParseError or is rendered leniently
+        return self.cache.key(text, self.output_format, engine=self.engine, budget=self.budget,
+                              time_budget=self.time_budget, anchors=self.anchors)
+
+    def _parse(self, text: str, budget: Budget = None) -> Document:
+        """Parses the given text with the engine of the renderer and returns the document.
+
+        :param str text: the input text
+        :param Budget budget: the budget of a grammar parse or None
+        """
+        if self.instrumentation is not None:
+            return self._parse_instrumented(text, budget)
+        usage = getattr(self._local, "usage", None)
+        if self.engine == "scanner":
+            document = scan(text)
+        else:
+            parser = self._parser()
+            try:
+                result = parser.parse_string(text, self._session_data(budget, usage))
+                if usage is not None:
+                    usage.add_grammar(result, self.limits)
+                document = from_grammar(result)
+            finally:
+                # don't keep the text of a failed parse around until the next document
+                parser.reset()
+        if usage is not None:
+            usage.add_document(document, self.limits)
+        return document
+
+    def _session_data(self, budget: Budget, usage: Usage) -> map:
+        """Returns the session data of a grammar parse or None if the parse needs none.
+
+        :param Budget budget: the budget of the parse or None
+        :param Usage usage: the usage of the render or None
+        """
+        data = {}
+        if budget is not None:
+            data["budget"] = budget
+        if usage is not None and self.limits is not None and (self.limits.nodes, self.limits.depth) != (None, None):
+            # the grammar result is counted while it is parsed, so that a parse stops before the whole tree is built
+            data["counter"] = TreeCounter(usage, self.limits)
+        return data or None
+
+    def _scan_leniently(self, text: str) -> Document:
+        """Scans the given text in lenient mode, which takes linear time and never fails.
+
+        :param str text: the input text
+        """
+        usage = getattr(self._local, "usage", None)
+        if self.instrumentation is None:
+            document = scan(text, lenient=True)
+        else:
+            with measure(self.instrumentation, "fallback"):
+                document = scan(text, lenient=True)
+            self.instrumentation.nodes("document", count_nodes(document))
+        if usage is not None:
+            usage.add_document(document, self.limits)
+        return document
+
+    def _parser(self) -> modgrammar.GrammarParser:
+        """Returns the grammar parser of the current thread."""
+        parser = getattr(self._local, "parser", None)
+        if parser is None:
+            # the grammar classes are built on the first grammar parse, which keeps the startup of the program short
+            from .grammars import MarkdownGrammar
+            parser = MarkdownGrammar.parser()
+            self._local.parser = parser
+        return parser
+
+    def _parse_instrumented(self, text: str, budget: Budget = None) -> Document:
+        """Parses the given text like _parse and reports the time of the stages and the node counts.
+
+        :param str text: the input text
+        :param Budget budget: the budget of a grammar parse or None
+        """
+        instrumentation = self.instrumentation
+        usage = getattr(self._local, "usage", None)
+        if self.engine == "scanner":
+            with measure(instrumentation, "parse"):
+                document = scan(text)
+        else:
+            parser = self._parser()
+            try:
+                with measure(instrumentation, "parse"):
+                    result = parser.parse_string(text, self._session_data(budget, usage))
+                instrumentation.nodes("grammar", count_grammar_nodes(result))
+                if usage is not None:
+                    usage.add_grammar(result, self.limits)
+                with measure(instrumentation, "convert"):
+                    document = from_grammar(result)
+            finally:
+                parser.reset()
+        instrumentation.nodes("document", count_nodes(document))
+        if usage is not None:
+            usage.add_document(document, self.limits)
+        return document
+
+    def _render_instrumented(self, text: str) -> str:
+        """Renders the given text like render and reports the time of the stages and the sizes.
+
+        :param str text: the input text
+        """
+        instrumentation = self.instrumentation
+        usage = self._start_usage(text)
+        profiler = instrumentation.profiler()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            output = None
+            if self.cache is not None:
+                key = self._cache_key(text)
+                with measure(instrumentation, "cache"):
+                    output = self.cache.get(key)
+                if output is not None:
+                    usage.add_output(output, self.limits)
+            if output is None:
+                if self.block_cache is not None:
+                    # the chunks that are parsed are measured by _parse_instrumented
+                    output = self._render(text)
+                else:
+                    document = self._parse_instrumented(text)
+                    if self.anchors:
+                        add_anchors(document)
+                    with measure(instrumentation, "transform"):
+                        output = self._transform_accounted(document, usage)
+                if self.cache is not None:
+                    self.cache.put(key, output)
+        finally:
+            self._local.usage = None
+            if profiler is not None:
+                profiler.disable()
+        instrumentation.sizes(len(text), len(output))
+        instrumentation.memory(usage)
+        return output
+
+    def _render_limited(self, text: str) -> str:
+        """Renders the given text like render and stops as soon as it exceeds the limits.
+
+        :param str text: the input text
+        :raises LimitExceeded: if the text exceeds the limits
+        """
+        usage = self._start_usage(text)
+        try:
+            if self.cache is None:
+                return self._render(text)
+            key = self._cache_key(text)
+            output = self.cache.get(key)
+            if output is None:
+                output = self._render(text)
+                self.cache.put(key, output)
+            else:
+                usage.add_output(output, self.limits)
+            return output
+        finally:
+            self._local.usage = None
+
+    def _render_iter_limited(self, source):
+        """Yields the output of the source like render_iter and stops as soon as it exceeds the limits.
+
+        :param source: the input text or a file object or iterable of lines
+        :raises LimitExceeded: if the text read so far exceeds the limits
+        """
+        usage = Usage()
+        for piece in transform_iter(self._parse_chunks(source, usage), self.output_format, self._template):
+            usage.add_output(piece, self.limits)
+            yield piece
+
+    def _start_usage(self, text: str) -> Usage:
+        """Starts the accounting of a render of the given text in the current thread and returns the usage.
+
+        The parse methods add their trees to the usage of the current thread.
+
+        :param str text: the input text
+        :raises LimitExceeded: if the text exceeds the limit of the input
+        """
+        usage = Usage()
+        usage.add_input(text, self.limits)
+        self._local.usage = usage
+        return usage
+
+    def _transform_accounted(self, document: Document, usage: Usage) -> str:
+        """Transforms the document like transform and adds the output to the usage.
+
+        With an output limit the output is built piece by piece and stops before the pieces are joined.
+
+        :param Document document: the document
+        :param Usage usage: the usage of the render
+        :raises LimitExceeded: if the output exceeds the limit
+        """
+        if self.limits is None or self.limits.output_bytes is None:
+            output = self.transform(document)
+            usage.add_output(output, self.limits)
+            return output
+        pieces = []
+        for piece in transform_iter([document], self.output_format, self._template):
+            usage.add_output(piece, self.limits)
+            pieces.append(piece)
+        return "".join(pieces)
+
+    def _parse_chunks(self, source, usage: Usage = None):
+        """Yields the parse result of every chunk of the source.
+
+        :param source: the input text or a file object or iterable of lines
+        :param Usage usage: the usage to which the chunks and their trees are added or None
+        """
+        anchors = Anchors() if self.anchors else None
+        char = 0
+        for line, chunk in split(source):
+            if usage is not None:
+                usage.add_input(chunk, self.limits)
+                self._local.usage = usage
+            try:
+                document = self.parse(chunk)
+            except modgrammar.ParseError as pe:
+                _shift_error(pe, line, char)
+                raise
+            finally:
+                if usage is not None:
+                    # the generator may be resumed by another thread
+                    self._local.usage = None
+            if anchors is not None:
+                add_anchors(document, anchors)
+            yield document
+            char += len(chunk)
+
+
+def _shift_error(pe: modgrammar.ParseError, line: int, char: int):
+    """Moves the position of a parse error of a chunk to the position in the whole text.
+
+    :param modgrammar.ParseError pe: the parse error, whose position is relative to the chunk
+    :param int line: the line of the start of the chunk
+    :param int char: the offset of the start of the chunk
+    """
+    pe.line = pe.line + line if pe.line is not None else None
+    pe.char += char
@@ -0,0 +1,568 @@
+# coding=utf-8
+
+#   Copyright 2017 Jim Martens
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""markdown.scanner: provides a line-oriented block scanner
+
+The scanner classifies every line by the rules of the block grammars and then chooses the blocks in the same order
+in which the MarkdownGrammar would try its alternatives. The inline content of the lines is tokenized by the inline
+module. The result is the same document that nodes.from_grammar returns for the result of the MarkdownGrammar.
+
+Blocks start and end at positions. The position 2 * i is the start of the line i. A line break of two characters
+(\\r\\n or \\n\\r) can also be matched as two line breaks with an empty line between them. The position 2 * i - 1
+is the start of this empty line before the line i.
+
+The split function cuts a text at block boundaries without scanning it completely, so that long texts can be
+rendered block by block.
+"""
+import re
+
+import modgrammar
+
+from . import fence
+from .inline import tokenize
+from .nodes import CodeBlock, Document, Heading, List, ListItem, Paragraph, Quote, Text, join_lines
+
+_LINE = re.compile("([^" + modgrammar.util.EOL_CHARS + "]*)(\n\r|\r\n|[" + modgrammar.util.EOL_CHARS + "])?")
+_PIECE = re.compile("[^\n\r]*(?:\r\n|\n|\r)?")
+_OTHER_EOL_CHARS = modgrammar.util.EOL_CHARS.replace("\n", "")
+_HEADING = re.compile("(#{1,6}) ")
+_UNORDERED_ITEM = re.compile("[*+-] ")
+_ORDERED_ITEM = re.compile("[0-9]+\\. ")
+
+
+class _Line:
+    """Holds the classification of a single line."""
+    __slots__ = ("blank", "heading", "code", "quote", "unordered", "ordered", "text", "split")
+
+    def __init__(self, content: str, linebreak: str):
+        """Classifies the given line content.
+
+        :param str content: the content of the line without the line break
+        :param str linebreak: the line break at the end of the line
+        """
+        self.blank = content == "" or content.isspace()
+        match = _HEADING.match(content)
+        self.heading = (len(match.group(1)), content[match.end():]) if match is not None else None
+        if content.startswith("    "):
+            self.code = content[4:]
+        elif content.startswith("\t"):
+            self.code = content[1:]
+        else:
+            self.code = None
+        self.quote = tokenize(content[1:]) if content.startswith(">") else None
+        match = _UNORDERED_ITEM.match(content)
+        self.unordered = tokenize(content[2:]) if match is not None else None
+        match = _ORDERED_ITEM.match(content)
+        self.ordered = tokenize(content[match.end():]) if match is not None else None
+        self.text = tokenize(content) if not self.blank else None
+        self.split = len(linebreak) == 2
+
+
+class _DeadLine:
+    """Stands for a line that can't be matched by any block (e.g. a last line without line break)."""
+    blank = False
+    heading = None
+    code = None
+    quote = None
+    unordered = None
+    ordered = None
+    text = None
+    split = False
+
+
+def scan(text: str, lenient: bool = False) -> Document:
+    """Scans the given text and returns the document.
+
+    In lenient mode a missing line break at the end is added and every chunk (as returned by split) that doesn't
+    match is taken as literal text, with the inline elements of the lines that match on their own.
+
+    :param str text: the input text
+    :param bool lenient: True if the blocks that don't match should be taken as literal text
+    :raises modgrammar.ParseError: if the text is no valid markdown as per the grammar definition and not lenient
+    """
+    if lenient:
+        if text and text[-1] not in modgrammar.util.EOL_CHARS:
+            text += "\n"
+        blocks = []
+        for _line, chunk in split(text):
+            try:
+                blocks.extend(scan(chunk).blocks)
+            except modgrammar.ParseError:
+                blocks.extend(_literal_blocks(chunk))
+        return Document(blocks)
+
+    if "```" in text:
+        fenced = list(fence.find(text))
+        if fenced:
+            return _scan_fenced(text, fenced)
+
+    lines, offsets = _split_lines(text)
+    choices = _choose_blocks(lines)
+    if choices[0] is None:
+        _raise_parse_error(text, lines, offsets)
+
+    blocks = []
+    pos = 0
+    while pos < 2 * len(lines):
+        end, block = choices[pos]
+        if block is not None:
+            blocks.append(_build_block(lines, *block))
+        pos = end
+
+    return Document(blocks)
+
+
+def split(source, pos: int = 0):
+    """Splits the source into chunks at positions that every match of the MarkdownGrammar passes through.
+
+    The source is read line by line. Every chunk can be parsed on its own and the results of all chunks are the
+    same as the result of the whole text. Yields a tuple (line, chunk) with the index of the first line of each chunk.
+
+    A chunk ends before a line that
+
+    * starts with a # (only a heading can contain it),
+    * starts with a > and doesn't follow such a line (only a quote can contain it) or
+    * is neither empty, a list item nor code and follows an empty line that isn't code (a paragraph starts there
+      whether or not the empty line belongs to it) or
+    * opens a fenced code block or follows one (only a fenced code block can contain the fence lines). A fenced
+      code block is never split, whatever its lines start with.
+
+    :param source: the input text or a file object or iterable of lines
+    :param int pos: the offset in the text at which to start, which must be the start of a chunk
+    """
+    if isinstance(source, str):
+        yield from _split_text(source, pos)
+    else:
+        yield from _split_pieces(_fence_lines(source))
+
+
+def _split_text(text: str, pos: int):
+    """Splits the text like split. Every fenced code block is found with a single search and becomes one chunk.
+
+    :param str text: the input text
+    :param int pos: the offset in the text at which to start, which must be the start of a chunk
+    """
+    line = 0
+    for start, end, _code in fence.find(text, pos):
+        for chunk_line, chunk in _split_pieces(_pieces(text, pos, start)):
+            yield line + chunk_line, chunk
+        line += _count_lines(text[pos:start])
+        chunk = text[start:end]
+        yield line, chunk
+        line += _count_lines(chunk)
+        pos = end
+    for chunk_line, chunk in _split_pieces(_pieces(text, pos, len(text))):
+        yield line + chunk_line, chunk
+
+
+def _split_pieces(pieces):
+    """Splits the pieces of a source like split.
+
+    :param pieces: an iterable of pieces, which are lines or text of several lines
+    """
+    chunk = []
+    line = 0
+    chunk_line = 0
+    previous = None
+    fenced = False
+    after_fence = False
+    for piece in pieces:
+        match = _LINE.match(piece)
+        content = match.group(1)
+        single = match.end() == len(piece) and match.group(2) is not None
+        at_line_start = not chunk or chunk[-1][-1] in "\n\r"
+        if fenced:
+            # the code of a fenced code block runs up to the closing fence
+            fenced = not (piece.startswith("```") and single and at_line_start and fence.is_closing(piece))
+            after_fence = not fenced
+        elif after_fence and chunk[-1][-1] == "\n" and piece == "\r":
+            # the line break \n\r ends the closing fence
+            pass
+        else:
+            opening = at_line_start and content.startswith("```") and fence.is_opening(piece)
+            if chunk and at_line_start and (after_fence or content and (opening or _starts_block(content, previous))):
+                yield chunk_line, "".join(chunk)
+                chunk = []
+                chunk_line = line
+            after_fence = False
+            fenced = opening
+        chunk.append(piece)
+        line += 1 if single else _count_lines(piece)
+        # the previous line is only known if the piece is exactly one line
+        previous = content if single else None
+    if chunk:
+        yield chunk_line, "".join(chunk)
+
+
+def _count_lines(text: str) -> int:
+    """Returns the number of line breaks in the text as counted by modgrammar.
+
+    :param str text: the text
+    """
+    if not any(char in text for char in _OTHER_EOL_CHARS):
+        return text.count("\n")
+    return len(modgrammar.util.EOL_RE.findall(text))
+
+
+def _pieces(text: str, start: int, end: int):
+    """Yields the lines of the text between the given offsets.
+
+    :param str text: the input text
+    :param int start: the offset of the first line
+    :param int end: the offset after the last line
+    """
+    return (match.group() for match in _PIECE.finditer(text, start, end) if match.end() > match.start())
+
+
+def _fence_lines(source):
+    """Yields the pieces of the source and splits those that may contain a fence or a line break \\r into lines.
+
+    :param source: a file object or iterable of lines
+    """
+    for piece in source:
+        if "```" in piece or "\r" in piece:
+            yield from _pieces(piece, 0, len(piece))
+        else:
+            yield piece
+
+
+def _scan_fenced(text: str, fenced: list) -> Document:
+    """Scans the text around the given fenced code blocks and returns the document.
+
+    Every match of the MarkdownGrammar passes through the start and the end of a fenced code block, so the text
+    between them is scanned on its own.
+
+    :param str text: the input text
+    :param list fenced: the tuples (start, end, code) of the fenced code blocks as returned by fence.find
+    """
+    blocks = []
+    pos = 0
+    for start, end, code in fenced + [(len(text), len(text), None)]:
+        try:
+            blocks.extend(scan(text[pos:start]).blocks)
+        except modgrammar.ParseError as pe:
+            # the position is relative to the text between the fenced code blocks
+            if pe.line is not None:
+                pe.line += modgrammar.util.calc_line_col(text, pos)[0]
+            pe.char += pos
+            raise
+        if code is not None:
+            blocks.append(CodeBlock(code))
+        pos = end
+    return Document(blocks)
+
+
+def _starts_block(content: str, previous: str) -> bool:
+    """Returns True if every match of the MarkdownGrammar passes through the start of the given line.
+
+    :param str content: the content of the line, which is not empty
+    :param str previous: the content of the line before or None if it isn't known
+    """
+    if content.startswith("#"):
+        return True
+    if previous is None:
+        return False
+    if content.startswith(">"):
+        return not previous.startswith(">")
+    previous_empty = (previous == "" or previous.isspace()) and not _is_code(previous)
+    return (previous_empty and not content.isspace() and not _is_code(content)
+            and _UNORDERED_ITEM.match(content) is None and _ORDERED_ITEM.match(content) is None)
+
+
+def _is_code(content: str) -> bool:
+    """Returns True if the line content can be matched by a code block.
+
+    :param str content: the content of the line
+    """
+    return content.startswith("    ") or content.startswith("\t")
+
+
+def _split_lines(text: str) -> tuple:
+    """Splits the text into lines and classifies them.
+
+    Returns the list of classified lines and the offset at which each line starts.
+
+    :param str text: the input text
+    """
+    lines = []
+    offsets = []
+    pos = 0
+    at_line_start = True
+    while pos < len(text):
+        match = _LINE.match(text, pos)
+        offsets.append(pos)
+        linebreak = match.group(2)
+        if linebreak is None or not at_line_start:
+            # no line break at the end of the text or the line doesn't start at the beginning of a line
+            lines.append(_DeadLine)
+        else:
+            lines.append(_Line(match.group(1), linebreak))
+        at_line_start = linebreak is not None and linebreak[-1] in "\n\r"
+        pos = match.end()
+    offsets.append(pos)
+    return lines, offsets
+
+
+def _choose_blocks(lines: list) -> list:
+    """Chooses the block for every position from which the rest of the text can be matched.
+
+    The alternatives are tried in the order of the MarkdownGrammar and each alternative tries its longest match
+    first. Therefore the first choice that leaves a matchable rest is the one the grammar would find.
+    Returns a list with a tuple (end, block) for each position or None if the rest can't be matched.
+
+    :param list lines: the classified lines
+    """
+    runs = _classify(lines)
+    skips = _skips(lines)
+    choices = [None] * (2 * len(lines)) + [(2 * len(lines), None)]
+    for pos in range(2 * len(lines) - 1, -1, -1):
+        if pos % 2 and not lines[pos // 2].split:
+            continue
+        for end, block in _candidates(pos, lines, runs, skips):
+            if choices[end] is not None:
+                choices[pos] = (end, block)
+                break
+
+    return choices
+
+
+def _classify(lines: list) -> map:
+    """Returns for every classification how many lines in a row have it from each line index on.
+
+    Blank lines are not counted but marked with True or False.
+
+    :param list lines: the classified lines
+    """
+    runs = {"blank": [line.blank for line in lines] + [False]}
+    for attribute in ("text", "quote", "unordered", "ordered", "code"):
+        run = [0] * (len(lines) + 1)
+        for index in range(len(lines) - 1, -1, -1):
+            if getattr(lines[index], attribute) is not None:
+                run[index] = run[index + 1] + 1
+        runs[attribute] = run
+    return runs
+
+
+def _candidates(pos: int, lines: list, runs: map, skips: map):
+    """Yields the blocks that can start at the given position in the order the MarkdownGrammar tries them.
+
+    Each candidate is a tuple (end, block) where end is the position after the block and block is the tuple
+    (kind, start, end) describing the content lines or None for an empty line. Blocks whose last line was yielded
+    before and not chosen are skipped, since the positions after them are the same.
+
+    :param int pos: the position
+    :param list lines: the classified lines
+    :param map runs: the classification runs
+    :param map skips: the skipped last lines of blocks that end at a line break and of surrounded blocks
+    """
+    index = pos // 2
+    line_start = pos % 2 == 0
+    blank = _is_blank(pos, runs)
+    # lists, paragraphs and pre blocks may start with an empty line, which is tried first
+    starts = [end // 2 for end in _empty_line_ends(pos, lines) if end % 2 == 0] if blank else []
+
+    if line_start and lines[index].heading is not None:
+        for end in _line_ends(index + 1, lines):
+            yield end, ("heading", index, index + 1)
+    for kind in ("unordered", "ordered"):
+        for start in starts:
+            for last in skips["line"].lasts(start + runs[kind][start], start):
+                for end in _line_ends(last, lines):
+                    yield end, (kind, start, last)
+    if line_start:
+        for last in skips["line"].lasts(index + runs["quote"][index], index):
+            for end in _line_ends(last, lines):
+                yield end, ("quote", index, last)
+    if line_start:
+        starts.append(index)
+    yield from _surrounded(starts, "paragraph", lines, runs, skips["surrounded"])
+    if blank:
+        for end in _empty_line_ends(pos, lines):
+            yield end, None
+    yield from _surrounded(starts, "pre", lines, runs, skips["surrounded"])
+
+
+def _surrounded(starts: list, kind: str, lines: list, runs: map, skips):
+    """Yields all blocks of the given kind that may be followed by an empty line.
+
+    :param list starts: the indices of the lines at which the block content may start
+    :param str kind: the kind of block
+    :param list lines: the classified lines
+    :param map runs: the classification runs
+    :param _Skips skips: the skipped last lines of surrounded blocks
+    """
+    run = runs["text"] if kind == "paragraph" else runs["code"]
+    for start in starts:
+        for last in skips.lasts(start + run[start], start):
+            for end in _line_ends(last, lines):
+                if _is_blank(end, runs):
+                    for empty_end in _empty_line_ends(end, lines):
+                        yield empty_end, (kind, start, last)
+                yield end, (kind, start, last)
+
+
+class _Skips:
+    """Holds the line indices that are skipped as last line of a block, with path compression.
+
+    Whether a block can be chosen only depends on the positions after it. Once all positions after a last line
+    were tried without success, no other block with this last line needs to try them again. This keeps the scan
+    linear for long runs of lines that end in a line that doesn't match.
+    """
+    __slots__ = ("_next",)
+
+    def __init__(self, size: int):
+        """Initializes the skips without any skipped index.
+
+        :param int size: the number of line indices
+        """
+        self._next = list(range(size))
+
+    def lasts(self, first: int, stop: int):
+        """Yields the indices from first down to stop (exclusive) that aren't skipped.
+
+        Every index is skipped after the caller resumed the iteration, i.e. after it tried all blocks ending there.
+
+        :param int first: the first index
+        :param int stop: the index at which to stop
+        """
+        last = self._find(first)
+        while last > stop:
+            yield last
+            self._next[last] = last - 1
+            last = self._find(last - 1)
+
+    def _find(self, index: int) -> int:
+        """Returns the largest index up to the given one that isn't skipped.
+
+        :param int index: the index
+        """
+        following = self._next
+        root = index
+        while root >= 0 and following[root] != root:
+            root = following[root]
+        while index >= 0 and following[index] != index:
+            following[index], index = root, following[index]
+        return root
+
+
+def _skips(lines: list) -> map:
+    """Returns the skips for blocks that end at a line break and for surrounded blocks.
+
+    :param list lines: the classified lines
+    """
+    return {"line": _Skips(len(lines) + 1), "surrounded": _Skips(len(lines) + 1)}
+
+
+def _line_ends(index: int, lines: list) -> list:
+    """Returns the positions at which the line break before the given line index can end.
+
+    :param int index: the index of the line after the line break
+    :param list lines: the classified lines
+    """
+    if lines[index - 1].split:
+        return [2 * index, 2 * index - 1]
+    return [2 * index]
+
+
+def _empty_line_ends(pos: int, lines: list) -> list:
+    """Returns the positions at which an empty line at the given position can end.
+
+    :param int pos: the position of the empty line
+    :param list lines: the classified lines
+    """
+    if pos % 2:
+        return [pos + 1]
+    return _line_ends(pos // 2 + 1, lines)
+
+
+def _is_blank(pos: int, runs: map) -> bool:
+    """Returns True if an empty line starts at the given position.
+
+    :param int pos: the position
+    :param map runs: the classification runs
+    """
+    return pos % 2 == 1 or runs["blank"][pos // 2]
+
+
+def _build_block(lines: list, kind: str, start: int, end: int):
+    """Builds the node for the chosen block.
+
+    :param list lines: the classified lines
+    :param str kind: the kind of block
+    :param int start: the index of the first line of the block content
+    :param int end: the index after the last line of the block content
+    """
+    if kind == "heading":
+        level, text = lines[start].heading
+        return Heading(level, text)
+    if kind in ("unordered", "ordered"):
+        return List(kind == "ordered", [ListItem(getattr(lines[index], kind)) for index in range(start, end)])
+    if kind == "quote":
+        return Quote(join_lines([lines[index].quote for index in range(start, end)]))
+    if kind == "paragraph":
+        return Paragraph(join_lines([lines[index].text for index in range(start, end)]))
+
+    return CodeBlock("\n".join(lines[index].code for index in range(start, end)))
+
+
+def _literal_blocks(chunk: str) -> list:
+    """Returns the headings and paragraphs of a chunk that doesn't match.
+
+    Lines whose inline content doesn't match are literal text.
+
+    :param str chunk: the chunk
+    """
+    blocks = []
+    lines = []
+    for content in chunk.splitlines() + [""]:
+        match = _HEADING.match(content)
+        if content == "" or content.isspace() or match is not None:
+            if lines:
+                blocks.append(Paragraph(join_lines(lines)))
+                lines = []
+            if match is not None:
+                blocks.append(Heading(len(match.group(1)), content[match.end():]))
+        else:
+            lines.append(tokenize(content) or [Text(content)])
+    return blocks
+
+
+def _raise_parse_error(text: str, lines: list, offsets: list):
+    """Raises a parse error at the start of the furthest line that a sequence of blocks can reach.
+
+    :param str text: the input text
+    :param list lines: the classified lines
+    :param list offsets: the offset at which each line starts
+    """
+    runs = _classify(lines)
+    skips = _skips(lines)
+    reachable = [False] * (2 * len(lines) + 1)
+    reachable[0] = True
+    furthest = 0
+    for pos in range(2 * len(lines)):
+        if not reachable[pos]:
+            continue
+        furthest = pos
+        for end, block in _candidates(pos, lines, runs, skips):
+            reachable[end] = True
+
+    pos = offsets[(furthest + 1) // 2]
+    line = modgrammar.util.calc_line_col(text, pos)[0]
+    # the grammar classes are built when they are needed, so the scanner engine only pays for them on errors
+    from . import grammars
+    expected = [grammars.Heading, grammars.UnorderedList, grammars.OrderedList, grammars.Quote, grammars.Paragraph,
+                grammars.EmptyLine, grammars.PreBlock]
+    raise modgrammar.ParseError(grammars.MarkdownGrammar, text, pos, pos, line=line, col=0, expected=expected)
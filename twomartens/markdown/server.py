@@ -0,0 +1,221 @@
+# coding=utf-8
+
+#   Copyright 2017 Jim Martens
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""markdown.server: provides the entry point of a local render server over HTTP or stdin/stdout"""
+import argparse
+import asyncio
+import json
+import sys
+
+import modgrammar
+
+from .limits import LimitExceeded, Limits
+from .service import DocumentTooLarge, Overloaded, RenderService
+from .transform import BACKENDS, get_backend
+
+_REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large",
+            422: "Unprocessable Entity", 503: "Service Unavailable", 504: "Gateway Timeout"}
+
+
+def main():
+    """The entry point of the server."""
+    parser = argparse.ArgumentParser(description="Serves renders of markdown over HTTP or stdin/stdout.")
+    parser.add_argument("-f", "--format", dest="format", default="html", choices=sorted(BACKENDS),
+                        help="This describes the output format.")
+    parser.add_argument("-e", "--engine", dest="engine", default="grammar", choices=["grammar", "scanner"],
+                        help="This describes the parser engine.")
+    parser.add_argument("--budget", dest="budget", type=float, default=None, metavar="steps",
+                        help="Parses in guarded mode with this many grammar steps per character.")
+    parser.add_argument("--stdio", dest="stdio", action="store_true",
+                        help="Reads one JSON request per line from stdin instead of serving HTTP.")
+    parser.add_argument("--host", dest="host", default="127.0.0.1", help="The address to listen on.")
+    parser.add_argument("--port", dest="port", type=int, default=8080, help="The port to listen on.")
+    parser.add_argument("-j", "--jobs", dest="jobs", type=int, default=None,
+                        help="The number of workers (defaults to the number of CPUs).")
+    parser.add_argument("--threads", dest="processes", action="store_false",
+                        help="Renders in worker threads instead of processes, which a timeout can't stop.")
+    parser.add_argument("--max-waiting", dest="max_waiting", type=int, default=64,
+                        help="The number of renders that may wait for a worker before new ones are rejected.")
+    parser.add_argument("--max-size", dest="max_size", type=int, default=1024 * 1024,
+                        help="The maximum number of characters of a text.")
+    parser.add_argument("--timeout", dest="timeout", type=float, default=10.0,
+                        help="The seconds after which a render is cancelled.")
+    parser.add_argument("--max-nodes", dest="max_nodes", type=int, default=None,
+                        help="The maximum number of nodes of the parse trees of a text.")
+    parser.add_argument("--max-depth", dest="max_depth", type=int, default=None,
+                        help="The maximum depth of the parse trees of a text.")
+    parser.add_argument("--max-output", dest="max_output", type=int, default=None, metavar="bytes",
+                        help="The maximum bytes of the output of a text.")
+
+    args = parser.parse_args()
+
+    limits = None
+    if (args.max_nodes, args.max_depth, args.max_output) != (None, None, None):
+        limits = Limits(nodes=args.max_nodes, depth=args.max_depth, output_bytes=args.max_output)
+    service = RenderService(args.format, args.engine, args.jobs, args.processes, args.max_waiting, args.max_size,
+                            args.timeout, args.budget, limits)
+    try:
+        if args.stdio:
+            _run(serve_stdio(service))
+        else:
+            _run(serve_http(service, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+
+
+async def serve_http(service: RenderService, host: str, port: int):
+    """Serves renders over HTTP until cancelled.
+
+    Every POST request is rendered with its body as text. The connection is closed after the response.
+
+    :param RenderService service: the render service
+    :param str host: the address to listen on
+    :param int port: the port to listen on
+    """
+    media_type = get_backend(service.output_format).media_type
+
+    async def handle(reader, writer):
+        try:
+            status, body = await _handle_request(service, reader)
+        except (ValueError, asyncio.IncompleteReadError):
+            status, body = 400, "malformed request\n"
+        data = body.encode("utf-8")
+        content_type = media_type if status == 200 else "text/plain"
+        writer.write("HTTP/1.1 {} {}\r\nContent-Type: {}; charset=utf-8\r\nContent-Length: {}\r\n"
+                     "Connection: close\r\n\r\n".format(status, _REASONS[status], content_type,
+                                                        len(data)).encode("ascii"))
+        writer.write(data)
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+        writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    print("Serving on http://{}:{}/".format(host, port), file=sys.stderr)
+    try:
+        # wait until the task is cancelled
+        await asyncio.get_event_loop().create_future()
+    finally:
+        server.close()
+
+
+async def serve_stdio(service: RenderService):
+    """Serves renders over stdin and stdout until stdin is closed.
+
+    Every line of stdin is a JSON object with an id and a text. For every line a JSON object with the same id and
+    either the output or an error is written to stdout as soon as it is ready, so the responses can arrive in another
+    order than the requests.
+
+    :param RenderService service: the render service
+    """
+    loop = asyncio.get_event_loop()
+    tasks = set()
+    while True:
+        line = await loop.run_in_executor(None, sys.stdin.readline)
+        if not line:
+            break
+        if not line.strip():
+            continue
+        task = asyncio.ensure_future(_handle_line(service, line))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+    if tasks:
+        await asyncio.wait(tasks)
+
+
+async def _handle_request(service: RenderService, reader) -> tuple:
+    """Reads one HTTP request and returns the status and body of the response.
+
+    :param RenderService service: the render service
+    :param reader: the stream reader of the connection
+    """
+    request_line = (await reader.readline()).decode("latin-1").split()
+    if len(request_line) != 3:
+        raise ValueError("malformed request line")
+    method, path, _version = request_line
+    length = 0
+    while True:
+        header = (await reader.readline()).decode("latin-1")
+        if header in ("\r\n", "\n", ""):
+            break
+        name, _sep, value = header.partition(":")
+        if name.strip().lower() == "content-length":
+            length = int(value)
+    if path.split("?")[0] not in ("/", "/render"):
+        return 404, "not found\n"
+    if method != "POST":
+        return 405, "use POST with the markdown text as body\n"
+    # a character takes at most 4 bytes in UTF-8, so larger bodies are rejected before they are read
+    if length > 4 * service.max_size:
+        return 413, "the text is too large\n"
+    return await _render(service, (await reader.readexactly(length)).decode("utf-8"))
+
+
+async def _handle_line(service: RenderService, line: str):
+    """Renders the request of one line of stdin and writes the response to stdout.
+
+    :param RenderService service: the render service
+    :param str line: the JSON request
+    """
+    request_id = text = None
+    try:
+        request = json.loads(line)
+        request_id, text = request.get("id"), request.get("text")
+    except (ValueError, AttributeError):
+        pass
+    if isinstance(text, str):
+        status, body = await _render(service, text)
+    else:
+        status, body = 400, "malformed request"
+    response = {"id": request_id}
+    if status == 200:
+        response["output"] = body
+    else:
+        response["status"] = status
+        response["error"] = body.rstrip("\n")
+    sys.stdout.write(json.dumps(response) + "\n")
+    sys.stdout.flush()
+
+
+async def _render(service: RenderService, text: str) -> tuple:
+    """Renders the text and returns the HTTP status and the output or error message.
+
+    :param RenderService service: the render service
+    :param str text: the input text
+    """
+    try:
+        return 200, await service.render(text)
+    except (DocumentTooLarge, LimitExceeded) as error:
+        return 413, "{}\n".format(error)
+    except modgrammar.ParseError as pe:
+        return 422, "{}\n".format(pe)
+    except Overloaded as error:
+        return 503, "{}\n".format(error)
+    except asyncio.TimeoutError:
+        return 504, "the render took longer than {} seconds\n".format(service.timeout)
+
+
+def _run(coroutine):
+    """Runs the coroutine in an event loop until it is done.
+
+    :param coroutine: the coroutine
+    """
+    if hasattr(asyncio, "run"):
+        return asyncio.run(coroutine)
+    return asyncio.get_event_loop().run_until_complete(coroutine)
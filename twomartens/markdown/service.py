@@ -0,0 +1,198 @@
+# coding=utf-8
+
+#   Copyright 2017 Jim Martens
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""markdown.service: provides asynchronous rendering with a bounded pool of workers"""
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import modgrammar
+
+from .limits import Limits
+from .renderer import Renderer
+
+_process_renderer = None
+
+
+class DocumentTooLarge(ValueError):
+    """Raised if a text is larger than the size limit of the service."""
+    pass
+
+
+class Overloaded(Exception):
+    """Raised if too many renders are waiting for a worker."""
+    pass
+
+
+class RenderService:
+    """Renders texts in a pool of worker threads or processes without blocking the event loop.
+
+    At most one render runs per worker. Further renders wait for a free worker, and if too many are waiting a new
+    render fails with Overloaded at once, so that a server can reject it. A render that takes longer than the timeout
+    fails with asyncio.TimeoutError. The workers are processes by default, so the worker of a runaway render is
+    killed and replaced. A thread can't be killed, so in a thread pool the worker stays busy until the render ends.
+    """
+
+    def __init__(self, output_format: str = "html", engine: str = "grammar", workers: int = None,
+                 processes: bool = True, max_waiting: int = 64, max_size: int = 1024 * 1024, timeout: float = 10.0,
+                 budget: float = None, limits: Limits = None):
+        """Initializes the service. The workers are started with the first render.
+
+        :param str output_format: the output format
+        :param str engine: the parser engine (grammar or scanner)
+        :param int workers: the number of workers, defaults to the number of CPUs
+        :param bool processes: False if the workers are threads instead of processes
+        :param int max_waiting: the number of renders that may wait for a worker
+        :param int max_size: the maximum number of characters of a text
+        :param float timeout: the seconds after which a render is cancelled or None
+        :param float budget: the grammar steps per character for guarded mode or None
+        :param Limits limits: the limits of a render or None
+        """
+        self.output_format = output_format
+        self.engine = engine
+        self.workers = workers or os.cpu_count() or 1
+        self.processes = processes
+        self.max_waiting = max_waiting
+        self.max_size = max_size
+        self.timeout = timeout
+        self.budget = budget
+        self.limits = limits
+        self._renderer = Renderer(output_format, engine, budget=budget, limits=limits) if not processes else None
+        self._threads = None
+        self._idle = None
+        self._waiting = 0
+
+    async def render(self, text: str) -> str:
+        """Renders the given text in a worker and returns the output.
+
+        :param str text: the input text
+        :raises DocumentTooLarge: if the text is larger than the size limit
+        :raises Overloaded: if too many renders are waiting for a worker
+        :raises asyncio.TimeoutError: if the render takes longer than the timeout
+        :raises modgrammar.ParseError: if the text is no valid markdown
+        :raises LimitExceeded: if the render exceeds the limits
+        """
+        if len(text) > self.max_size:
+            raise DocumentTooLarge("the text has {} characters, at most {} are allowed".format(len(text),
+                                                                                              self.max_size))
+        if self._idle is None:
+            self._start()
+        if self._idle.empty() and self._waiting >= self.max_waiting:
+            raise Overloaded("{} renders are waiting for a worker".format(self._waiting))
+
+        self._waiting += 1
+        try:
+            worker = await self._idle.get()
+        finally:
+            self._waiting -= 1
+
+        if self.processes:
+            future = worker.submit(_render_in_process, self.output_format, self.engine, self.budget, self.limits, text)
+        else:
+            future = self._threads.submit(self._renderer.render, text)
+        waiter = asyncio.wrap_future(future)
+        try:
+            result = await asyncio.wait_for(asyncio.shield(waiter), self.timeout)
+        except asyncio.TimeoutError:
+            # nobody waits for the result anymore
+            waiter.add_done_callback(_retrieve)
+            if self.processes:
+                _kill(worker)
+                self._idle.put_nowait(ProcessPoolExecutor(max_workers=1))
+            else:
+                # the thread can't be stopped, its worker is free again when the render ends
+                idle = self._idle
+                waiter.add_done_callback(lambda _waiter: idle.put_nowait(worker))
+            raise
+        except BaseException:
+            self._idle.put_nowait(worker)
+            raise
+        self._idle.put_nowait(worker)
+
+        if self.processes:
+            output, error = result
+            if error is not None:
+                pos, char, line, col, message = error
+                from .grammars import MarkdownGrammar
+                raise modgrammar.ParseError(MarkdownGrammar, text, pos, char, line=line, col=col, message=message)
+            return output
+        return result
+
+    def close(self):
+        """Stops the workers. Running renders in processes are killed."""
+        if self._idle is None:
+            return
+        if self._threads is not None:
+            self._threads.shutdown(wait=False)
+        while not self._idle.empty():
+            worker = self._idle.get_nowait()
+            if worker is not None:
+                _kill(worker)
+        self._idle = None
+
+    def _start(self):
+        """Starts the workers and fills the queue of idle workers."""
+        self._idle = asyncio.Queue()
+        if self.processes:
+            for _index in range(self.workers):
+                self._idle.put_nowait(ProcessPoolExecutor(max_workers=1))
+        else:
+            self._threads = ThreadPoolExecutor(max_workers=self.workers)
+            for _index in range(self.workers):
+                self._idle.put_nowait(None)
+
+
+def _render_in_process(output_format: str, engine: str, budget: float, limits: Limits, text: str) -> tuple:
+    """Renders the text in a worker process and returns a tuple (output, error) of which one is None.
+
+    A parse error can't be pickled, so its position and message are returned instead. A LimitExceeded is raised
+    in the service as it is. Every worker process keeps one renderer for all of its texts.
+
+    :param str output_format: the output format
+    :param str engine: the parser engine
+    :param float budget: the grammar steps per character for guarded mode or None
+    :param Limits limits: the limits of a render or None
+    :param str text: the input text
+    """
+    global _process_renderer
+    if _process_renderer is None or (_process_renderer.output_format, _process_renderer.engine,
+                                     _process_renderer.budget, _process_renderer.limits) != (output_format, engine,
+                                                                                             budget, limits):
+        _process_renderer = Renderer(output_format, engine, budget=budget, limits=limits)
+    try:
+        return _process_renderer.render(text), None
+    except modgrammar.ParseError as pe:
+        return None, (pe.buffer_pos, pe.char, pe.line, pe.col, pe.message)
+
+
+def _retrieve(future: asyncio.Future):
+    """Retrieves the exception of a future that nobody waits for, so that it isn't logged as never retrieved.
+
+    :param asyncio.Future future: the future
+    """
+    if not future.cancelled():
+        future.exception()
+
+
+def _kill(executor: ProcessPoolExecutor):
+    """Kills the process of a worker and shuts the executor down.
+
+    :param ProcessPoolExecutor executor: the executor of the worker
+    """
+    # the executor has no public way to stop a running task
+    for process in list(getattr(executor, "_processes", {}).values()):
+        process.terminate()
+    executor.shutdown(wait=False)
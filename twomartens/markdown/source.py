@@ -0,0 +1,138 @@
+# coding=utf-8
+
+#   Copyright 2017 Jim Martens
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""markdown.source: provides the lines of large inputs from files, bytes and memory maps
+
+The input is decoded block by block and cut into lines, which the streaming render (Renderer.render_iter) reads one
+by one. Therefore only the block that is being worked on is decoded and held in memory.
+"""
+import codecs
+import io
+import mmap
+import os
+import re
+
+BLOCK_SIZE = 1024 * 1024
+
+_PIECE = re.compile("[^\n\r]*(?:\r\n|\n|\r)?")
+
+
+def read_lines(path: str, encoding: str = "utf-8", errors: str = "strict", newline: str = None):
+    """Reads the file at the given path and yields its lines.
+
+    Regular files are memory-mapped and the pages that were read are released again where the platform allows it.
+    Other files (e.g. pipes) are read block by block. The file is closed when all lines were read or the generator
+    is closed.
+
+    :param str path: the path of the file
+    :param str encoding: the encoding of the file
+    :param str errors: the handling of decoding errors (as for bytes.decode)
+    :param str newline: None to translate line breaks into \\n as text files do, "" to keep them
+    """
+    with open(path, "rb") as file:
+        yield from file_lines(file, encoding, errors, newline)
+
+
+def file_lines(file, encoding: str = "utf-8", errors: str = "strict", newline: str = None):
+    """Yields the lines of the given binary file object (e.g. sys.stdin.buffer) from its current position.
+
+    :param file: the binary file object
+    :param str encoding: the encoding of the file
+    :param str errors: the handling of decoding errors (as for bytes.decode)
+    :param str newline: None to translate line breaks into \\n as text files do, "" to keep them
+    """
+    yield from decode_lines(_file_blocks(file), encoding, errors, newline)
+
+
+def buffer_lines(buffer, encoding: str = "utf-8", errors: str = "strict", newline: str = None):
+    """Yields the lines of the given bytes, bytearray, memoryview or memory map.
+
+    :param buffer: the buffer
+    :param str encoding: the encoding of the buffer
+    :param str errors: the handling of decoding errors (as for bytes.decode)
+    :param str newline: None to translate line breaks into \\n as text files do, "" to keep them
+    """
+    view = memoryview(buffer)
+    blocks = (view[start:start + BLOCK_SIZE] for start in range(0, len(view), BLOCK_SIZE))
+    yield from decode_lines(blocks, encoding, errors, newline)
+
+
+def decode_lines(blocks, encoding: str = "utf-8", errors: str = "strict", newline: str = None):
+    """Decodes the given blocks of bytes and yields the lines of the text.
+
+    Characters and line breaks may span blocks. The last line is yielded without line break if the text doesn't end
+    with one.
+
+    :param blocks: an iterable of bytes-like blocks
+    :param str encoding: the encoding of the blocks
+    :param str errors: the handling of decoding errors (as for bytes.decode)
+    :param str newline: None to translate line breaks into \\n as text files do, "" to keep them
+    """
+    decoder = codecs.getincrementaldecoder(encoding)(errors)
+    rest = ""
+    for block in blocks:
+        text = rest + decoder.decode(block)
+        # the last line may continue in the next block and a \r may be followed by a \n
+        end = max(text.rfind("\n"), text.rfind("\r", 0, len(text) - 1)) + 1
+        rest = text[end:]
+        yield from _lines(text[:end], newline)
+    yield from _lines(rest + decoder.decode(b"", True), newline)
+
+
+def _lines(text: str, newline: str):
+    """Yields the lines of the given text.
+
+    :param str text: the text
+    :param str newline: None to translate line breaks into \\n, "" to keep them
+    """
+    for match in _PIECE.finditer(text):
+        line = match.group()
+        if not line:
+            continue
+        if newline is None and line[-1] == "\r":
+            line = line[:-1] + "\n"
+        elif newline is None and line.endswith("\r\n"):
+            line = line[:-2] + "\n"
+        yield line
+
+
+def _file_blocks(file):
+    """Yields the content of the given binary file block by block, memory-mapping regular files.
+
+    :param file: the binary file object
+    """
+    try:
+        position = file.tell()
+        size = os.fstat(file.fileno()).st_size
+        buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) if size > position else None
+    except (OSError, ValueError, io.UnsupportedOperation):
+        buffer = None
+    if buffer is None:
+        block = file.read(BLOCK_SIZE)
+        while block:
+            yield block
+            block = file.read(BLOCK_SIZE)
+        return
+
+    end = len(buffer)
+    with buffer:
+        for start in range(position, end, BLOCK_SIZE):
+            yield buffer[start:start + BLOCK_SIZE]
+            if hasattr(buffer, "madvise"):
+                # the pages were copied into the block, so the memory of the mapping can be released
+                page = start - start % mmap.PAGESIZE
+                buffer.madvise(mmap.MADV_DONTNEED, page, min(start + BLOCK_SIZE, end) - page)
+    file.seek(end)
@@ -15,158 +15,512 @@
 #   limitations under the License.
 
 """markdown.compiler: provides compiling functionality"""
+import html
+import json
 import os
 from string import Template
 
-import modgrammar
-
-from .grammars import Heading
+from .nodes import CodeBlock, Document, Heading
 
 TAB_SEP = "    "
+# the number of characters of a code block that are escaped at once
+CODE_CHUNK = 64 * 1024
+
+BACKENDS = {}
+
+
+class Backend:
+    """Base class of the transform backends. A backend builds the output of one format block by block.
+
+    The output of a document consists of the output of its blocks, joined by the separator, between the head and
+    the tail returned by wrap. A backend keeps no state, so one backend serves all documents and threads.
+    """
+    name = None
+    extension = None
+    media_type = "text/plain"
+    skeleton = None
+    separator = "\n"
+    titled = False
+
+    def build(self, fragments: list, block):
+        """Builds the output of the given block and appends it to the fragments.
+
+        :param list fragments: the list of output fragments
+        :param block: the block node
+        """
+        raise NotImplementedError
+
+    def wrap(self, title: str, template: Template) -> tuple:
+        """Returns the head and the tail of the output, which are placed before and after the blocks.
+
+        By default the output ends with a line break.
+
+        :param str title: the text of the first heading or an empty string (only given if titled is True)
+        :param Template template: the skeleton template or None if the backend has no skeleton
+        """
+        return "", "\n"
+
+
+class HtmlFragmentBackend(Backend):
+    """Builds the HTML of the blocks without the page around them, e.g. to embed them into another page."""
+    name = "fragment"
+    extension = "html"
+    media_type = "text/html"
+
+    def build(self, fragments: list, block):
+        """Builds the HTML of the block.
+
+        :param list fragments: the list of output fragments
+        :param block: the block node
+        """
+        _html_build_node(fragments, block)
+
+
+class HtmlBackend(HtmlFragmentBackend):
+    """Builds a complete HTML page from the skeleton. The first heading is used for the title element."""
+    name = "html"
+    skeleton = "html"
+    titled = True
+
+    def wrap(self, title: str, template: Template) -> tuple:
+        """Returns the parts of the skeleton before and after the content.
+
+        :param str title: the title of the page
+        :param Template template: the HTML skeleton
+        """
+        return _html_skeleton(template, title)
+
+
+class TextBackend(Backend):
+    """Builds plain text without markup, e.g. for a search index. The blocks are separated by an empty line."""
+    name = "text"
+    extension = "txt"
+    separator = "\n\n"
+
+    def build(self, fragments: list, block):
+        """Builds the text of the block.
+
+        :param list fragments: the list of output fragments
+        :param block: the block node
+        """
+        _text_build_node(fragments, block)
+
+
+class JsonBackend(Backend):
+    """Builds the document tree as JSON, e.g. for caches and clients. nodes.from_json restores the tree.
+
+    Every node is an object with its type (the lowercase class name) and its attributes. The children of a node are
+    lists of such objects.
+    """
+    name = "json"
+    extension = "json"
+    media_type = "application/json"
+    separator = ", "
+
+    def build(self, fragments: list, block):
+        """Builds the JSON object of the block.
+
+        :param list fragments: the list of output fragments
+        :param block: the block node
+        """
+        fragments.append(json.dumps(_json_node(block), ensure_ascii=False))
+
+    def wrap(self, title: str, template: Template) -> tuple:
+        """Returns the parts of the document object before and after the blocks.
+
+        :param str title: not used
+        :param Template template: not used
+        """
+        return '{"type": "document", "blocks": [', "]}\n"
+
+
+def register_backend(backend: Backend) -> Backend:
+    """Registers the backend for its output format, replacing a backend that was registered for it before.
+
+    :param Backend backend: the backend
+    """
+    BACKENDS[backend.name] = backend
+    return backend
+
+
+def get_backend(output_format: str) -> Backend:
+    """Returns the backend for the given output format.
+
+    :param str output_format: the output format
+    :raises ValueError: if no backend is registered for the output format
+    """
+    backend = BACKENDS.get(output_format)
+    if backend is None:
+        raise ValueError("unknown output format: {} (known are {})".format(output_format, ", ".join(sorted(BACKENDS))))
+    return backend
 
 
-def transform(structure: modgrammar.Grammar, output_format: str) -> str:
+def transform(structure: Document, output_format: str, template: Template = None) -> str:
     """Transforms the given structure into the given output format.
 
-    :param modgrammar.Grammar structure: 
+    :param Document structure: the parsed document
+    :param str output_format: the output format
+    :param Template template: the template for the output, it is loaded from the templates directory if not given
+    """
+    backend = get_backend(output_format)
+    template = template if template is not None else load_template(output_format)
+    head, tail = backend.wrap(_title(structure) if backend.titled else "", template)
+    return head + transform_body(structure, output_format) + tail
+
+
+def transform_body(structure: Document, output_format: str) -> str:
+    """Transforms the blocks of the given structure into the given output format without the skeleton.
+
+    :param Document structure: the parsed document
     :param str output_format: the output format
     """
-    return globals().get("_" + output_format + "_transform")(structure)
+    backend = get_backend(output_format)
+    # the fragments are collected in one list and joined once at the end
+    fragments = []
+    for index, block in enumerate(structure.blocks):
+        if index:
+            fragments.append(backend.separator)
+        backend.build(fragments, block)
+    return "".join(fragments)
+
+
+def render_many(structure: Document, output_formats: list, templates: map = None) -> map:
+    """Transforms the given structure into several output formats at once and returns a map of format to output.
 
+    The document is walked once and every block is passed to the backends of all formats.
 
-def _html_transform(structure: modgrammar.Grammar) -> str:
-    """Transforms the given structure into HTML and returns the finished output.
-    
-    The first heading in the markdown text will be used for the HTML title element.
-    
-    :param modgrammar.Grammar structure: the structure which is transformed
+    :param Document structure: the parsed document
+    :param list output_formats: the output formats
+    :param map templates: the templates by output format, the missing ones are loaded from the templates directory
     """
-    replacements = {"unordered_list": "ul", "quote": "blockquote", "ordered_list": "ol"}
-    elements = _extract_elements(structure, replacements)
+    backends = [get_backend(output_format) for output_format in output_formats]
+    outputs = [[] for _backend in backends]
+    title = ""
+    titled = False
+    for index, block in enumerate(structure.blocks):
+        if not titled and type(block) is Heading:
+            title = block.text
+            titled = True
+        for backend, fragments in zip(backends, outputs):
+            if index:
+                fragments.append(backend.separator)
+            backend.build(fragments, block)
+
+    results = {}
+    for output_format, backend, fragments in zip(output_formats, backends, outputs):
+        template = templates.get(output_format) if templates is not None else None
+        template = template if template is not None else load_template(output_format)
+        head, tail = backend.wrap(title, template)
+        results[output_format] = head + "".join(fragments) + tail
+    return results
+
+
+def transform_iter(structures, output_format: str, template: Template = None):
+    """Transforms the given structures into the given output format and yields the output piece by piece.
+
+    The structures are the documents of consecutive parts of one text. The output is the same as the output of
+    transform for the whole text. If the head of the output needs the title, the blocks before the first heading
+    are held back until it is found.
+
+    :param structures: an iterable of documents
+    :param str output_format: the output format
+    :param Template template: the template for the output, it is loaded from the templates directory if not given
+    """
+    backend = get_backend(output_format)
+    template = template if template is not None else load_template(output_format)
+    head = tail = None
+    if not backend.titled:
+        head, tail = backend.wrap("", template)
+        yield head
+    held_back = []
+    first = True
+    for structure in structures:
+        if head is None:
+            heading = structure.find(Heading)
+            if heading is not None:
+                head, tail = backend.wrap(heading.text, template)
+                yield head
+                yield from held_back
+                held_back = None
+        for block in structure.blocks:
+            fragments = [] if first else [backend.separator]
+            first = False
+            backend.build(fragments, block)
+            if head is None:
+                held_back.append("".join(fragments))
+            elif type(block) is CodeBlock:
+                # the code is not joined into one more copy
+                yield from fragments
+            else:
+                yield "".join(fragments)
+
+    if head is None:
+        # a text without heading gets an empty title
+        head, tail = backend.wrap("", template)
+        yield head
+        yield from held_back
+    yield tail
+
 
+def transform_block(block, output_format: str) -> str:
+    """Transforms a single block of a document into the given output format.
+
+    The output of a document consists of the output of its blocks, so a changed block can be replaced on its own.
+
+    :param block: the block node
+    :param str output_format: the output format
+    """
+    fragments = []
+    get_backend(output_format).build(fragments, block)
+    return "".join(fragments)
+
+
+def load_template(output_format: str) -> Template:
+    """Loads the skeleton template for the given output format and returns it or None if the format has none.
+
+    :param str output_format: the output format
+    """
+    skeleton = get_backend(output_format).skeleton
+    if skeleton is None:
+        return None
     script_dir = os.path.dirname(__file__)
-    filename = "templates/skeleton.html"
+    filename = "templates/skeleton." + skeleton
     with open(os.path.join(script_dir, filename)) as file:
-        html = file.read()
+        return Template(file.read())
 
-    template = Template(html)
-    content = ""
+
+def _title(structure: Document) -> str:
+    """Returns the text of the first heading of the structure or an empty string if it has none.
+
+    :param Document structure: the document
+    """
     heading = structure.find(Heading)
-    title = heading.text
-
-    for tag, text, children, attributes, options in elements:
-        if content != "":
-            content = content + "\n"
-        content = content + _html_build_block(tag, children, text, attributes, options)
-
-    output = template.substitute(title=title, content=content)
-    return output
-
-
-def _html_build_block(tag: str, elements: list, text: str = None, attributes: map = None, options: map = None,
-                      nesting: int = 1) -> str:
-    """Builds an HTML block element and returns the HTML output.
-    
-    Level 1 elements are indented by four spaces. Level 2 elements are indented by 8 spaces and so on.
-    Level 1 elements with children get their tags on a separate line. The tags of level 2 (or higher) elements are on
-    the same line with the rest of the content.
-    
-    Parameters
-    ----------
-    :param str tag: the HTML tag for this block element
-    :param list elements: a list of all the child elements
-    :param str text: the text of the block element between the HTML tags if available
-    :param map attributes: a map of all attributes of this block element
-    :param map options: a map of options for this block element
-    :param int nesting: the level this block is on (e.g. direct child of body element is on level 1)
-    """
-    attributes = attributes if attributes is not None else {}
-    default_options = {"indentation": True, "onlyOuterLinebreaks": False}
-    options = {**default_options, **options} if options is not None else default_options
-    content = (nesting * TAB_SEP) + "<" + tag + _html_build_attributes(attributes) + ">"
-    inserted_linebreaks = 0
-    inserted_indents = 0
-    if len(elements) == 0 and text is not None:
-        content = content + text
-    for _tag, _text, _children, _attributes, _options in elements:
-        _options = {**default_options, **_options} if _options is not None else default_options
-        if nesting == 1 and options["indentation"] and ((options["onlyOuterLinebreaks"] and inserted_linebreaks == 0)
-                                                        or (not options["onlyOuterLinebreaks"])):
-            content = content + "\n"
-            inserted_linebreaks += 1
-        if _text is not None and len(_children) == 0:
-            indent = ((nesting + 1) * TAB_SEP)
-            if (nesting == 1 and options["indentation"]
-                and (not options["onlyOuterLinebreaks"]
-                     or (options["onlyOuterLinebreaks"] and inserted_indents == 0))):
-                content += indent
-                inserted_indents += 1
-            content += _html_build_item(_tag, _text, _attributes, _tag != "text")
-        else:
-            content = content + _html_build_block(_tag, _children, _text, _attributes, _options, nesting + 1)
-    if nesting == 1 and len(elements) and options["indentation"]:
-        content = content + "\n" + (nesting * TAB_SEP)
-    content = content + "</" + tag + ">"
-    return content
-
-
-def _html_build_item(tag: str, text: str, attributes: map = None, include_tags=True) -> str:
-    """Builds an HTML inline element and returns the HTML output.
-    
+    return heading.text if heading is not None else ""
+
+
+def _html_skeleton(template: Template, title: str) -> tuple:
+    """Returns the parts of the HTML skeleton before and after the content.
+
+    :param Template template: the HTML skeleton
+    :param str title: the title of the document
+    """
+    marker = "\0content\0"
+    head, tail = template.substitute(title=title, content=marker).split(marker, 1)
+    return head, tail
+
+
+def _html_build_node(fragments: list, node):
+    """Builds the HTML output for the given node and appends it to the fragments.
+
+    Blocks are direct children of the body element and indented by four spaces. Paragraphs, quotes and lists get
+    their tags on a separate line and their content is indented by 8 spaces. The list items are on one line each.
+
+    :param list fragments: the list of output fragments
+    :param node: the block or inline node
+    """
+    globals().get("_html_build_" + type(node).__name__.lower())(fragments, node)
+
+
+def _html_build_heading(fragments: list, heading):
+    """Builds an HTML heading.
+
+    :param list fragments: the list of output fragments
+    :param Heading heading: the heading node
+    """
+    tag = "h" + str(heading.level)
+    if heading.anchor is None:
+        fragments.append(TAB_SEP + "<" + tag + ">" + heading.text + "</" + tag + ">")
+        return
+    fragments.append(TAB_SEP + "<" + tag)
+    _html_build_attributes(fragments, {"id": heading.anchor})
+    fragments.append(">" + heading.text + "</" + tag + ">")
+
+
+def _html_build_paragraph(fragments: list, paragraph):
+    """Builds an HTML paragraph.
+
+    :param list fragments: the list of output fragments
+    :param Paragraph paragraph: the paragraph node
+    """
+    _html_build_container(fragments, "p", paragraph.children)
+
+
+def _html_build_quote(fragments: list, quote):
+    """Builds an HTML block quote.
+
+    :param list fragments: the list of output fragments
+    :param Quote quote: the quote node
+    """
+    _html_build_container(fragments, "blockquote", quote.children)
+
+
+def _html_build_container(fragments: list, tag: str, children: list):
+    """Builds a block element whose inline content is on one indented line between the tags.
+
+    :param list fragments: the list of output fragments
     :param str tag: the HTML tag
-    :param str text: the text between the HTML tags
-    :param map attributes: map of attributes
-    :param bool include_tags: True if the tags should be part of the output
+    :param list children: the inline nodes
     """
-    attributes = attributes if attributes is not None else {}
-    opening_tag = "<" + tag + _html_build_attributes(attributes) + ">"
-    closing_tag = "</" + tag + ">"
-    if include_tags:
-        return opening_tag + text + closing_tag
-    else:
-        return text
+    fragments.append(TAB_SEP + "<" + tag + ">\n" + 2 * TAB_SEP)
+    for child in children:
+        _html_build_node(fragments, child)
+    fragments.append("\n" + TAB_SEP + "</" + tag + ">")
+
 
+def _html_build_list(fragments: list, block):
+    """Builds an HTML list with one line per list item.
 
-def _html_build_attributes(attributes: map) -> str:
-    """Builds the attributes and returns the HTML output.
+    :param list fragments: the list of output fragments
+    :param List block: the list node
+    """
+    tag = "ol" if block.ordered else "ul"
+    fragments.append(TAB_SEP + "<" + tag + ">")
+    for item in block.items:
+        fragments.append("\n" + 2 * TAB_SEP + "<li>")
+        for child in item.children:
+            _html_build_node(fragments, child)
+        fragments.append("</li>")
+    fragments.append("\n" + TAB_SEP + "</" + tag + ">")
+
+
+def _html_build_codeblock(fragments: list, code_block):
+    """Builds an HTML pre block. The code is escaped and not indented.
+
+    Long code is escaped in pieces of CODE_CHUNK characters, which are appended one by one.
+
+    :param list fragments: the list of output fragments
+    :param CodeBlock code_block: the code block node
+    """
+    text = code_block.text
+    if len(text) <= CODE_CHUNK:
+        fragments.append(TAB_SEP + "<pre><code>" + html.escape(text) + "</code></pre>")
+        return
+    fragments.append(TAB_SEP + "<pre><code>")
+    fragments.extend(html.escape(text[start:start + CODE_CHUNK]) for start in range(0, len(text), CODE_CHUNK))
+    fragments.append("</code></pre>")
+
+
+def _html_build_text(fragments: list, text):
+    """Appends plain text to the fragments.
+
+    :param list fragments: the list of output fragments
+    :param Text text: the text node
+    """
+    fragments.append(text.text)
+
+
+def _html_build_strong(fragments: list, strong):
+    """Builds bold text.
+
+    :param list fragments: the list of output fragments
+    :param Strong strong: the strong node
+    """
+    fragments.append("<b>" + strong.text + "</b>")
+
+
+def _html_build_emphasis(fragments: list, emphasis):
+    """Builds italic text.
+
+    :param list fragments: the list of output fragments
+    :param Emphasis emphasis: the emphasis node
+    """
+    fragments.append("<i>" + emphasis.text + "</i>")
 
+
+def _html_build_code(fragments: list, code):
+    """Builds an escaped inline code segment.
+
+    :param list fragments: the list of output fragments
+    :param Code code: the code node
+    """
+    fragments.append("<code>" + html.escape(code.text) + "</code>")
+
+
+def _html_build_link(fragments: list, link):
+    """Builds a link with its attributes.
+
+    :param list fragments: the list of output fragments
+    :param Link link: the link node
+    """
+    attributes = {"href": link.href}
+    if link.title is not None:
+        attributes["title"] = link.title
+    fragments.append("<a")
+    _html_build_attributes(fragments, attributes)
+    fragments.append(">" + link.text + "</a>")
+
+
+def _html_build_attributes(fragments: list, attributes: map):
+    """Builds the attributes and appends the HTML output, including the leading space, to the fragments.
+
+    :param list fragments: the list of output fragments
     :param map attributes: map of attributes 
     """
-    result = ""
     for name in attributes:
-        if result != "":
-            result += " "
-        result += name + '="' + attributes[name] + '"'
-
-    if result != "":
-        result = " " + result
-
-    return result
-
-
-def _extract_elements(structure: modgrammar.Grammar, replacements: map = None) -> list:
-    """Extracts the relevant data for all elements in the given structure and returns it in a list.
-    
-    This data includes the tag, text, children, attributes and options.
-    
-    :param modgrammar.Grammar structure: the structure from which the elements are extracted
-    :param map replacements: an optional map of replacements for found tags 
-    """
-    elements = []
-
-    for elem in structure.elements:
-        tag = elem.tag if hasattr(elem, "tag") else None
-        text = elem.text if hasattr(elem, "text") else None
-        children = []
-        attributes = elem.attributes if hasattr(elem, "attributes") else {}
-        options = elem.options if hasattr(elem, "options") else {}
-        if replacements is not None and tag is not None:
-            tag = replacements[tag] if tag in replacements else tag
-        if (tag is None or text is None) and hasattr(elem, "elements") and len(elem.elements):
-            children = _extract_elements(elem)
-        if tag is not None:
-            elements.append((tag, text, children, attributes, options))
-        elif len(children):
-            elements = elements + children
-
-    return elements
+        fragments.append(" " + name + '="' + attributes[name] + '"')
+
+
+def _text_build_node(fragments: list, node):
+    """Builds the plain text for the given node and appends it to the fragments.
+
+    :param list fragments: the list of output fragments
+    :param node: the block or inline node
+    """
+    globals().get("_text_build_" + type(node).__name__.lower(), _text_build_inline)(fragments, node)
+
+
+def _text_build_paragraph(fragments: list, paragraph):
+    """Builds the text of a paragraph on one line.
+
+    :param list fragments: the list of output fragments
+    :param Paragraph paragraph: the paragraph node
+    """
+    fragments.extend(child.text for child in paragraph.children)
+
+
+def _text_build_quote(fragments: list, quote):
+    """Builds the text of a quote on one line.
+
+    :param list fragments: the list of output fragments
+    :param Quote quote: the quote node
+    """
+    fragments.extend(child.text for child in quote.children)
+
+
+def _text_build_list(fragments: list, block):
+    """Builds the text of a list with one line per list item.
+
+    :param list fragments: the list of output fragments
+    :param List block: the list node
+    """
+    for index, item in enumerate(block.items):
+        if index:
+            fragments.append("\n")
+        fragments.extend(child.text for child in item.children)
+
+
+def _text_build_inline(fragments: list, node):
+    """Appends the text of a heading, a code block or an inline node to the fragments.
+
+    :param list fragments: the list of output fragments
+    :param node: the node
+    """
+    fragments.append(node.text)
+
+
+def _json_node(node) -> map:
+    """Returns the node and its children as objects for JSON.
+
+    :param node: the node
+    """
+    data = {"type": type(node).__name__.lower()}
+    for name in node.__slots__:
+        value = getattr(node, name)
+        data[name] = [_json_node(child) for child in value] if isinstance(value, list) else value
+    return data
+
+
+register_backend(HtmlFragmentBackend())
+register_backend(HtmlBackend())
+register_backend(TextBackend())
+register_backend(JsonBackend())
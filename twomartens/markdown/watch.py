@@ -0,0 +1,124 @@
+# coding=utf-8
+
+#   Copyright 2017 Jim Martens
+#
+#   Licensed under the Apache License, Version 2.0 (the "License");
+#   you may not use this file except in compliance with the License.
+#   You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+#   Unless required by applicable law or agreed to in writing, software
+#   distributed under the License is distributed on an "AS IS" BASIS,
+#   WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#   See the License for the specific language governing permissions and
+#   limitations under the License.
+
+"""markdown.watch: provides rendering of markdown files whenever they change"""
+import os
+import sys
+import time
+
+import modgrammar
+
+from .batch import collect, is_up_to_date, write_atomically
+from .renderer import Renderer
+
+
+class Watcher:
+    """Polls the modification times of markdown files and renders the files that changed.
+
+    The watcher keeps one renderer for all renders, so the grammar is built once. Given a renderer with a block cache,
+    only the chunks of a file that changed since its last render are parsed again. The outputs are written atomically,
+    so a reader never sees a half-written file.
+    """
+
+    def __init__(self, inputs: list, output: str, renderer: Renderer, batch: bool = False, encoding: str = "utf-8",
+                 out=sys.stdout):
+        """Initializes the watcher. Nothing is rendered before the first poll.
+
+        :param list inputs: the input file or, in batch mode, the files, directories and globs
+        :param str output: the output file or, in batch mode, the output directory
+        :param Renderer renderer: the renderer
+        :param bool batch: True if the inputs are collected like in batch mode
+        :param str encoding: the encoding of the inputs
+        :param out: the stream for the messages
+        """
+        self.inputs = inputs
+        self.output = output
+        self.renderer = renderer
+        self.batch = batch
+        self.encoding = encoding
+        self.out = out
+        self._states = None
+
+    def poll(self) -> int:
+        """Renders the files that changed since the last poll and returns the number of rendered files.
+
+        On the first poll every file whose output is missing or older than the file is rendered. Files are searched
+        again on every poll, so new files in watched directories are found.
+        """
+        if self.batch:
+            files = collect(self.inputs, self.output, self.renderer.output_format)
+        else:
+            files = [(self.inputs[0], self.output)]
+        first = self._states is None
+        states = {}
+        rendered = 0
+        for source, target in files:
+            try:
+                state = _state(os.stat(source))
+            except OSError:
+                # the file was removed or is being replaced
+                continue
+            states[source] = state
+            if first and is_up_to_date(source, target):
+                continue
+            if not first and self._states.get(source) == state:
+                continue
+            self._render(source, target)
+            rendered += 1
+        self._states = states
+        return rendered
+
+    def run(self, interval: float = 0.2):
+        """Polls the files until the program is interrupted.
+
+        :param float interval: the seconds between two polls
+        """
+        print("Watching for changes, press Ctrl-C to stop.", file=self.out)
+        try:
+            while True:
+                self.poll()
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            pass
+
+    def _render(self, source: str, target: str):
+        """Renders one file and prints the time needed or the error.
+
+        :param str source: the path of the source
+        :param str target: the path of the target
+        """
+        start = time.perf_counter()
+        try:
+            with open(source, encoding=self.encoding) as file:
+                markdown = file.read()
+            write_atomically(target, self.renderer.render(markdown))
+        except modgrammar.ParseError as pe:
+            print("{}: {}".format(source, pe), file=self.out)
+        except (OSError, UnicodeError) as error:
+            print("{}: {}: {}".format(source, type(error).__name__, error), file=self.out)
+        else:
+            print("Rendered {} in {:.1f} ms.".format(source, (time.perf_counter() - start) * 1000), file=self.out)
+        self.out.flush()
+
+
+def _state(status: os.stat_result) -> tuple:
+    """Returns what tells whether a file changed: its modification time, size and inode.
+
+    Editors that save by renaming a new file change the inode.
+
+    :param os.stat_result status: the status of the file
+    """
+    return status.st_mtime_ns, status.st_size, status.st_ino